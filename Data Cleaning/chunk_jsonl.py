@@ -4,12 +4,15 @@ import re
 import hashlib
 import logging
 from pathlib import Path
+from collections import deque
 from functools import lru_cache
 from concurrent.futures import ProcessPoolExecutor
 import multiprocessing
 from tqdm import tqdm
 from transformers import AutoTokenizer
 
+from dedup_index import DedupIndex
+
 # ====== CONFIGURATION ======
 class ChunkingConfig:
     MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
@@ -21,6 +24,15 @@ class ChunkingConfig:
     MIN_TOKENS_PER_CHUNK = 50
     MIN_CHAR_LENGTH = 100
     
+    # Corpus-wide dedup: MinHash near-duplicate detection on top of exact chunk_hash matches
+    NEAR_DUPLICATE_DETECTION = False
+    NEAR_DUPLICATE_THRESHOLD = 0.9      # estimated Jaccard similarity of word 5-gram shingles
+    
+    # Parallelism: records per worker task, and tasks kept in flight ahead of the writer
+    SHARD_RECORDS = 256
+    MAX_PENDING_SHARDS = 2 * (os.cpu_count() or 1)
+    CHECKPOINT_LINES = 1000             # input lines between durable checkpoints
+    
     BOILERPLATE_PATTERNS = [
         r"national building code.*",
         r"government of india.*",
@@ -46,19 +58,22 @@ config = ChunkingConfig()
 BASE_DIR = Path(__file__).resolve().parent
 CLEANED_DIR = BASE_DIR.parent / "cleaned"
 OUT_DIR = BASE_DIR.parent / "chunks"
-OUT_DIR.mkdir(exist_ok=True)
+DEDUP_INDEX_PATH = OUT_DIR / "dedup_index.sqlite3"
 
 # ====== LOGGING ======
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(BASE_DIR / 'chunking.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging():
+    """Log to chunking.log and the console; only when run as a script, so importing has no side effects."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(BASE_DIR / 'chunking.log'),
+            logging.StreamHandler()
+        ]
+    )
+
 # ====== TOKENIZER ======
 try:
     tokenizer = AutoTokenizer.from_pretrained(config.MODEL_NAME)
@@ -141,13 +156,28 @@ def decode(ids):
         logger.warning(f"Decoding error: {e}")
         return ""
 
-def is_quality_chunk(chunk: str) -> bool:
+def window_bounds(n_tokens, window=config.ALLOWED_TOKENS, overlap=config.OVERLAP):
+    """Yield (start, end) token index pairs of the same windows sliding_windows produces."""
+    if window <= 0:
+        raise ValueError("window must be > 0")
+    
+    i = 0
+    while i < n_tokens:
+        j = min(i + window, n_tokens)
+        yield i, j
+        if j >= n_tokens:
+            break
+        i = max(0, j - overlap)
+
+def is_quality_chunk(chunk: str, token_count: int = None) -> bool:
     """Check if chunk meets quality standards."""
     if not chunk or not isinstance(chunk, str):
         return False
     
-    # Token length check
-    if cached_token_len(chunk) < config.MIN_TOKENS_PER_CHUNK:
+    # Token length check (callers that sliced by token offsets already know the count)
+    if token_count is None:
+        token_count = cached_token_len(chunk)
+    if token_count < config.MIN_TOKENS_PER_CHUNK:
         return False
     
     # Character length check
@@ -169,184 +199,317 @@ def is_quality_chunk(chunk: str) -> bool:
     
     return True
 
-def chunk_text_no_truncation(text: str):
+def chunk_texts_batch(texts):
     """
-    Split arbitrarily long text into multiple <= ALLOWED_TOKENS chunks.
+    Split many texts into <= ALLOWED_TOKENS chunks with one batched tokenizer call.
+
+    Windows are cut from the original text using the fast tokenizer's offset mapping,
+    so chunks are never decoded or re-tokenized: each window's token count is known.
+    Unlike decoding (which lowercases with an uncased tokenizer), chunks keep the
+    source casing, so their chunk_hash differs from older chunk files.
+    Returns one list of chunk strings per input text.
     """
-    if not text or is_boilerplate(text):
-        return
-    
+    if not texts:
+        return []
+    if not tokenizer.is_fast:
+        return [list(_chunk_text_slow(text)) for text in texts]
+
+    try:
+        encoded = tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False
+        )
+    except Exception as e:
+        logger.warning(f"Batch tokenization error: {e}")
+        return [list(_chunk_text_slow(text)) for text in texts]
+
+    results = []
+    for text, offsets in zip(texts, encoded["offset_mapping"]):
+        chunks = []
+        for start, end in window_bounds(len(offsets)):
+            chunk = text[offsets[start][0]:offsets[end - 1][1]].strip()
+            if chunk and is_quality_chunk(chunk, token_count=end - start):
+                chunks.append(chunk)
+        results.append(chunks)
+    return results
+
+def _chunk_text_slow(text: str):
+    """Decode-based chunking for tokenizers without offset mappings."""
     ids = safe_tokenize(text)
-    if not ids:
-        return
-    
     for slice_ids in sliding_windows(ids, window=config.ALLOWED_TOKENS, overlap=config.OVERLAP):
         chunk = decode(slice_ids)
         if chunk and is_quality_chunk(chunk):
             yield chunk
 
-# ====== PROCESSING FUNCTIONS ======
-def process_record(rec, seen_hashes):
-    """Process a single record and yield valid chunks."""
-    if not rec or not isinstance(rec, dict):
-        return
-    
-    text = clean_boilerplate(rec.get("text", ""))
+def chunk_text_no_truncation(text: str):
+    """
+    Split arbitrarily long text into multiple <= ALLOWED_TOKENS chunks.
+    """
     if not text or is_boilerplate(text):
         return
     
-    chunks_generated = 0
-    for chunk in chunk_text_no_truncation(text):
-        if not chunk:
+    yield from chunk_texts_batch([text])[0]
+
+# ====== PROCESSING FUNCTIONS ======
+def chunk_records(recs):
+    """
+    Chunk a batch of records without deduplicating.
+    Returns, per record, the list of chunk dicts it produced.
+    """
+    texts, owners = [], []
+    results = [[] for _ in recs]
+    for i, rec in enumerate(recs):
+        if not rec or not isinstance(rec, dict):
             continue
-        
+        text = clean_boilerplate(rec.get("text", ""))
+        if not text or is_boilerplate(text):
+            continue
+        texts.append(text)
+        owners.append(i)
+
+    for i, chunks in zip(owners, chunk_texts_batch(texts)):
+        rec = recs[i]
+        for chunk in chunks:
+            results[i].append({
+                "doc_id": rec.get("doc_id", ""),
+                "file": rec.get("file", ""),
+                "category": rec.get("category", ""),
+                "page_span": [rec.get("page_number", 0), rec.get("page_number", 0)],
+                "text": chunk,
+                "chunk_hash": hash_text(chunk)
+            })
+    return results
+
+def process_record(rec, seen_hashes):
+    """Process a single record and yield valid chunks."""
+    for chunk_data in chunk_records([rec])[0]:
         # Deduplication
-        h = hash_text(chunk)
+        h = chunk_data["chunk_hash"]
         if h in seen_hashes:
             continue
         seen_hashes.add(h)
-        
-        # Final safety check
-        if cached_token_len(chunk) > config.ALLOWED_TOKENS:
-            # Recursively split oversized chunks
-            re_ids = safe_tokenize(chunk)
-            for sub_ids in sliding_windows(re_ids, window=config.ALLOWED_TOKENS, overlap=config.OVERLAP):
-                sub_chunk = decode(sub_ids)
-                if is_quality_chunk(sub_chunk):
-                    yield {
-                        "doc_id": rec.get("doc_id", ""),
-                        "file": rec.get("file", ""),
-                        "category": rec.get("category", ""),
-                        "page_span": [rec.get("page_number", 0), rec.get("page_number", 0)],
-                        "text": sub_chunk,
-                        "chunk_hash": hash_text(sub_chunk)
-                    }
-                    chunks_generated += 1
+        yield chunk_data
+
+def chunk_shard(lines):
+    """
+    Worker: parse and chunk a shard of raw JSONL lines.
+    Returns one entry per line: a list of chunk dicts, or an error message string.
+    """
+    records, outcomes = [], []
+    for line in lines:
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError as e:
+            outcomes.append(f"JSON decode error: {e}")
             continue
-        
-        # Yield valid chunk
-        yield {
-            "doc_id": rec.get("doc_id", ""),
-            "file": rec.get("file", ""),
-            "category": rec.get("category", ""),
-            "page_span": [rec.get("page_number", 0), rec.get("page_number", 0)],
-            "text": chunk,
-            "chunk_hash": h
-        }
-        chunks_generated += 1
-    
-    return chunks_generated
+        if not isinstance(rec, dict):
+            outcomes.append(f"Invalid record: expected a JSON object, got {type(rec).__name__}")
+            continue
+        # None marks a line whose chunks come from `chunked`, in order
+        records.append(rec)
+        outcomes.append(None)
+
+    try:
+        chunked = iter(chunk_records(records))
+    except Exception:
+        # Redo the shard one record at a time so only the offending line is lost
+        chunked = iter([_chunk_one(rec) for rec in records])
+    return [next(chunked) if outcome is None else outcome for outcome in outcomes]
+
+def _chunk_one(rec):
+    """Chunks of a single record, or an error message string."""
+    try:
+        return chunk_records([rec])[0]
+    except Exception as e:
+        return f"Unexpected error: {e}"
+
+def _iter_shards(in_f, shard_size):
+    """Yield (decoded lines, input byte offset after the shard) from a binary file."""
+    shard = []
+    offset = in_f.tell()
+    for line in in_f:
+        offset += len(line)
+        shard.append(line.decode("utf-8"))
+        if len(shard) >= shard_size:
+            yield shard, offset
+            shard = []
+    if shard:
+        yield shard, offset
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
 
-def process_single_file(jsonl_file, checkpoint_file=None):
-    """Process a single JSONL file with checkpoint support."""
+def process_single_file(jsonl_file, dedup=None, executor=None):
+    """
+    Process a single JSONL file against a (possibly corpus-wide) dedup index.
+
+    With an executor, the file is split into SHARD_RECORDS-line shards that are chunked
+    across worker processes; results are consumed in input order, so deduplication and
+    output order are the same as a sequential run.
+
+    Output goes to a .partial file that is renamed into place once the file is done.
+    Every CHECKPOINT_LINES input lines the output is fsynced and the input byte offset,
+    line number and output size are committed together with the new dedup hashes, so an
+    interrupted run resumes by truncating the .partial file and seeking the input to the
+    last committed position.
+    """
     category = jsonl_file.stem
     out_path = OUT_DIR / f"{category}_chunks.jsonl"
+    partial_path = out_path.with_name(out_path.name + ".partial")
     
-    # Checkpoint handling
-    processed_hashes = set()
-    if checkpoint_file and checkpoint_file.exists():
-        try:
-            with open(checkpoint_file, 'r') as f:
-                processed_hashes.update(line.strip() for line in f)
-            logger.info(f"Loaded {len(processed_hashes)} hashes from checkpoint")
-        except Exception as e:
-            logger.error(f"Error loading checkpoint: {e}")
-    
-    seen_hashes = set(processed_hashes)
-    kept = 0
-    skipped = 0
+    if dedup is None:
+        dedup = DedupIndex(":memory:")
+
+    state = dedup.load_checkpoint(category)
+    if state and state.get("done"):
+        # Finished earlier in this run; finish the rename if the crash came right before it
+        if partial_path.exists():
+            os.replace(partial_path, out_path)
+        logger.info(f"{jsonl_file.name} already completed in this run, skipping")
+        return state["kept"], state["skipped"], True
+
+    resuming = bool(state) and partial_path.exists() and partial_path.stat().st_size >= state["out_offset"]
+    if resuming:
+        logger.info(f"Resuming {jsonl_file.name} at line {state['line']} (byte {state['offset']})")
+    else:
+        if state:
+            logger.warning(f"Checkpoint for {jsonl_file.name} has no matching partial output; starting over")
+            # Its hashes point at output that no longer exists; keeping them would drop those chunks
+            dedup.forget(category)
+        state = {"line": 0, "offset": 0, "out_offset": 0, "kept": 0, "skipped": 0}
+
+    line_num = state["line"]
+    kept = state["kept"]
+    skipped = state["skipped"]
+
+    def checkpoint(out_f, offset, done=False):
+        _fsync(out_f)
+        dedup.commit(category, {
+            "line": line_num, "offset": offset, "out_offset": out_f.tell(),
+            "kept": kept, "skipped": skipped, "done": done
+        })
     
     try:
         # Count total lines for progress bar
-        total_lines = sum(1 for _ in open(jsonl_file, 'r', encoding='utf-8'))
+        total_lines = sum(1 for _ in open(jsonl_file, 'rb'))
         
-        with open(out_path, "a" if checkpoint_file else "w", encoding="utf-8") as out_f:
-            with open(jsonl_file, "r", encoding="utf-8") as in_f:
-                for line_num, line in enumerate(tqdm(in_f, total=total_lines, desc=f"Processing {category}"), 1):
-                    try:
-                        rec = json.loads(line)
-                        for chunk_data in process_record(rec, seen_hashes):
-                            out_f.write(json.dumps(chunk_data, ensure_ascii=False) + "\n")
-                            kept += 1
-                    except json.JSONDecodeError as e:
-                        logger.warning(f"JSON decode error in {jsonl_file} line {line_num}: {e}")
-                        skipped += 1
-                    except Exception as e:
-                        logger.error(f"Unexpected error processing line {line_num}: {e}")
-                        skipped += 1
-                    
-                    # Save checkpoint every 1000 lines
-                    if line_num % 1000 == 0 and checkpoint_file:
-                        with open(checkpoint_file, 'w') as f:
-                            f.writelines(h + '\n' for h in seen_hashes)
+        with open(partial_path, "r+b" if resuming else "wb") as out_f:
+            # Drop anything written after the last committed checkpoint
+            out_f.truncate(state["out_offset"])
+            out_f.seek(state["out_offset"])
+            with open(jsonl_file, "rb") as in_f:
+                in_f.seek(state["offset"])
+                shards = _iter_shards(in_f, config.SHARD_RECORDS)
+                if executor is None:
+                    results = ((shard, chunk_shard(shard[0])) for shard in shards)
+                else:
+                    results = _ordered_map(executor, chunk_shard, shards, config.MAX_PENDING_SHARDS)
+
+                offset = state["offset"]
+                with tqdm(total=total_lines, initial=line_num, desc=f"Processing {category}") as progress:
+                    for (lines, offset), outcomes in results:
+                        for outcome in outcomes:
+                            line_num += 1
+                            if isinstance(outcome, str):
+                                logger.warning(f"{outcome} in {jsonl_file} line {line_num}")
+                                skipped += 1
+                                continue
+                            for chunk_data in outcome:
+                                # Deduplication (exact, plus near-duplicates if enabled)
+                                if not dedup.add_if_new(chunk_data["chunk_hash"], chunk_data["text"], owner=category):
+                                    continue
+                                out_f.write((json.dumps(chunk_data, ensure_ascii=False) + "\n").encode("utf-8"))
+                                kept += 1
+                        progress.update(len(lines))
+
+                        if line_num // config.CHECKPOINT_LINES != (line_num - len(lines)) // config.CHECKPOINT_LINES:
+                            checkpoint(out_f, offset)
+
+            # Record completion before the rename so a crash in between is recoverable
+            checkpoint(out_f, offset, done=True)
+        os.replace(partial_path, out_path)
                 
     except Exception as e:
         logger.error(f"Error processing file {jsonl_file}: {e}")
+        # Hashes past the last checkpoint belong to output that resume will truncate away
+        dedup.rollback()
         return kept, skipped, False
     
-    # Final checkpoint save
-    if checkpoint_file:
-        with open(checkpoint_file, 'w') as f:
-            f.writelines(h + '\n' for h in seen_hashes)
-    
     return kept, skipped, True
 
-def process_file_wrapper(args):
-    """Wrapper for parallel processing."""
-    jsonl_file, checkpoint_file = args
-    return process_single_file(jsonl_file, checkpoint_file)
+def _ordered_map(executor, fn, shards, max_pending):
+    """executor.map over shard lines with a bounded number of in-flight tasks; yields (shard, result) in order."""
+    pending = deque()
+    for shard in shards:
+        pending.append((shard, executor.submit(fn, shard[0])))
+        if len(pending) >= max_pending:
+            shard, future = pending.popleft()
+            yield shard, future.result()
+    while pending:
+        shard, future = pending.popleft()
+        yield shard, future.result()
 
 # ====== MAIN PROCESS ======
 def main():
     logger.info("Starting chunking process")
+    OUT_DIR.mkdir(exist_ok=True)
     
-    jsonl_files = list(CLEANED_DIR.glob("*.jsonl"))
+    # Fixed order: with a corpus-wide dedup index, the first file to see a duplicate keeps it
+    jsonl_files = sorted(CLEANED_DIR.glob("*.jsonl"))
     if not jsonl_files:
         logger.warning(f"No JSONL files found in {CLEANED_DIR}")
         return
     
     logger.info(f"Found {len(jsonl_files)} files to process")
     
-    # Prepare checkpoint files
-    checkpoint_files = []
-    for jsonl_file in jsonl_files:
-        checkpoint_file = OUT_DIR / f"{jsonl_file.stem}_checkpoint.txt"
-        checkpoint_files.append(checkpoint_file)
+    # One dedup index for the whole corpus, so duplicates across categories are caught too
+    dedup = DedupIndex(
+        DEDUP_INDEX_PATH,
+        near_duplicates=config.NEAR_DUPLICATE_DETECTION,
+        near_dup_threshold=config.NEAR_DUPLICATE_THRESHOLD
+    )
+    # A run that left checkpoints behind was interrupted: resume it. Otherwise start clean.
+    if dedup.has_checkpoints():
+        logger.info(f"Resuming interrupted run; dedup index holds {len(dedup)} chunk hashes")
+    else:
+        dedup.reset()
     
-    # Process files (sequential or parallel)
+    # Process files one at a time, each sharded across all workers
     total_kept = 0
     total_skipped = 0
+    all_succeeded = True
     
-    if len(jsonl_files) > 1 and multiprocessing.cpu_count() > 1:
-        # Parallel processing for multiple files
-        logger.info("Using parallel processing")
-        with ProcessPoolExecutor(max_workers=min(len(jsonl_files), multiprocessing.cpu_count())) as executor:
-            args = zip(jsonl_files, checkpoint_files)
-            results = list(executor.map(process_file_wrapper, args))
-            
-            for (kept, skipped, success), jsonl_file in zip(results, jsonl_files):
-                if success:
-                    logger.info(f"Completed {jsonl_file.name}: kept={kept}, skipped={skipped}")
-                    total_kept += kept
-                    total_skipped += skipped
-                else:
-                    logger.error(f"Failed to process {jsonl_file.name}")
-    else:
-        # Sequential processing
-        logger.info("Using sequential processing")
-        for jsonl_file, checkpoint_file in zip(jsonl_files, checkpoint_files):
-            kept, skipped, success = process_single_file(jsonl_file, checkpoint_file)
+    workers = multiprocessing.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    logger.info(f"Using {'record-sharded parallel' if executor else 'sequential'} processing")
+    try:
+        for jsonl_file in jsonl_files:
+            kept, skipped, success = process_single_file(jsonl_file, dedup, executor)
             if success:
                 logger.info(f"Completed {jsonl_file.name}: kept={kept}, skipped={skipped}")
                 total_kept += kept
                 total_skipped += skipped
             else:
                 logger.error(f"Failed to process {jsonl_file.name}")
+                all_succeeded = False
+        if all_succeeded:
+            dedup.clear_checkpoints()
+    finally:
+        if executor:
+            executor.shutdown()
+        dedup.close()
     
+    logger.info(f"Duplicates dropped: exact={dedup.exact_duplicates}, near={dedup.near_duplicates}")
     logger.info(f"Chunking complete! Total kept: {total_kept}, Total skipped: {total_skipped}")
     logger.info(f"Output directory: {OUT_DIR}")
 
 if __name__ == "__main__":
+    configure_logging()
     try:
         main()
     except KeyboardInterrupt:
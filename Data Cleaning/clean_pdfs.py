@@ -1,11 +1,16 @@
+import argparse
 import json
+import os
 import re
 import hashlib
+import time
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 import fitz  # PyMuPDF
 import pytesseract
 from PIL import Image
-import io
 
 # ========= CONFIG =========
 # Automatically resolve paths relative to script location
@@ -15,6 +20,19 @@ OUT = (BASE_DIR / "../cleaned").resolve()
 
 # OCR settings
 OCR_LANG = "eng"
+OCR_DPI = 300                   # Tesseract is most accurate around 300 DPI
+OCR_CACHE_DIR = OUT / ".ocr_cache"
+
+# Parallelism: text-layer extraction and OCR run in separate process pools
+TEXT_WORKERS = os.cpu_count() or 1
+OCR_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+PAGES_PER_TASK = 16        # pages per text-extraction task
+MAX_PENDING_TASKS = 64     # tasks scheduled ahead of the in-order writer (bounds buffered text)
+TIMINGS_FILE = "page_timings.jsonl"
+
+# Incremental runs: per-document records live in PARTS_DIR, tracked by MANIFEST_PATH
+PARTS_DIR = OUT / ".parts"
+MANIFEST_PATH = OUT / "manifest.json"
 # ==========================
 
 def clean_text(text):
@@ -28,12 +46,56 @@ def hash_text(text):
     """Create a hash to detect duplicate pages."""
     return hashlib.md5(text.encode('utf-8')).hexdigest()
 
-def extract_text_with_ocr(page):
-    """Fallback OCR if no extractable text is found."""
-    pix = page.get_pixmap()
-    img_bytes = pix.tobytes("png")
-    img = Image.open(io.BytesIO(img_bytes))
-    return pytesseract.image_to_string(img, lang=OCR_LANG)
+def needs_ocr(page):
+    """Pre-check before rendering: a text-less page is worth OCR unless it has no images and no vector drawings."""
+    if page.rect.is_empty:
+        return False
+    if page.get_image_info():
+        return True
+    # Text outlined into vector paths (vectorized scans, drawings, standards) only shows up as drawings
+    return bool(page.get_drawings())
+
+@lru_cache(maxsize=1)
+def _tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "unknown"
+
+def _ocr_cache_path(pix):
+    """Content address of a rendered page plus every setting that affects the OCR output"""
+    digest = hashlib.sha256()
+    digest.update(f"{pix.width}x{pix.height}:{pix.n}:{OCR_DPI}:{OCR_LANG}:{_tesseract_version()}".encode())
+    digest.update(pix.samples)
+    key = digest.hexdigest()
+    return OCR_CACHE_DIR / key[:2] / f"{key}.txt"
+
+def extract_text_with_ocr(page, return_cache_hit=False):
+    """Fallback OCR if no extractable text is found, cached by rendered-image hash."""
+    pix = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY)
+    cache_path = _ocr_cache_path(pix)
+
+    if cache_path.exists():
+        text = cache_path.read_text(encoding="utf-8")
+        return (text, True) if return_cache_hit else text
+
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
+    text = pytesseract.image_to_string(img, lang=OCR_LANG)
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, cache_path)
+    return (text, False) if return_cache_hit else text
+
+def make_record(pdf_path, category, page_num, text):
+    return {
+        "doc_id": pdf_path.stem,
+        "file": pdf_path.name,
+        "category": category,
+        "page_number": page_num,
+        "text": text
+    }
 
 def process_pdf(pdf_path, category, out_f):
     """Process one PDF into JSONL records."""
@@ -49,7 +111,7 @@ def process_pdf(pdf_path, category, out_f):
     for page_num, page in enumerate(doc, start=1):
         text = page.get_text("text")
 
-        if not text.strip():
+        if not text.strip() and needs_ocr(page):
             text = extract_text_with_ocr(page)
 
         text = clean_text(text)
@@ -62,19 +124,290 @@ def process_pdf(pdf_path, category, out_f):
             continue
         seen_hashes.add(text_hash)
 
-        rec = {
-            "doc_id": pdf_path.stem,
-            "file": pdf_path.name,
-            "category": category,
-            "page_number": page_num,
-            "text": text
-        }
+        rec = make_record(pdf_path, category, page_num, text)
         out_f.write(json.dumps(rec, ensure_ascii=False) + "\n")
         page_count += 1
 
     return page_count
 
+# ========= PARALLEL EXTRACTION =========
+def _init_ocr_worker():
+    # One Tesseract thread per process; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def extract_page_range(pdf_path, start, end):
+    """Worker: text layer of pages [start, end) -> [(page_num, text or None if OCR is needed, seconds)]"""
+    doc = fitz.open(pdf_path)
+    pages = []
+    for index in range(start, end):
+        t0 = time.perf_counter()
+        page = doc[index]
+        text = page.get_text("text")
+        if not text.strip() and needs_ocr(page):
+            text = None
+        pages.append((index + 1, text, time.perf_counter() - t0))
+    return pages
+
+def ocr_page(pdf_path, page_index):
+    """Worker: OCR a single page -> (text, seconds, cache hit)"""
+    t0 = time.perf_counter()
+    doc = fitz.open(pdf_path)
+    text, cache_hit = extract_text_with_ocr(doc[page_index], return_cache_hit=True)
+    return text, time.perf_counter() - t0, cache_hit
+
+class PageExtractor:
+    """
+    Page-granular extraction across two process pools.
+
+    Text-layer extraction is fanned out in PAGES_PER_TASK page ranges. Pages without a
+    text layer are handed to the OCR pool as soon as their range finishes, so OCR runs
+    alongside text extraction with its own concurrency limit. Results are consumed
+    strictly in document order, with at most MAX_PENDING_TASKS ranges in flight.
+    """
+
+    def __init__(self, text_workers=TEXT_WORKERS, ocr_workers=OCR_WORKERS):
+        self.text_pool = ProcessPoolExecutor(max_workers=text_workers)
+        self.ocr_pool = ProcessPoolExecutor(max_workers=ocr_workers, initializer=_init_ocr_worker)
+
+    def close(self):
+        self.text_pool.shutdown()
+        self.ocr_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _schedule(self, pdf_path, start, end):
+        ready = Future()
+        text_future = self.text_pool.submit(extract_page_range, str(pdf_path), start, end)
+
+        def on_done(f):
+            try:
+                pages = []
+                for page_num, text, seconds in f.result():
+                    if text is None:
+                        text = self.ocr_pool.submit(ocr_page, str(pdf_path), page_num - 1)
+                    pages.append((page_num, text, seconds))
+                ready.set_result(pages)
+            except Exception as e:
+                ready.set_exception(e)
+
+        text_future.add_done_callback(on_done)
+        return ready
+
+    def iter_pages(self, pdfs):
+        """
+        Yield (pdf_path, page_num, raw_text, timing) for every page in document order,
+        plus (pdf_path, None, error, None) for PDFs or ranges that could not be read and
+        (pdf_path, page_num, error, None) for pages whose OCR failed.
+        """
+        def tasks():
+            for pdf_path in pdfs:
+                try:
+                    with fitz.open(pdf_path) as doc:
+                        page_total = doc.page_count
+                except Exception as e:
+                    yield pdf_path, None, None, e
+                    continue
+                for start in range(0, page_total, PAGES_PER_TASK):
+                    yield pdf_path, start, min(start + PAGES_PER_TASK, page_total), None
+
+        pending = deque()
+        task_iter = tasks()
+        while True:
+            while len(pending) < MAX_PENDING_TASKS:
+                task = next(task_iter, None)
+                if task is None:
+                    break
+                pdf_path, start, end, error = task
+                ready = self._schedule(pdf_path, start, end) if error is None else None
+                pending.append((pdf_path, ready, error))
+            if not pending:
+                return
+
+            pdf_path, ready, error = pending.popleft()
+            if ready is None:
+                yield pdf_path, None, error, None
+                continue
+            try:
+                pages = ready.result()
+            except Exception as e:
+                yield pdf_path, None, e, None
+                continue
+
+            for page_num, text, extract_s in pages:
+                timing = {"extract_s": round(extract_s, 4), "ocr": False}
+                if isinstance(text, Future):
+                    try:
+                        text, ocr_s, cache_hit = text.result()
+                    except Exception as e:
+                        yield pdf_path, page_num, e, None
+                        continue
+                    timing.update(ocr=True, ocr_s=round(ocr_s, 4), ocr_cached=cache_hit)
+                yield pdf_path, page_num, text, timing
+
+def iter_cleaned_documents(extractor, pdfs, category, timings_f=None):
+    """
+    Clean every page of `pdfs` in parallel and yield (pdf_path, records) per document,
+    in input order. records is None when the document could not be read or a page
+    failed OCR, so it is not recorded as done and gets re-extracted next run.
+    Documents without pages yield an empty list.
+    """
+    ocr_pages = 0
+    ocr_cached = 0
+    slowest = (0.0, None, None)
+    current, records, seen_hashes, failed = None, [], set(), False
+    upcoming = iter(pdfs)
+
+    for pdf_path, page_num, text, timing in extractor.iter_pages(pdfs):
+        if pdf_path != current:
+            if current is not None:
+                yield current, None if failed else records
+            # Zero-page PDFs produce no pages at all; report them as empty documents
+            for skipped in upcoming:
+                if skipped == pdf_path:
+                    break
+                yield skipped, []
+            current, records, seen_hashes, failed = pdf_path, [], set(), False
+
+        if page_num is None:
+            print(f"[ERROR] Cannot read {pdf_path.name}: {text}")
+            failed = True
+            continue
+        if timing is None:
+            print(f"[ERROR] OCR failed on {pdf_path.name} page {page_num}: {text}")
+            failed = True
+            continue
+
+        if timings_f is not None:
+            timings_f.write(json.dumps({"file": pdf_path.name, "page_number": page_num, **timing}) + "\n")
+        page_seconds = timing["extract_s"] + timing.get("ocr_s", 0.0)
+        ocr_pages += timing["ocr"]
+        ocr_cached += timing.get("ocr_cached", False)
+        if page_seconds > slowest[0]:
+            slowest = (page_seconds, pdf_path.name, page_num)
+
+        text = clean_text(text)
+        if not text:
+            continue
+
+        text_hash = hash_text(text)
+        if text_hash in seen_hashes:
+            continue
+        seen_hashes.add(text_hash)
+
+        records.append(make_record(pdf_path, category, page_num, text))
+
+    if current is not None:
+        yield current, None if failed else records
+    for skipped in upcoming:
+        yield skipped, []
+    if slowest[1]:
+        print(f"   [TIMING] {ocr_pages} OCR pages ({ocr_cached} from cache); slowest page {slowest[1]} p.{slowest[2]} ({slowest[0]:.2f}s)")
+
+# ========= INCREMENTAL RUNS =========
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def atomic_write(path, lines):
+    """Write lines to path via a temp file + rename, so readers never see a partial file"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, path)
+
+class CleaningManifest:
+    """
+    Per-document record of what has been cleaned: PDF size, mtime and sha256, plus the
+    part file holding that document's records. Saved after every finished document, so
+    a crashed run resumes from the last completed PDF.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    @staticmethod
+    def key(pdf_path):
+        return pdf_path.relative_to(ROOT).as_posix()
+
+    def part_path(self, pdf_path):
+        entry = self.entries.get(self.key(pdf_path))
+        return PARTS_DIR / entry["part"] if entry else None
+
+    def is_current(self, pdf_path):
+        """True if the PDF is unchanged since its records were written"""
+        entry = self.entries.get(self.key(pdf_path))
+        if not entry or not (PARTS_DIR / entry["part"]).exists():
+            return False
+        stat = pdf_path.stat()
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return True
+        if entry["size"] == stat.st_size and entry["sha256"] == file_digest(pdf_path):
+            entry["mtime"] = stat.st_mtime
+            self.save()
+            return True
+        return False
+
+    def record(self, pdf_path, category, records):
+        """Store a finished document's records in its part file and commit it to the manifest"""
+        stat = pdf_path.stat()
+        sha256 = file_digest(pdf_path)
+        # Keyed on the path: identical PDFs in one category still get their own records
+        part = f"{category}/{hashlib.sha256(self.key(pdf_path).encode('utf-8')).hexdigest()[:20]}.jsonl"
+        (PARTS_DIR / category).mkdir(parents=True, exist_ok=True)
+        atomic_write(PARTS_DIR / part, (json.dumps(rec, ensure_ascii=False) + "\n" for rec in records))
+
+        self.entries[self.key(pdf_path)] = {
+            "category": category,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+            "part": part,
+            "pages": len(records)
+        }
+        self.save()
+
+    def forget_missing(self, category, pdfs):
+        """Drop entries (and part files) of PDFs that were removed from a category"""
+        present = {self.key(p) for p in pdfs}
+        for key, entry in list(self.entries.items()):
+            if entry["category"] == category and key not in present:
+                del self.entries[key]
+                (PARTS_DIR / entry["part"]).unlink(missing_ok=True)
+        self.save()
+
+    def categories(self):
+        return {entry["category"] for entry in self.entries.values()}
+
+    def remove_orphaned_parts(self):
+        """Delete part files no entry points at (left by --full, renamed PDFs or older part names)"""
+        if not PARTS_DIR.exists():
+            return
+        referenced = {PARTS_DIR / entry["part"] for entry in self.entries.values()}
+        for part_path in PARTS_DIR.glob("*/*.jsonl*"):
+            if part_path not in referenced:
+                part_path.unlink(missing_ok=True)
+
+    def save(self):
+        OUT.mkdir(exist_ok=True)
+        atomic_write(self.path, [json.dumps(self.entries, indent=2)])
+
 def main():
+    parser = argparse.ArgumentParser(description="Clean Dataset_PDFs into per-category JSONL")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-extract every PDF")
+    args = parser.parse_args()
+
     print(f"[INFO] Looking for PDFs in: {ROOT}")
     OUT.mkdir(exist_ok=True)
 
@@ -82,26 +415,60 @@ def main():
         print(f"[ERROR] Data folder not found at: {ROOT}")
         return
 
-    for category_dir in ROOT.iterdir():
-        if category_dir.is_dir():
-            category = category_dir.name
-            pdfs = list(category_dir.glob("*.pdf")) + list(category_dir.glob("*.PDF"))
-            print(f"[INFO] Category '{category}' -> {len(pdfs)} PDFs found")
+    manifest = CleaningManifest()
+    if args.full:
+        manifest.entries = {}
 
-            if not pdfs:
-                continue
+    # Categories cleaned before whose folder is gone: drop their records and output
+    categories = {category_dir.name for category_dir in ROOT.iterdir() if category_dir.is_dir()}
+    for category in sorted(manifest.categories() - categories):
+        print(f"[INFO] Category '{category}' no longer exists, removing its output")
+        manifest.forget_missing(category, [])
+        (OUT / f"{category}.jsonl").unlink(missing_ok=True)
+
+    with PageExtractor() as extractor, open(OUT / TIMINGS_FILE, "w", encoding="utf-8") as timings_f:
+        for category_dir in ROOT.iterdir():
+            if category_dir.is_dir():
+                category = category_dir.name
+                pdfs = sorted(set(category_dir.glob("*.pdf")) | set(category_dir.glob("*.PDF")))
+                print(f"[INFO] Category '{category}' -> {len(pdfs)} PDFs found")
+
+                manifest.forget_missing(category, pdfs)
+                if not pdfs:
+                    # A stale file would keep feeding removed PDFs to the chunker
+                    (OUT / f"{category}.jsonl").unlink(missing_ok=True)
+                    continue
+
+                stale = [pdf for pdf in pdfs if not manifest.is_current(pdf)]
+                print(f"[INFO] {len(pdfs) - len(stale)} unchanged, {len(stale)} to extract")
+
+                started = time.perf_counter()
+                for pdf_path, records in iter_cleaned_documents(extractor, stale, category, timings_f):
+                    if records is None:
+                        print(f"   [SKIP] {pdf_path.name} incomplete, will be retried next run")
+                        continue
+                    manifest.record(pdf_path, category, records)
+                    print(f"   [OK] {pdf_path.name} -> {len(records)} pages cleaned")
+
+                # Reassemble the category file from the per-document parts, in a stable order
+                output_path = OUT / f"{category}.jsonl"
+                parts = [manifest.part_path(pdf) for pdf in pdfs]
+                parts = [part for part in parts if part is not None]
+                total_pages = sum(manifest.entries[manifest.key(pdf)]["pages"]
+                                  for pdf in pdfs if manifest.part_path(pdf) is not None)
 
-            output_path = OUT / f"{category}.jsonl"
+                def part_lines():
+                    for part_path in parts:
+                        with open(part_path, "r", encoding="utf-8") as part_f:
+                            yield from part_f
 
-            total_pages = 0
-            with open(output_path, "w", encoding="utf-8") as out_f:
-                for pdf in pdfs:
-                    pages_written = process_pdf(pdf, category, out_f)
-                    print(f"   [OK] {pdf.name} -> {pages_written} pages cleaned")
-                    total_pages += pages_written
+                atomic_write(output_path, part_lines())
+                elapsed = time.perf_counter() - started
 
-            print(f"[DONE] Wrote {total_pages} pages for '{category}' -> {output_path}")
+                print(f"[DONE] Wrote {total_pages} pages for '{category}' -> {output_path} ({elapsed:.1f}s)")
 
+    manifest.remove_orphaned_parts()
+    print(f"[INFO] Per-page timings written to {OUT / TIMINGS_FILE}")
     print("[COMPLETE] All PDFs processed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import re
+import sqlite3
+from math import ceil, log
+from pathlib import Path
+
+import numpy as np
+
+# Mersenne prime for the MinHash permutations; keeps a * x + b inside uint64
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over hex digests (which are already uniformly distributed)."""
+
+    def __init__(self, expected_items, false_positive_rate=0.001):
+        expected_items = max(1, expected_items)
+        self.size = max(8, int(-expected_items * log(false_positive_rate) / (log(2) ** 2)))
+        self.num_hashes = max(1, round(self.size / expected_items * log(2)))
+        self.bits = bytearray(ceil(self.size / 8))
+
+    def _positions(self, digest):
+        # Double hashing from two 64-bit halves of the digest
+        raw = hashlib.blake2b(digest.encode("ascii"), digest_size=16).digest()
+        h1 = int.from_bytes(raw[:8], "little")
+        h2 = int.from_bytes(raw[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.num_hashes))
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, banded for LSH candidate lookup."""
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+    def signature(self, text):
+        words = re.findall(r"\w+", text.lower())
+        n = self.shingle_size
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") % MERSENNE_PRIME
+             for s in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature):
+        return [
+            hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest()
+            for band in range(self.bands)
+        ]
+
+
+class DedupIndex:
+    """
+    Corpus-wide chunk dedup backed by SQLite.
+
+    Exact duplicates are keyed on chunk_hash: a Bloom filter answers "definitely new"
+    without touching disk, and only possible hits are confirmed against the table.
+    With near_duplicates enabled, MinHash LSH also rejects chunks whose estimated
+    Jaccard similarity to an indexed chunk reaches near_dup_threshold.
+
+    Writes become durable on commit(). A caller's checkpoint state can be committed in
+    the same transaction, so the recorded resume position and the set of indexed hashes
+    can never disagree after a crash. Anything not committed is rolled back, including
+    on close(). Each hash records the owner (input file) that added it, so forget(owner)
+    can undo a file whose output was lost.
+    """
+
+    def __init__(self, path, expected_items=1_000_000, false_positive_rate=0.001,
+                 near_duplicates=False, near_dup_threshold=0.9):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (digest TEXT PRIMARY KEY, owner TEXT) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS signatures (digest TEXT PRIMARY KEY, signature BLOB) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS lsh_buckets (band INTEGER, bucket BLOB, digest TEXT);
+            CREATE INDEX IF NOT EXISTS lsh_buckets_key ON lsh_buckets(band, bucket);
+            CREATE TABLE IF NOT EXISTS checkpoints (name TEXT PRIMARY KEY, state TEXT) WITHOUT ROWID;
+        """)
+        if "owner" not in {row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")}:
+            # Index created before hashes were attributed to their input file
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN owner TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_owner ON chunks(owner)")
+        self.conn.commit()
+
+        self.expected_items = expected_items
+        self.false_positive_rate = false_positive_rate
+        self.minhasher = MinHasher() if near_duplicates else None
+        self.near_dup_threshold = near_dup_threshold
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self._load_bloom()
+
+    def _load_bloom(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        self.bloom = BloomFilter(max(self.expected_items, 2 * count), self.false_positive_rate)
+        for (digest,) in self.conn.execute("SELECT digest FROM chunks"):
+            self.bloom.add(digest)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _is_exact_duplicate(self, digest):
+        if digest not in self.bloom:
+            return False
+        return self.conn.execute("SELECT 1 FROM chunks WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def _near_duplicate_of(self, signature, band_keys):
+        seen = set()
+        for band, key in enumerate(band_keys):
+            for (candidate,) in self.conn.execute(
+                "SELECT digest FROM lsh_buckets WHERE band = ? AND bucket = ?", (band, key)
+            ):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                row = self.conn.execute("SELECT signature FROM signatures WHERE digest = ?", (candidate,)).fetchone()
+                if row and np.mean(np.frombuffer(row[0], dtype=np.uint32) == signature) >= self.near_dup_threshold:
+                    return candidate
+        return None
+
+    def add_if_new(self, digest, text=None, owner=None):
+        """Record a chunk and return True, or return False if it duplicates an indexed chunk."""
+        if self._is_exact_duplicate(digest):
+            self.exact_duplicates += 1
+            return False
+
+        if self.minhasher is not None and text:
+            signature = self.minhasher.signature(text)
+            band_keys = self.minhasher.band_keys(signature)
+            if self._near_duplicate_of(signature, band_keys):
+                self.near_duplicates += 1
+                return False
+            self.conn.execute("INSERT OR IGNORE INTO signatures VALUES (?, ?)", (digest, signature.tobytes()))
+            self.conn.executemany(
+                "INSERT INTO lsh_buckets VALUES (?, ?, ?)",
+                [(band, key, digest) for band, key in enumerate(band_keys)]
+            )
+
+        self.conn.execute("INSERT OR IGNORE INTO chunks VALUES (?, ?)", (digest, owner))
+        self.bloom.add(digest)
+        return True
+
+    def commit(self, checkpoint=None, state=None):
+        """Make pending additions durable, optionally together with a named checkpoint state."""
+        if checkpoint is not None:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)", (checkpoint, json.dumps(state))
+            )
+        self.conn.commit()
+
+    def load_checkpoint(self, checkpoint):
+        row = self.conn.execute("SELECT state FROM checkpoints WHERE name = ?", (checkpoint,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def has_checkpoints(self):
+        return self.conn.execute("SELECT 1 FROM checkpoints LIMIT 1").fetchone() is not None
+
+    def clear_checkpoints(self):
+        self.conn.execute("DELETE FROM checkpoints")
+        self.conn.commit()
+
+    def rollback(self):
+        """Discard uncommitted additions (the Bloom filter is rebuilt to match)."""
+        self.conn.rollback()
+        self._load_bloom()
+
+    def forget(self, owner):
+        """Drop every hash the given owner added, and its checkpoint."""
+        owned = "SELECT digest FROM chunks WHERE owner = ?"
+        self.conn.execute(f"DELETE FROM lsh_buckets WHERE digest IN ({owned})", (owner,))
+        self.conn.execute(f"DELETE FROM signatures WHERE digest IN ({owned})", (owner,))
+        self.conn.execute("DELETE FROM chunks WHERE owner = ?", (owner,))
+        self.conn.execute("DELETE FROM checkpoints WHERE name = ?", (owner,))
+        self.conn.commit()
+        self._load_bloom()
+
+    def reset(self):
+        """Forget every indexed chunk and checkpoint."""
+        self.conn.executescript(
+            "DELETE FROM chunks; DELETE FROM signatures; DELETE FROM lsh_buckets; DELETE FROM checkpoints;"
+        )
+        self.conn.commit()
+        self._load_bloom()
+
+    def close(self):
+        """Close without committing: additions past the last commit() are discarded."""
+        self.conn.rollback()
+        self.conn.close()
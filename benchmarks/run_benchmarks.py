@@ -0,0 +1,357 @@
+"""
+End-to-end performance benchmarks on a synthetic corpus.
+
+Measures throughput of the cleaning, chunking, embedding and ingest stages and
+latency percentiles of retrieval and full RAG queries (against a stub Ollama
+server), writes the results as JSON and compares them with a stored baseline.
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --save-baseline
+
+Without a baseline (none is committed: numbers are machine-specific) the run stops
+early unless --save-baseline or --no-baseline is given.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "Data Cleaning"))
+
+from src.config import config
+from benchmarks import synthetic
+from benchmarks.stub_ollama import StubOllamaServer
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+STAGES = ("startup", "clean", "chunk", "embed", "ingest", "retrieve", "quantized", "rag")
+
+
+def _isolate(workdir: Path, ollama_url: str, args):
+    """Point every persistent path at the scratch directory; must run before importing src.database"""
+    config.EMBEDDING_BACKEND = args.embedding_backend
+    config.VECTOR_BACKEND = args.vector_backend
+    config.PERSIST_DIRECTORY = str(workdir / "chroma_db")
+    config.COLLECTION_NAME = "benchmark"
+    # Measure the encoder, not cache lookups
+    config.EMBEDDING_CACHE_PATH = None
+    # Repeated benchmark queries would otherwise be answered from the cache
+    config.ENABLE_QUERY_CACHE = False
+    config.OLLAMA_BASE_URL = ollama_url
+    config.TIMING_LOG_FILE = str(workdir / "logs" / "rag_timings.jsonl")
+
+
+def _throughput(items: int, seconds: float, unit: str):
+    return {unit: items / seconds if seconds > 0 else 0.0, "items": items, "seconds": seconds}
+
+
+def _latencies(fn, queries, warmup: int):
+    for query in queries[:warmup]:
+        fn(query)
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - started) * 1000.0)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            "mean_ms": float(np.mean(samples)), "count": len(samples)}
+
+
+def bench_startup(workdir: Path, args):
+    """Median wall time of fresh main.py processes; run from the scratch dir so ./chroma_db is isolated"""
+    result = {}
+    for flag in ("--help", "--stats"):
+        samples = []
+        for _ in range(args.startup_runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, str(REPO_ROOT / "main.py"), flag], cwd=workdir,
+                           check=True, capture_output=True)
+            samples.append((time.perf_counter() - started) * 1000.0)
+        result[f"main_{flag[2:]}_ms"] = float(np.median(samples))
+    return result
+
+
+def bench_clean(workdir: Path, args):
+    import clean_pdfs
+
+    clean_pdfs.OCR_CACHE_DIR = workdir / "ocr_cache"
+    pdfs = synthetic.write_pdfs(workdir / "pdfs", args.pdfs, args.pages_per_pdf, args.seed)
+    started = time.perf_counter()
+    pages = 0
+    with open(workdir / "cleaned_bench.jsonl", "w", encoding="utf-8") as out_f:
+        for pdf in pdfs:
+            pages += clean_pdfs.process_pdf(pdf, "misc", out_f)
+    return _throughput(pages, time.perf_counter() - started, "pages_per_s")
+
+
+def bench_chunk(workdir: Path, args):
+    """Sequential, record-sharded parallel and on-disk dedup runs over the same cleaned file"""
+    import chunk_jsonl
+    from dedup_index import DedupIndex
+
+    chunk_jsonl.OUT_DIR = workdir / "chunks_bench"
+    chunk_jsonl.OUT_DIR.mkdir(exist_ok=True)
+    source = synthetic.write_cleaned_jsonl(workdir / "cleaned" / "misc.jsonl", args.records, args.seed)
+
+    def timed(dedup=None, executor=None):
+        started = time.perf_counter()
+        _, _, success = chunk_jsonl.process_single_file(source, dedup, executor)
+        if not success:
+            raise RuntimeError("chunk_jsonl.process_single_file failed")
+        return time.perf_counter() - started
+
+    result = _throughput(args.records, timed(), "records_per_s")
+    with ProcessPoolExecutor(max_workers=args.chunk_workers) as executor:
+        result["parallel_records_per_s"] = args.records / timed(executor=executor)
+    for field, near_duplicates in (("dedup_records_per_s", False), ("near_dedup_records_per_s", True)):
+        # A fresh index file each time, so no checkpoint or hash carries over between cases
+        dedup = DedupIndex(workdir / f"{field}.sqlite3", near_duplicates=near_duplicates,
+                           near_dup_threshold=chunk_jsonl.config.NEAR_DUPLICATE_THRESHOLD)
+        try:
+            result[field] = args.records / timed(dedup)
+        finally:
+            dedup.close()
+    return result
+
+
+def bench_embed(args, db):
+    started = time.perf_counter()
+    model = db.embedding_model
+    load_ms = (time.perf_counter() - started) * 1000.0
+
+    rng = random.Random(args.seed)
+    texts = [synthetic.paragraph(rng, 6) for _ in range(args.texts)]
+    model.embed_documents(texts[:args.warmup])
+    started = time.perf_counter()
+    model.embed_documents(texts)
+    result = _throughput(len(texts), time.perf_counter() - started, "texts_per_s")
+
+    queries = synthetic.make_queries(args.queries, args.seed + 3)
+    result["query_p50_ms"] = _latencies(model.embed_query, queries, args.warmup)["p50_ms"]
+    result["load_ms"] = load_ms
+    result["backend"] = model.backend
+    if model.backend != "torch":
+        result["parity_min_cosine"] = model.parity_check(texts[:args.queries])["min_cosine"]
+    return result
+
+
+def bench_ingest(workdir: Path, args, db):
+    files = [str(synthetic.write_chunks_jsonl(workdir / "chunks" / f"bench_{i}_chunks.jsonl",
+                                              args.docs // args.files, args.seed + i))
+             for i in range(args.files)]
+    started = time.perf_counter()
+    db.add_documents_from_jsonl(files)
+    elapsed = time.perf_counter() - started
+    if config.ENABLE_HYBRID_SEARCH:
+        db.build_lexical_index(files)
+    return _throughput(db.collection.count(), elapsed, "docs_per_s")
+
+
+def bench_retrieve(args, db):
+    queries = synthetic.make_queries(args.queries, args.seed)
+    return _latencies(lambda q: db.query_documents(q, config.TOP_K_RESULTS), queries, args.warmup)
+
+
+def bench_quantized(args, db):
+    """Recall against float32 and latency of the int8 and binary stores built from the ingested collection"""
+    from src.quantized_store import recall_report
+
+    queries = synthetic.make_queries(args.queries, args.seed + 2)
+    embeddings = list(db.embedding_model.embed_documents(queries))
+    k = config.TOP_K_RESULTS
+    result = {}
+    for quantization in ("int8", "binary"):
+        store = db.build_quantized_store(quantization, db.quantized_store_path() + f"_{quantization}_bench")
+        report = recall_report(store, embeddings, k, [k, 10 * k, config.QUANTIZED_RESCORE_CANDIDATES])
+        result[f"{quantization}_compression"] = report["compression"]
+        for depth, recall in report["recall"].items():
+            result[f"{quantization}_recall_at_{k}_rescore_{depth}"] = recall
+        latency = _latencies(lambda e: store.search(e, k, config.QUANTIZED_RESCORE_CANDIDATES), embeddings, args.warmup)
+        result[f"{quantization}_search_p50_ms"] = latency["p50_ms"]
+        result[f"{quantization}_search_p95_ms"] = latency["p95_ms"]
+    return result
+
+
+def bench_rag(args, stub):
+    from src.rag_pipeline import RAGPipeline
+
+    queries = synthetic.make_queries(args.queries, args.seed + 1)
+    # Cold start: pipeline construction, model warm-up and the first answer
+    started = time.perf_counter()
+    rag = RAGPipeline()
+    rag.warm_up()
+    rag.query(queries[0])
+    cold_ms = (time.perf_counter() - started) * 1000.0
+
+    result = _latencies(rag.query, queries, args.warmup)
+    result["cold_first_query_ms"] = cold_ms
+    result["stub_tokens_per_second"] = stub.tokens_per_second
+    result["stub_response_tokens"] = stub.response_tokens
+    return result
+
+
+def run(args):
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding_model": config.EMBEDDING_MODEL,
+            "embedding_backend": args.embedding_backend,
+            "vector_backend": args.vector_backend,
+            "args": vars(args)
+        },
+        "metrics": {}
+    }
+    metrics = results["metrics"]
+    selected = set(args.stages)
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as tmp, \
+            StubOllamaServer(tokens_per_second=args.token_rate, response_tokens=args.response_tokens,
+                             first_token_ms=args.first_token_ms) as stub:
+        workdir = Path(tmp)
+        _isolate(workdir, stub.url, args)
+        # Progress prints from the pipeline would drown the report
+        quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+
+        with quiet:
+            if "startup" in selected:
+                metrics["main.py"] = bench_startup(workdir, args)
+            if "clean" in selected:
+                metrics["clean_pdfs.process_pdf"] = bench_clean(workdir, args)
+            if "chunk" in selected:
+                metrics["chunk_jsonl.process_single_file"] = bench_chunk(workdir, args)
+
+            if selected & {"embed", "ingest", "retrieve", "quantized", "rag"}:
+                from src.database import ResearchPaperDatabase
+                db = ResearchPaperDatabase()
+                if "embed" in selected:
+                    metrics["EmbeddingModel.embed_documents"] = bench_embed(args, db)
+                if selected & {"ingest", "retrieve", "quantized", "rag"}:
+                    metrics["ResearchPaperDatabase.add_documents_from_jsonl"] = bench_ingest(workdir, args, db)
+                if "retrieve" in selected:
+                    metrics["ResearchPaperDatabase.query_documents"] = bench_retrieve(args, db)
+                if "quantized" in selected:
+                    metrics["QuantizedVectorStore.search"] = bench_quantized(args, db)
+                if "rag" in selected:
+                    metrics["RAGPipeline.query"] = bench_rag(args, stub)
+
+    return results
+
+
+def compare(metrics, baseline, tolerance: float):
+    """Return (name, field, baseline, current, change) rows and the regressed subset"""
+    rows, regressions = [], []
+    for name, values in metrics.items():
+        base = baseline.get(name, {})
+        for field, current in values.items():
+            higher_is_better = field.endswith("_per_s") or "_recall_" in field
+            lower_is_better = field.endswith("_ms")
+            if not (higher_is_better or lower_is_better) or not base.get(field):
+                continue
+            change = (current - base[field]) / base[field]
+            row = (name, field, base[field], current, change)
+            rows.append(row)
+            if (higher_is_better and change < -tolerance) or (lower_is_better and change > tolerance):
+                regressions.append(row)
+    return rows, regressions
+
+
+def print_report(results, rows, regressions):
+    print("=" * 80)
+    print("BENCHMARK RESULTS")
+    print("=" * 80)
+    for name, values in results["metrics"].items():
+        print(name)
+        for field, value in values.items():
+            if field.endswith("_per_s") or field.endswith("_ms"):
+                print(f"  {field:<34} {value:12.2f}")
+            elif "_recall_" in field or field == "parity_min_cosine" or field.endswith("_compression"):
+                print(f"  {field:<34} {value:12.3f}")
+
+    if rows:
+        print("\nAgainst baseline:")
+        for name, field, base, current, change in rows:
+            flag = "  REGRESSION" if (name, field, base, current, change) in regressions else ""
+            print(f"  {name}.{field}: {base:.2f} -> {current:.2f} ({change:+.1%}){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, retrieval and generation")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--output", help="Write results JSON here (default: stdout only)")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--no-baseline", action="store_true", help="Report results without comparing to a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed relative slowdown before a metric counts as regressed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup-runs", type=int, default=3, help="Fresh processes timed per main.py mode")
+    parser.add_argument("--pdfs", type=int, default=5)
+    parser.add_argument("--pages-per-pdf", type=int, default=20)
+    parser.add_argument("--records", type=int, default=500, help="Cleaned page records to chunk")
+    parser.add_argument("--chunk-workers", type=int, default=os.cpu_count() or 1,
+                        help="Process pool size for the parallel chunking case")
+    parser.add_argument("--embedding-backend", choices=["torch", "onnx", "onnx-int8"], default=config.EMBEDDING_BACKEND)
+    parser.add_argument("--vector-backend", choices=["chroma", "memmap"], default=config.VECTOR_BACKEND)
+    parser.add_argument("--texts", type=int, default=1000, help="Texts to embed")
+    parser.add_argument("--docs", type=int, default=2000, help="Chunks to ingest")
+    parser.add_argument("--files", type=int, default=2, help="Chunk files the ingested docs are split over")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Stub Ollama tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=128)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's progress output")
+    args = parser.parse_args()
+
+    baseline_path = Path(args.baseline)
+    if not baseline_path.exists() and not args.save_baseline and not args.no_baseline:
+        parser.error(f"no baseline at {baseline_path}; record one on the reference machine with "
+                     f"--save-baseline, or pass --no-baseline to only report the numbers")
+
+    results = run(args)
+
+    rows, regressions = [], []
+    if baseline_path.exists() and not args.save_baseline and not args.no_baseline:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results["metrics"], baseline.get("metrics", {}), args.tolerance)
+        results["baseline"] = {
+            "path": str(baseline_path),
+            "tolerance": args.tolerance,
+            "regressions": [{"metric": f"{name}.{field}", "baseline": base, "current": current, "change": change}
+                            for name, field, base, current, change in regressions]
+        }
+
+    print_report(results, rows, regressions)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {baseline_path}")
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
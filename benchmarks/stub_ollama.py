@@ -0,0 +1,156 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY_WORDS = "The provided context states that the minimum clear width depends on occupancy load .".split()
+
+
+class StubOllamaServer:
+    """
+    Minimal stand-in for the Ollama HTTP API, so generation can be benchmarked offline.
+
+    /api/chat answers every request with `response_tokens` tokens, emitted at
+    `tokens_per_second` after `first_token_ms` of simulated prompt processing, either
+    streamed as NDJSON or as a single JSON object, like the real server.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_second=50.0,
+                 response_tokens=128, first_token_ms=100.0):
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.first_token_ms = first_token_ms
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def tokens(self):
+        return [REPLY_WORDS[i % len(REPLY_WORDS)] + " " for i in range(self.response_tokens)]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-stub"})
+                elif self.path == "/api/tags":
+                    self._send_json({"models": []})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path != "/api/chat":
+                    self._send_json({"error": "not found"}, 404)
+                    return
+                stub.requests += 1
+                self._chat(request)
+
+            def _message(self, model, content, done, **extra):
+                return dict({
+                    "model": model,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "message": {"role": "assistant", "content": content},
+                    "done": done
+                }, **extra)
+
+            def _chat(self, request):
+                model = request.get("model", "stub")
+                tokens = stub.tokens()
+                interval = 1.0 / stub.tokens_per_second if stub.tokens_per_second > 0 else 0.0
+                started = time.perf_counter_ns()
+                time.sleep(stub.first_token_ms / 1000.0)
+                prompt_done = time.perf_counter_ns()
+
+                def final():
+                    now = time.perf_counter_ns()
+                    return dict(done_reason="stop", total_duration=now - started,
+                                prompt_eval_count=sum(len(m.get("content", "")) // 4
+                                                      for m in request.get("messages", [])),
+                                prompt_eval_duration=prompt_done - started,
+                                eval_count=len(tokens), eval_duration=now - prompt_done)
+
+                if not request.get("stream", True):
+                    time.sleep(interval * len(tokens))
+                    self._send_json(self._message(model, "".join(tokens), True, **final()))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def write(payload):
+                    data = (json.dumps(payload) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+
+                for token in tokens:
+                    write(self._message(model, token, False))
+                    time.sleep(interval)
+                write(self._message(model, "", True, **final()))
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub Ollama /api/chat endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=128)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    server = StubOllamaServer(args.host, args.port, args.tokens_per_second,
+                              args.response_tokens, args.first_token_ms)
+    print(f"Stub Ollama listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+import random
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+# Domain vocabulary, so tokenization, BM25 and embedding costs resemble the real corpus
+VOCABULARY = """
+building code fire resistance rating egress stair corridor occupancy load structural
+steel concrete timber masonry beam column slab foundation footing seismic wind load
+daylight ventilation thermal insulation facade curtain wall glazing parapet roof
+courtyard atrium setback floor area ratio zoning plot coverage accessibility ramp
+handrail threshold sustainable passive cooling rainwater harvesting brick lime mortar
+plaster aggregate cement reinforcement durability acoustic fenestration vernacular
+housing case study urban plaza landscape circulation clearance sprinkler compartment
+IS 875 NBC 2016 clause 4.2.1 table 3-101-01 minimum width height span deflection
+""".split()
+
+QUERY_TEMPLATES = [
+    "What is the minimum {} for {}?",
+    "How does {} affect {} in residential buildings?",
+    "Explain the requirements for {} and {}",
+    "Which code clause covers {} near the {}?",
+    "Compare {} with {} for hot and dry climates",
+]
+
+
+def sentence(rng, min_words=8, max_words=24):
+    words = rng.choices(VOCABULARY, k=rng.randint(min_words, max_words))
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng, sentences=6):
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+
+def make_queries(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(QUERY_TEMPLATES).format(*rng.sample(VOCABULARY, 2)) for _ in range(count)]
+
+
+def write_pdfs(directory, count, pages_per_pdf, seed=0):
+    """Write text-only PDFs (no OCR path) and return their paths"""
+    rng = random.Random(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        doc = fitz.open()
+        for _ in range(pages_per_pdf):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), paragraph(rng, 12), fontsize=9)
+        path = directory / f"synthetic_{i:03d}.pdf"
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def write_cleaned_jsonl(path, records, seed=0, category="misc"):
+    """Write page records in the format clean_pdfs.py produces"""
+    rng = random.Random(seed)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(records):
+            f.write(json.dumps({
+                "doc_id": f"synthetic_{i // 20:03d}",
+                "file": f"synthetic_{i // 20:03d}.pdf",
+                "category": category,
+                "page_number": i % 20 + 1,
+                "text": paragraph(rng, rng.randint(8, 40))
+            }) + "\n")
+    return path
+
+
+def write_chunks_jsonl(path, chunks, seed=0, category="misc"):
+    """Write chunk records in the format chunk_jsonl.py produces"""
+    rng = random.Random(seed)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(chunks):
+            f.write(json.dumps({
+                "doc_id": f"synthetic_{i // 50:03d}",
+                "file": f"synthetic_{i // 50:03d}.pdf",
+                "category": category,
+                "page_span": [i % 50 + 1, i % 50 + 1],
+                "text": paragraph(rng, rng.randint(4, 10)),
+                "chunk_hash": f"{seed:04d}{i:028x}"
+            }) + "\n")
+    return path
@@ -1,3 +1,6 @@
+import time
+_STARTED = time.perf_counter()
+
 import argparse
 import sys
 import os
@@ -5,42 +8,149 @@ import os
 # Add the src directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.rag_pipeline import RAGPipeline
+# Only the config is imported up front; each mode imports what it needs (torch and the
+# embedding model are not loaded for --help or --stats)
 from src.config import config
 
+def print_sources(sources, detailed=True):
+    """Print retrieved sources, in full for --query or as a short list in interactive mode"""
+    print("\n" + "="*80)
+    print("SOURCES:" if detailed else "TOP SOURCES:")
+    print("="*80)
+    if detailed:
+        for source in sources:
+            print(f"Source {source['source_id']}:")
+            print(f"  Title: {source['title']}")
+            print(f"  Authors: {', '.join(source['authors']) if source['authors'] else 'Unknown'}")
+            print(f"  Year: {source['year']}")
+            if source.get('category'):
+                print(f"  Category: {source['category']}")
+            if source.get('pages'):
+                print(f"  Pages: {source['pages']}")
+            print(f"  Confidence: {source['confidence']}")
+            print()
+    else:
+        for source in sources[:3]:  # Show top 3 sources
+            print(f"• {source['title']} ({source['year']})")
+        print()
+
+def print_timings(timings):
+    """Print a query's per-stage timings on one line"""
+    stages = [f"{key[:-3]} {value:.0f} ms" for key, value in timings.items() if key.endswith("_ms")]
+    if "tokens_per_s" in timings:
+        stages.append(f"{timings['tokens_per_s']:.1f} tok/s")
+    print("Timings: " + " | ".join(stages))
+
+def run_query(rag, query, stream=True, detailed=True, timings=False, filters=None):
+    """Answer one query, printing tokens as they arrive when streaming"""
+    if not stream:
+        result = rag.query(query, filters=filters)
+        
+        print("\n" + "="*80)
+        print("ANSWER:")
+        print("="*80)
+        print(result["answer"])
+        print_sources(result["sources"], detailed)
+        if timings:
+            print_timings(result["timings"])
+        return
+
+    # Sources are known as soon as retrieval finishes, so show them before the answer
+    for event in rag.stream_query(query, filters=filters):
+        if event["type"] == "sources":
+            print_sources(event["sources"], detailed)
+            print("="*80)
+            print("ANSWER:")
+            print("="*80)
+        elif event["type"] == "token":
+            print(event["text"], end="", flush=True)
+        elif event["type"] == "done" and timings:
+            print()
+            print_timings(event["result"]["timings"])
+    print("\n")
+
 def main():
     parser = argparse.ArgumentParser(description="Architecture Research Paper RAG System")
     parser.add_argument("--init", action="store_true", help="Initialize database with research papers")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="With --init, drop the collection and re-embed every chunk "
+                             "(only the --category shards when SHARD_BY_CATEGORY is on)")
     parser.add_argument("--query", type=str, help="Query to search in research papers")
     parser.add_argument("--interactive", action="store_true", help="Start interactive mode")
+    parser.add_argument("--serve", action="store_true", help="Run the RAG HTTP service")
+    parser.add_argument("--host", type=str, default=config.SERVER_HOST, help="Host for --serve")
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT, help="Port for --serve")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for the full answer instead of streaming tokens")
+    parser.add_argument("--stats", action="store_true", help="Print database statistics (does not load the embedding model)")
+    parser.add_argument("--save-model", action="store_true",
+                        help="Save the embedding model to EMBEDDING_MODEL_PATH for hub-free warm starts")
+    parser.add_argument("--timings", action="store_true", help="Print cold-start and per-stage query timings")
+    parser.add_argument("--category", nargs="+", help="Only search these categories (e.g. building_codes)")
+    parser.add_argument("--doc-id", nargs="+", help="Only search these documents")
+    parser.add_argument("--year", nargs="+", type=int, help="Only search documents from these years")
+    parser.add_argument("--embedding-parity", action="store_true",
+                        help="Compare the configured embedding backend against torch on stored chunks")
+    parser.add_argument("--quantization-report", choices=["int8", "binary"],
+                        help="Report recall@k of int8/binary search against exact float32 search")
     
     args = parser.parse_args()
     
+    if args.serve:
+        # The service owns its own long-lived pipeline
+        from src.server import run_server
+        run_server(args.host, args.port)
+        return
+
+    if args.stats:
+        from src.database import ResearchPaperDatabase
+        print(f"Database Statistics: {ResearchPaperDatabase().get_collection_stats()}")
+        return
+
+    if args.save_model:
+        from src.embedding_utils import EmbeddingModel
+        EmbeddingModel(config.EMBEDDING_MODEL, cache_path=None).save_snapshot(config.EMBEDDING_MODEL_PATH)
+        return
+
+    if args.embedding_parity:
+        from src.database import ResearchPaperDatabase
+        db = ResearchPaperDatabase()
+        texts = [doc for doc in db.collection.get(limit=200, include=["documents"])["documents"] if doc]
+        report = db.embedding_model.parity_check(texts or ["minimum clear width of an exit stair"])
+        status = "OK" if report["passed"] else f"FAILED (below {config.EMBEDDING_PARITY_MIN_COSINE})"
+        print(f"{report['backend']} vs torch over {report['texts']} texts: "
+              f"min cosine {report['min_cosine']:.4f}, mean {report['mean_cosine']:.4f} - {status}")
+        return
+
+    if args.quantization_report:
+        from src.database import ResearchPaperDatabase
+        report = ResearchPaperDatabase().quantization_report(args.quantization_report)
+        print(f"{report['quantization']}: {report['bytes_per_vector']:.0f} bytes/vector "
+              f"({report['compression']:.0f}x smaller than float32), {report['queries']} queries, k={report['k']}")
+        for depth, recall in report["recall"].items():
+            print(f"  recall@{report['k']} rescoring {depth} candidates: {recall:.3f}")
+        return
+
+    if not (args.init or args.query or args.interactive):
+        parser.print_help()
+        return
+    
+    filters = {"category": args.category, "doc_id": args.doc_id, "year": args.year}
+
     # Initialize RAG pipeline
+    from src.rag_pipeline import RAGPipeline
     rag = RAGPipeline()
+    if args.query or args.interactive:
+        rag.warm_up()
+    if args.timings:
+        print(f"Cold start: ready after {time.perf_counter() - _STARTED:.2f}s")
     
     if args.init:
         # Initialize database
-        rag.initialize_database(config.JSONL_FILES)
+        rag.initialize_database(config.JSONL_FILES, rebuild=args.rebuild, categories=args.category)
     
     elif args.query:
         # Process single query
-        result = rag.query(args.query)
-        
-        print("\n" + "="*80)
-        print("ANSWER:")
-        print("="*80)
-        print(result["answer"])
-        print("\n" + "="*80)
-        print("SOURCES:")
-        print("="*80)
-        for source in result["sources"]:
-            print(f"Source {source['source_id']}:")
-            print(f"  Title: {source['title']}")
-            print(f"  Authors: {', '.join(source['authors']) if source['authors'] else 'Unknown'}")
-            print(f"  Year: {source['year']}")
-            print(f"  Confidence: {source['confidence']}")
-            print()
+        run_query(rag, args.query, stream=not args.no_stream, timings=args.timings, filters=filters)
     
     elif args.interactive:
         # Interactive mode
@@ -60,21 +170,8 @@ def main():
             elif not query:
                 continue
             
-            result = rag.query(query)
-            
-            print("\n" + "="*80)
-            print("ANSWER:")
-            print("="*80)
-            print(result["answer"])
-            print("\n" + "="*80)
-            print("TOP SOURCES:")
-            print("="*80)
-            for source in result["sources"][:3]:  # Show top 3 sources
-                print(f"• {source['title']} ({source['year']})")
-            print()
+            run_query(rag, query, stream=not args.no_stream, detailed=False, timings=args.timings,
+                      filters=filters)
     
-    else:
-        parser.print_help()
-
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
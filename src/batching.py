@@ -0,0 +1,145 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import config
+
+
+class MicroBatcher:
+    """
+    Funnel concurrent single-item calls into batched calls.
+
+    Callers block in submit() while a background thread collects items that arrive
+    within `window_ms` of the first one (up to `max_batch`), runs `batch_fn` once on
+    the whole list and hands each caller its own output.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 window_ms: float = config.QUERY_BATCH_WINDOW_MS,
+                 max_batch: int = config.QUERY_BATCH_MAX_SIZE,
+                 name: str = "micro-batcher"):
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+
+        self._pending: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Any:
+        future: Future = Future()
+        self._pending.put((item, future))
+        return future.result()
+
+    def close(self):
+        self._pending.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            first = self._pending.get()
+            if first is None:
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._pending.put(None)
+                    break
+                batch.append(item)
+
+            self._run(batch)
+
+    def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            outputs = self.batch_fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), output in zip(batch, outputs):
+            future.set_result(output)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0
+        }
+
+
+class QueryBatcher:
+    """
+    Micro-batch query embedding and retrieval for ResearchPaperDatabase.
+
+    Concurrent queries are embedded with one encode call, and their lookups are
+    issued as one multi-query collection.query per distinct filter; results fan back
+    out per caller.
+    """
+
+    def __init__(self, db, window_ms: float = config.QUERY_BATCH_WINDOW_MS,
+                 max_batch: int = config.QUERY_BATCH_MAX_SIZE):
+        self.db = db
+        self.embedder = MicroBatcher(self._embed_batch, window_ms, max_batch, name="query-embed-batcher")
+        self.searcher = MicroBatcher(self._search_batch, window_ms, max_batch, name="query-search-batcher")
+
+    def _embed_batch(self, queries: List[str]):
+        return list(self.db.embedding_model.embed_documents(queries))
+
+    def _search_batch(self, requests: List[tuple]):
+        # A where clause applies to the whole multi-query call, so group by filter
+        groups: Dict[str, List[int]] = {}
+        for i, (_, _, filters) in enumerate(requests):
+            groups.setdefault(json.dumps(filters, sort_keys=True), []).append(i)
+
+        outputs = [None] * len(requests)
+        for members in groups.values():
+            embeddings = [requests[i][0] for i in members]
+            max_results = max(requests[i][1] for i in members)
+            results = self.db.query_documents_batch(embeddings, max_results, requests[members[0]][2])
+            if results is None:
+                continue
+            for position, i in enumerate(members):
+                outputs[i] = _slice_results(results, position, requests[i][1])
+        return outputs
+
+    def embed(self, query: str):
+        return self.embedder.submit(query)
+
+    def search(self, query_embedding, n_results: int, filters: Optional[Dict[str, List[Any]]] = None):
+        return self.searcher.submit((query_embedding, n_results, filters or {}))
+
+    def close(self):
+        self.embedder.close()
+        self.searcher.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"embed": self.embedder.stats(), "search": self.searcher.stats()}
+
+
+def _slice_results(results: Dict[str, Any], index: int, n_results: int) -> Dict[str, Any]:
+    """Cut one query's top-n out of a multi-query Chroma result, keeping the single-query shape"""
+    sliced = {}
+    for key, value in results.items():
+        if isinstance(value, list) and len(value) > index and isinstance(value[index], list):
+            sliced[key] = [value[index][:n_results]]
+        else:
+            sliced[key] = value
+    return sliced
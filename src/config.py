@@ -4,6 +4,18 @@ from pathlib import Path
 class Config:
     # Embedding model
     EMBEDDING_MODEL = "multi-qa-MiniLM-L6-cos-v1"
+    EMBEDDING_BATCH_SIZE = 64               # texts per SentenceTransformer.encode forward pass
+    NORMALIZE_EMBEDDINGS = True             # unit-length vectors, so cosine == dot product
+    EMBEDDING_MODEL_PATH = "./models/embedding_model"  # local snapshot loaded without the hub when present (main.py --save-model)
+    EMBEDDING_BACKEND = "torch"             # "torch", "onnx" or "onnx-int8" (dynamically quantized ONNX, CPU only)
+    EMBEDDING_ONNX_INT8_TARGET = "avx2"     # onnx-int8 kernel set: "arm64", "avx2", "avx512" or "avx512_vnni"
+    EMBEDDING_THREADS = None                # intra-op threads per process for either runtime (None = runtime default)
+    EMBEDDING_PARITY_MIN_COSINE = 0.99      # lowest acceptable cosine to the torch embedding (main.py --embedding-parity)
+
+    # Persistent embedding cache, shared across collections and persist directories (None disables it)
+    EMBEDDING_CACHE_PATH = "./embedding_cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES = 500_000   # ~750 MB of 384-d float32 vectors
+    EMBEDDING_CACHE_TOUCH_INTERVAL_S = 3600 # a hit refreshes an entry's LRU timestamp at most this often
     
     # ChromaDB settings
     COLLECTION_NAME = "architecture_research_papers"
@@ -18,13 +30,79 @@ class Config:
         "C:\\Users\\Lenovo\\Documents\\GitHub\\Architect-RAG-LLM-Assistant\\chunks\\misc_chunks.jsonl"
     ]
     
+    # Ingest pipeline: documents per embed/upsert batch and batches buffered between stages
+    INGEST_BATCH_SIZE = 100
+    INGEST_QUEUE_SIZE = 4
+
     # Ollama settings
     OLLAMA_MODEL = "llama2"  # or "mistral", "codellama", etc.
     OLLAMA_BASE_URL = "http://localhost:11434"
+    OLLAMA_MAX_CONCURRENCY = 2              # generations the service sends to Ollama at once
+
+    # HTTP service (main.py --serve)
+    SERVER_HOST = "127.0.0.1"
+    SERVER_PORT = 8000
+    SERVER_WORKERS = 8                      # threads for embedding, retrieval and Ollama calls
+    SERVER_MAX_QUEUE = 32                   # requests allowed to wait for an Ollama slot before 503
+    SERVER_MAX_RESULTS = 50                 # larger n_results requests are clamped to this
+
+    # Micro-batching of concurrent query embeddings and lookups in the service
+    ENABLE_QUERY_BATCHING = True
+    QUERY_BATCH_WINDOW_MS = 5               # how long the first query waits for company
+    QUERY_BATCH_MAX_SIZE = 32
     
     # RAG settings
     TOP_K_RESULTS = 5
     CHUNK_SIZE = 512
     CHUNK_OVERLAP = 50
 
+    # Hybrid retrieval: BM25 over the same chunks, fused with dense hits by reciprocal rank
+    ENABLE_HYBRID_SEARCH = True
+    HYBRID_CANDIDATES = 20                  # hits taken from each retriever before fusion
+    RRF_K = 60
+
+    # Optional cross-encoder rerank: over-fetch, score on CPU, keep only the strong hits
+    ENABLE_RERANK = False
+    RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES = 50
+    RERANK_BATCH_SIZE = 16
+    RERANK_SCORE_CUTOFF = 0.0               # cross-encoder logit below which a hit is dropped
+    RERANK_KEEP_GAP = 4.0                   # drop hits scoring this far below the best one
+    RERANK_STOP_MARGIN = 3.0                # stop when a whole batch scores this far below the top-n
+    RERANK_TIME_BUDGET_S = 1.5
+
+    # Context packing: merge overlapping chunks, drop near-duplicates, fit the LLM's token budget
+    ENABLE_CONTEXT_PACKING = False          # needs CONTEXT_TOKENIZER; the budget is only real in the model's tokens
+    CONTEXT_TOKENIZER = None                # hub id or local path of OLLAMA_MODEL's tokenizer (e.g. a llama2 tokenizer)
+    CONTEXT_TOKEN_BUDGET = 1536             # llama2 has 4096; leaves room for the prompt and answer
+    CONTEXT_MIN_PASSAGE_TOKENS = 64         # smallest truncated passage worth sending
+    CONTEXT_DUPLICATE_THRESHOLD = 0.8       # shingle overlap at which a passage counts as a duplicate
+
+    # Answer cache in front of RAGPipeline.query
+    ENABLE_QUERY_CACHE = True
+    QUERY_CACHE_MAX_ENTRIES = 1024          # exact-match LRU size
+    QUERY_CACHE_SEMANTIC_ENTRIES = 512      # embeddings scanned by the semantic tier
+    QUERY_CACHE_TTL_SECONDS = 3600
+    QUERY_CACHE_SIMILARITY = 0.95           # cosine similarity needed to reuse a cached answer
+
+    # Vector store backend: "chroma" (incremental upserts) or "memmap" (bulk-built in one pass, memory-mapped, rebuilt on change)
+    VECTOR_BACKEND = "chroma"
+    VECTOR_INDEX = "auto"                   # memmap index: "flat", "ivf", "hnsw" or "auto" (flat up to VECTOR_INDEX_FLAT_MAX, IVF beyond)
+    VECTOR_INDEX_FLAT_MAX = 50_000          # largest corpus "auto" still searches exhaustively
+    IVF_PROBES = 16                         # IVF lists scanned per query (more = better recall, slower)
+    HNSW_M = 16                             # HNSW graph degree
+    HNSW_EF_CONSTRUCTION = 200              # HNSW build-time candidate list
+    HNSW_EF_SEARCH = 64                     # HNSW query-time candidate list
+
+    # Category sharding: one collection/index per Dataset_PDFs category, named {COLLECTION_NAME}_{category}
+    SHARD_BY_CATEGORY = False
+    SHARD_WORKERS = 4                       # shards synced in parallel by --init, and queried concurrently
+
+    # Quantized vector store: search int8/binary codes, rescore with float32 (None keeps Chroma's float index)
+    VECTOR_QUANTIZATION = None              # "int8" (4x smaller) or "binary" (32x smaller)
+    QUANTIZED_RESCORE_CANDIDATES = 100      # code-ranked candidates rescored against float32 vectors
+
+    # Instrumentation
+    TIMING_LOG_FILE = "./logs/rag_timings.jsonl"  # one JSON line of stage timings per query (None to disable)
+
 config = Config()
\ No newline at end of file
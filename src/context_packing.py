@@ -0,0 +1,154 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import config
+
+
+def _page_span(metadata: Dict[str, Any]):
+    start = metadata.get("page_start")
+    end = metadata.get("page_end", start)
+    if start is None:
+        return None
+    return int(start), int(end)
+
+
+def _find_overlap(a: str, b: str, min_chars: int = 30, max_chars: int = 2000) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b` (0 if shorter than min_chars)"""
+    tail = a[-max_chars:]
+    probe = b[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    pos = tail.find(probe)
+    while pos != -1:
+        if b.startswith(tail[pos:]):
+            return len(tail) - pos
+        pos = tail.find(probe, pos + 1)
+    return 0
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class _Passage:
+    def __init__(self, text: str, metadata: Dict[str, Any], source_id: int):
+        self.text = text
+        self.source_ids = [source_id]
+        self.group = metadata.get("doc_id") or metadata.get("source")
+        self.span = _page_span(metadata)
+
+    def try_merge(self, other: "_Passage") -> bool:
+        """Absorb `other` if it continues or precedes this passage in the same document"""
+        if not self.group or self.group != other.group:
+            return False
+
+        for first, second in ((self, other), (other, self)):
+            overlap = _find_overlap(first.text, second.text)
+            if overlap:
+                self.text = first.text + second.text[overlap:]
+                self._absorb(other)
+                return True
+
+        # No textual overlap, but the chunks sit on the same or neighbouring pages
+        if self.span and other.span and other.span[0] <= self.span[1] + 1 and self.span[0] <= other.span[1] + 1:
+            first, second = (self, other) if other.span[0] >= self.span[0] else (other, self)
+            self.text = first.text + "\n" + second.text
+            self._absorb(other)
+            return True
+        return False
+
+    def _absorb(self, other: "_Passage"):
+        self.source_ids += other.source_ids
+        if self.span and other.span:
+            self.span = (min(self.span[0], other.span[0]), max(self.span[1], other.span[1]))
+
+
+class ContextPacker:
+    """
+    Turn retrieved chunks into a compact prompt context.
+
+    Overlapping or adjacent chunks from the same document are merged (the chunker's
+    sliding windows overlap by OVERLAP tokens), near-duplicate passages are dropped,
+    and passages are added in relevance order until the token budget of the target
+    Ollama model is filled, as counted by that model's tokenizer.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str] = config.CONTEXT_TOKENIZER,
+                 token_budget: int = config.CONTEXT_TOKEN_BUDGET,
+                 duplicate_threshold: float = config.CONTEXT_DUPLICATE_THRESHOLD):
+        self.tokenizer_name = tokenizer_name
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self._tokenizer = None
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            try:
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+            except Exception as e:
+                print(f"Could not load tokenizer {self.tokenizer_name} ({e}); "
+                      f"estimating tokens from length, so the token budget is approximate")
+                self._tokenizer = False
+        return self._tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        if self.tokenizer:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return max(1, len(text) // 4)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        if self.tokenizer:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            return self.tokenizer.decode(ids).strip()
+        return text[:max_tokens * 4]
+
+    def _is_duplicate(self, shingles: set, kept: List[set]) -> bool:
+        if not shingles:
+            return True
+        for other in kept:
+            common = len(shingles & other)
+            # Jaccard for near-identical passages, containment for passages swallowed by another
+            if common / len(shingles | other) >= self.duplicate_threshold:
+                return True
+            if common / len(shingles) >= self.duplicate_threshold:
+                return True
+        return False
+
+    def pack(self, documents: List[str],
+             metadatas: Optional[List[Dict[str, Any]]] = None) -> List[Tuple[str, List[int]]]:
+        """
+        Return the packed passages, most relevant first, each paired with the
+        1-based positions in `documents` of the chunks it was built from.
+        """
+        metadatas = metadatas or [{}] * len(documents)
+
+        passages: List[_Passage] = []
+        for i, (document, metadata) in enumerate(zip(documents, metadatas)):
+            passage = _Passage(document, metadata or {}, i + 1)
+            if not any(kept.try_merge(passage) for kept in passages):
+                passages.append(passage)
+
+        packed, kept_shingles = [], []
+        remaining = self.token_budget
+        for passage in passages:
+            shingles = _shingles(passage.text)
+            if self._is_duplicate(shingles, kept_shingles):
+                continue
+
+            tokens = self.count_tokens(passage.text)
+            if tokens > remaining:
+                # Worth a truncated tail only if a meaningful slice still fits
+                if remaining >= config.CONTEXT_MIN_PASSAGE_TOKENS:
+                    packed.append((self._truncate(passage.text, remaining), passage.source_ids))
+                break
+
+            packed.append((passage.text, passage.source_ids))
+            kept_shingles.append(shingles)
+            remaining -= tokens
+
+        return packed
@@ -1,63 +1,120 @@
-import chromadb
 from chromadb.utils.embedding_functions import EmbeddingFunction
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Iterator, Optional, Tuple
+from itertools import islice
+import hashlib
 import json
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from tqdm import tqdm
 
 from src.embedding_utils import EmbeddingModel
+from src.lexical_index import BM25Index
+from src.quantized_store import QuantizedVectorStore, recall_report
+from src.vector_store import ShardedVectorStore, VectorStore, create_vector_store
+from src.filters import build_where, extract_year
 from src.config import config
 
 
+_SENTINEL = object()
+
+# Bump when the stored chunk metadata changes shape or chunk text/hashes change; older
+# collections are rebuilt on sync. 3: chunks keep their source casing (new chunk_hash values)
+MANIFEST_VERSION = 3
+
+
+def _chain_first(first, rest):
+    """Put an already-consumed first item back in front of an iterator"""
+    yield first
+    yield from rest
+
+
+def _batched(iterable, batch_size: int):
+    """Yield lists of up to batch_size items without materializing the iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
 # Wrapper so we can plug your EmbeddingModel into Chroma
 class CustomEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, embedding_model: EmbeddingModel):
-        self.embedding_model = embedding_model
+    def __init__(self, get_model: Callable[[], EmbeddingModel]):
+        # A getter rather than the model, so the model is only loaded once Chroma needs it
+        self.get_model = get_model
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        # One batched encode per Chroma batch; rows are handed over as float32 arrays
+        return list(self.get_model().embed_documents(input))
 
-    def __call__(self, texts: List[str]) -> List[List[float]]:
-        return [self.embedding_model.embed_text(t) for t in texts]
+
+def shard_category(file_path: str) -> str:
+    """Category shard a chunk file belongs to ("misc_chunks.jsonl" -> "misc")"""
+    name = os.path.basename(file_path)
+    for suffix in ("_chunks.jsonl", ".jsonl"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
 
 
 class ResearchPaperDatabase:
-    def __init__(self):
-        # ✅ Persistent client (no more deprecated Settings)
-        self.client = chromadb.PersistentClient(path=config.PERSIST_DIRECTORY)
+    def __init__(self, collection_name: Optional[str] = None, parent: Optional["ResearchPaperDatabase"] = None):
+        self.collection_name = collection_name or config.COLLECTION_NAME
+        # Category shards borrow their parent's embedding model
+        self.parent = parent
 
-        # Initialize embedding model
-        self.embedding_model = EmbeddingModel(config.EMBEDDING_MODEL)
+        # Embedding model is loaded on first use (stats and lookups by id never need it)
+        self._embedding_model = None
+        self._embedding_lock = threading.Lock()
 
         # Wrap into Chroma-compatible embedding function
-        self.embedding_fn = CustomEmbeddingFunction(self.embedding_model)
+        self.embedding_fn = CustomEmbeddingFunction(lambda: self.embedding_model)
 
-        # Get or create collection
-        self.collection = self._get_or_create_collection()
+        # Bumped on every write from this process; see data_version()
+        self._writes = 0
 
-    def _get_or_create_collection(self):
-        """Get existing collection or create a new one"""
-        try:
-            collection = self.client.get_collection(
-                name=config.COLLECTION_NAME,
-                embedding_function=self.embedding_fn
+        # With SHARD_BY_CATEGORY, one child database per category and a fan-out view over them
+        self.shards: Dict[str, ResearchPaperDatabase] = {}
+        if config.SHARD_BY_CATEGORY and parent is None:
+            for category in self._load_shard_registry():
+                self.shards[category] = self._open_shard(category)
+            self.collection: VectorStore = ShardedVectorStore(
+                {category: shard.collection for category, shard in self.shards.items()}
             )
-            print(f"Loaded existing collection: {config.COLLECTION_NAME}")
-        except:
-            collection = self.client.create_collection(
-                name=config.COLLECTION_NAME,
-                embedding_function=self.embedding_fn,
-                metadata={"hnsw:space": "cosine"}
-            )
-            print(f"Created new collection: {config.COLLECTION_NAME}")
+        else:
+            # Chroma collection or bulk-built memmap index, per config.VECTOR_BACKEND
+            self.collection: VectorStore = create_vector_store(self.embedding_fn, name=self.collection_name)
 
-        return collection
+        # Optional compact copy of the embeddings that serves lookups instead of Chroma's index
+        self.quantized = self.load_quantized_store() if config.VECTOR_QUANTIZATION and parent is None else None
 
-    def load_jsonl_file(self, file_path: str):
-        """Load and process a single JSONL file"""
-        import os
-        documents, metadatas, ids = [], [], []
+    @property
+    def embedding_model(self) -> EmbeddingModel:
+        if self.parent is not None:
+            return self.parent.embedding_model
+        if self._embedding_model is None:
+            with self._embedding_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = EmbeddingModel(config.EMBEDDING_MODEL,
+                                                           model_path=config.EMBEDDING_MODEL_PATH)
+        return self._embedding_model
+
+    def iter_jsonl_records(self, file_path: str) -> Iterator[Tuple[str, Dict[str, Any], str]]:
+        """Stream (document, metadata, id) tuples from a JSONL file one line at a time"""
+        source = os.path.basename(file_path)
+        seen_ids = set()
+        yielded = 0
 
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                for i, line in enumerate(tqdm(lines, desc=f"Processing {file_path}")):
+                for i, line in enumerate(f):
                     try:
                         data = json.loads(line.strip())
 
@@ -66,79 +123,578 @@ class ResearchPaperDatabase:
 
                         # ✅ Ensure metadata is non-empty (Chroma requirement)
                         if not metadata or not isinstance(metadata, dict) or len(metadata) == 0:
-                            metadata = {
-                                "source": os.path.basename(file_path),
-                                "line": i
-                            }
+                            metadata = self._chunk_metadata(data, source, i)
+
+                        metadata.setdefault("source", source)
 
                         if content and len(content.strip()) > 0:
-                            documents.append(content)
-                            metadatas.append(metadata)
-                            ids.append(f"{os.path.basename(file_path)}_{i}")
+                            # Content-addressed ids: regenerating a chunk file keeps ids stable
+                            chunk_hash = data.get('chunk_hash') or hashlib.md5(content.encode('utf-8')).hexdigest()
+                            doc_id = f"{source}_{chunk_hash}"
+                            if doc_id in seen_ids:
+                                continue
+                            seen_ids.add(doc_id)
+
+                            yielded += 1
+                            yield content, metadata, doc_id
 
                     except json.JSONDecodeError as e:
                         print(f"Error parsing line {i} in {file_path}: {e}")
                         continue
         except FileNotFoundError:
             print(f"File not found: {file_path}")
-            return [], [], []
+            return
 
-        return documents, metadatas, ids
+        if yielded == 0:
+            print(f"No valid documents found in {file_path}")
 
+    @staticmethod
+    def _chunk_metadata(data: Dict[str, Any], source: str, line: int) -> Dict[str, Any]:
+        """Chroma metadata from the top-level fields chunk_jsonl.py writes"""
+        metadata = {"source": source, "line": line}
+        for field in ("doc_id", "file", "category", "chunk_hash"):
+            if data.get(field):
+                metadata[field] = str(data[field])
 
-    def add_documents_from_jsonl(self, jsonl_files: List[str]):
-        """Add documents from multiple JSONL files to the database"""
-        all_documents, all_metadatas, all_ids = [], [], []
+        page_span = data.get('page_span')
+        if isinstance(page_span, (list, tuple)) and page_span:
+            metadata["page_start"] = int(page_span[0])
+            metadata["page_end"] = int(page_span[-1])
+
+        doc_id = metadata.get("doc_id")
+        if doc_id:
+            metadata["title"] = re.sub(r"[_\s]+", " ", doc_id).strip()
+        year = extract_year(doc_id, metadata.get("file"))
+        if year is not None:
+            metadata["year"] = year
+        return metadata
+
+    def load_jsonl_file(self, file_path: str):
+        """Load and process a single JSONL file"""
+        documents, metadatas, ids = [], [], []
+        for content, metadata, doc_id in self.iter_jsonl_records(file_path):
+            documents.append(content)
+            metadatas.append(metadata)
+            ids.append(doc_id)
+        return documents, metadatas, ids
 
+    def _iter_jsonl_files(self, jsonl_files: List[str]):
+        """Chain the records of several JSONL files into one stream"""
         for file_path in jsonl_files:
             print(f"Processing file: {file_path}")
-            documents, metadatas, ids = self.load_jsonl_file(file_path)
+            yield from self.iter_jsonl_records(file_path)
 
-            if documents:
-                all_documents.extend(documents)
-                all_metadatas.extend(metadatas)
-                all_ids.extend(ids)
-            else:
-                print(f"No valid documents found in {file_path}")
+    def _run_ingest_pipeline(self, records, batch_size: int = config.INGEST_BATCH_SIZE, write=None) -> int:
+        """
+        Parse -> embed -> upsert in fixed-size batches.
+
+        Each stage runs on its own thread and hands batches to the next one through a
+        bounded queue, so at most INGEST_QUEUE_SIZE batches per stage are ever held in
+        memory no matter how large the corpus is. `write` replaces the collection upsert
+        (bulk builds pass their writer's add).
+        """
+        write = write or self.collection.upsert
+        parsed_q = queue.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+        embedded_q = queue.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+        stop = threading.Event()
+        errors = []
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _SENTINEL
+
+        def parse_stage():
+            try:
+                for batch in _batched(records, batch_size):
+                    if not put(parsed_q, batch):
+                        return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(parsed_q, _SENTINEL)
+
+        def embed_stage():
+            try:
+                while True:
+                    batch = get(parsed_q)
+                    if batch is _SENTINEL:
+                        break
+                    documents, metadatas, ids = zip(*batch)
+                    embeddings = self.embedding_model.embed_documents(list(documents))
+                    if not put(embedded_q, (list(documents), list(metadatas), list(ids), embeddings)):
+                        return
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(embedded_q, _SENTINEL)
+
+        workers = [
+            threading.Thread(target=parse_stage, name="ingest-parse", daemon=True),
+            threading.Thread(target=embed_stage, name="ingest-embed", daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        added = 0
+        try:
+            with tqdm(desc="Adding documents to database", unit="doc") as progress:
+                while True:
+                    item = get(embedded_q)
+                    if item is _SENTINEL:
+                        break
+                    documents, metadatas, ids, embeddings = item
+                    write(documents, metadatas, ids, embeddings)
+                    added += len(ids)
+                    self._writes += 1
+                    progress.update(len(ids))
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+        if errors:
+            raise errors[0]
+        return added
+
+    def add_documents_from_jsonl(self, jsonl_files: List[str]):
+        """Add documents from multiple JSONL files to the database (bulk backends are rebuilt from just these)"""
+        if config.SHARD_BY_CATEGORY and self.parent is None:
+            self._map_shards(jsonl_files, lambda shard, files: shard.add_documents_from_jsonl(files))
+            return
+        if self.collection.supports_incremental:
+            added = self._run_ingest_pipeline(self._iter_jsonl_files(jsonl_files))
+        else:
+            added = self._bulk_build(jsonl_files)
 
-        if not all_documents:
+        if not added:
             print("No documents to add to the database")
             return
 
-        # Add in batches
-        batch_size = 100
-        for i in tqdm(range(0, len(all_documents), batch_size), desc="Adding documents to database"):
-            batch_docs = all_documents[i:i + batch_size]
-            batch_metas = all_metadatas[i:i + batch_size]
-            batch_ids = all_ids[i:i + batch_size]
-
-            self.collection.add(
-                documents=batch_docs,
-                metadatas=batch_metas,
-                ids=batch_ids
-            )
+        print(f"Added {added} documents to the database")
 
-        print(f"Added {len(all_documents)} documents to the database")
+    def _shard_registry_path(self) -> str:
+        return os.path.join(config.PERSIST_DIRECTORY, f"{self.collection_name}_shards.json")
 
-    def query_documents(self, query: str, n_results: int = config.TOP_K_RESULTS):
-        """Query the database for similar documents"""
+    def _load_shard_registry(self) -> List[str]:
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results
+            with open(self._shard_registry_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _open_shard(self, category: str) -> "ResearchPaperDatabase":
+        return ResearchPaperDatabase(f"{self.collection_name}_{category}", parent=self)
+
+    def _shard(self, category: str) -> "ResearchPaperDatabase":
+        """Child database for a category, registered (and created) on first use"""
+        if category not in self.shards:
+            self.shards[category] = self._open_shard(category)
+            self.collection.shards[category] = self.shards[category].collection
+            path = self._shard_registry_path()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(sorted(self.shards), f)
+            os.replace(path + ".tmp", path)
+        return self.shards[category]
+
+    def _map_shards(self, jsonl_files: List[str], fn, every_shard: bool = False) -> List[Any]:
+        """Run fn(shard, files) for each category's chunk files, SHARD_WORKERS categories at a time"""
+        # every_shard also visits registered shards with no files (so a sync can empty them)
+        groups: Dict[str, List[str]] = {category: [] for category in self.shards} if every_shard else {}
+        for file_path in jsonl_files:
+            groups.setdefault(shard_category(file_path), []).append(file_path)
+        shards = [(self._shard(category), files) for category, files in sorted(groups.items())]
+        with ThreadPoolExecutor(max_workers=max(1, min(config.SHARD_WORKERS, len(shards))),
+                                thread_name_prefix="shard-build") as executor:
+            results = list(executor.map(lambda item: fn(*item), shards))
+        self._writes += 1
+        return results
+
+    def _manifest_path(self) -> str:
+        return os.path.join(config.PERSIST_DIRECTORY, f"{self.collection_name}_manifest.json")
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        """Load the per-file ingest manifest (mtime, size and digest of each synced file)"""
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"version": MANIFEST_VERSION, "files": {}}
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        path = self._manifest_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _file_digest(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _existing_ids(self, source: str) -> set:
+        """Ids currently stored in the collection for one chunk file"""
+        existing = self.collection.get(where={"source": source}, include=[])
+        return set(existing["ids"])
+
+    def reset_collection(self, categories: Optional[List[str]] = None):
+        """Drop the collection and its manifest so the next sync rebuilds everything (or just these category shards)"""
+        if config.SHARD_BY_CATEGORY and self.parent is None:
+            for category in (categories or list(self.shards)):
+                if category in self.shards:
+                    self.shards[category].reset_collection()
+            self._writes += 1
+            return
+        self.collection.reset()
+        self._writes += 1
+        self._save_manifest({"version": MANIFEST_VERSION, "files": {}})
+
+    def sync_documents_from_jsonl(self, jsonl_files: List[str]):
+        """
+        Incrementally sync chunk files into the collection.
+
+        Files whose mtime/size (or, failing that, content digest) match the manifest are
+        skipped. For changed files only chunks whose chunk_hash is not yet stored are
+        embedded, and chunks that disappeared from the file are deleted. With
+        SHARD_BY_CATEGORY each category's files sync into their own shard, in parallel.
+        """
+        if config.SHARD_BY_CATEGORY and self.parent is None:
+            return sum(self._map_shards(jsonl_files, lambda shard, files: shard.sync_documents_from_jsonl(files),
+                                        every_shard=True))
+
+        manifest = self._load_manifest()
+        if manifest.get("version") != MANIFEST_VERSION:
+            # Chunks were stored with an older metadata layout or chunk format; rebuild them all at once
+            if self.collection.count() > 0:
+                print("Collection was built with an older chunk format, rebuilding...")
+                self.reset_collection()
+            manifest = {"version": MANIFEST_VERSION, "files": {}}
+        if not self.collection.supports_incremental:
+            return self._sync_bulk(jsonl_files, manifest)
+        total_added, total_deleted = 0, 0
+        changed_files = 0
+
+        # Files synced before but now deleted or dropped from the list: remove their chunks
+        present = {file_path for file_path in jsonl_files if os.path.exists(file_path)}
+        for file_path in [path for path in manifest["files"] if path not in present]:
+            source = os.path.basename(file_path)
+            if any(os.path.basename(path) == source for path in present):
+                # Same source name now comes from another path; that file's sync owns these ids
+                stale = []
+            else:
+                stale = list(self._existing_ids(source))
+            for i in range(0, len(stale), config.INGEST_BATCH_SIZE):
+                self.collection.delete(ids=stale[i:i + config.INGEST_BATCH_SIZE])
+                self._writes += 1
+            print(f"Removed {len(stale)} chunks of missing file: {file_path}")
+            del manifest["files"][file_path]
+            self._save_manifest(manifest)
+            changed_files += 1
+            total_deleted += len(stale)
+
+        for file_path in jsonl_files:
+            if not os.path.exists(file_path):
+                print(f"File not found: {file_path}")
+                continue
+
+            stat = os.stat(file_path)
+            entry = manifest["files"].get(file_path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                print(f"Unchanged, skipping: {file_path}")
+                continue
+
+            digest = self._file_digest(file_path)
+            if entry and entry["digest"] == digest:
+                print(f"Unchanged, skipping: {file_path}")
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                self._save_manifest(manifest)
+                continue
+
+            print(f"Syncing file: {file_path}")
+            source = os.path.basename(file_path)
+            existing = self._existing_ids(source)
+            current = set()
+
+            def new_records():
+                for content, metadata, doc_id in self.iter_jsonl_records(file_path):
+                    current.add(doc_id)
+                    if doc_id not in existing:
+                        yield content, metadata, doc_id
+
+            added = self._run_ingest_pipeline(new_records())
+
+            vanished = list(existing - current)
+            for i in range(0, len(vanished), config.INGEST_BATCH_SIZE):
+                self.collection.delete(ids=vanished[i:i + config.INGEST_BATCH_SIZE])
+                self._writes += 1
+
+            print(f"  {added} new, {len(vanished)} removed, {len(current) - added} unchanged chunks")
+            changed_files += 1
+            total_added += added
+            total_deleted += len(vanished)
+
+            manifest["files"][file_path] = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "digest": digest,
+                "chunks": len(current)
+            }
+            self._save_manifest(manifest)
+
+        print(f"Sync complete: {total_added} added, {total_deleted} removed")
+        return changed_files
+
+    def _bulk_build(self, jsonl_files: List[str]) -> int:
+        """Stream every chunk of these files into a fresh bulk-built store"""
+        writer = self.collection.bulk_writer()
+        added = self._run_ingest_pipeline(self._iter_jsonl_files(jsonl_files), write=writer.add)
+        writer.commit()
+        self._writes += 1
+        return added
+
+    def _sync_bulk(self, jsonl_files: List[str], manifest: Dict[str, Any]) -> int:
+        """
+        Sync for bulk-built stores: rebuild from all files as soon as any one changed.
+
+        Chunks that were embedded before are served by the embedding cache, so a
+        rebuild mostly costs the index build itself.
+        """
+        present = []
+        for file_path in jsonl_files:
+            if os.path.exists(file_path):
+                present.append(file_path)
+            else:
+                print(f"File not found: {file_path}")
+
+        files = {}
+        changed = [file_path for file_path in manifest["files"] if file_path not in present]
+        for file_path in present:
+            stat = os.stat(file_path)
+            entry = manifest["files"].get(file_path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                files[file_path] = entry
+                continue
+            digest = self._file_digest(file_path)
+            if not entry or entry["digest"] != digest:
+                changed.append(file_path)
+            files[file_path] = dict(entry or {}, mtime=stat.st_mtime, size=stat.st_size, digest=digest)
+
+        if not changed and (self.collection.count() or not present):
+            print(f"Unchanged, skipping rebuild of {len(present)} file(s)")
+            if files != manifest["files"]:
+                manifest["files"] = files
+                self._save_manifest(manifest)
+            return 0
+
+        print(f"Rebuilding {self.collection.name} store ({len(changed) or len(present)} changed file(s))...")
+        added = self._bulk_build(present)
+        for file_path, entry in files.items():
+            entry["chunks"] = len(self._existing_ids(os.path.basename(file_path)))
+        manifest["files"] = files
+        self._save_manifest(manifest)
+        print(f"Sync complete: {added} chunks in the rebuilt store")
+        return len(changed) or len(present)
+
+    def lexical_index_path(self) -> str:
+        return os.path.join(config.PERSIST_DIRECTORY, f"{self.collection_name}_bm25")
+
+    def build_lexical_index(self, jsonl_files: List[str]) -> BM25Index:
+        """Rebuild the BM25 index over the same chunk ids as the collection"""
+        print("Building lexical (BM25) index...")
+        records = (
+            (doc_id, content, metadata)
+            for content, metadata, doc_id in self._iter_jsonl_files(jsonl_files)
+        )
+        index = BM25Index.build(records)
+        index.save(self.lexical_index_path())
+        print(f"Lexical index built over {len(index)} chunks ({len(index.vocab)} terms)")
+        return index
+
+    def load_lexical_index(self):
+        """Open the on-disk BM25 index, or return None if it hasn't been built"""
+        path = self.lexical_index_path()
+        if not BM25Index.exists(path):
+            return None
+        return BM25Index.load(path)
+
+    def quantized_store_path(self) -> str:
+        return os.path.join(config.PERSIST_DIRECTORY, f"{self.collection_name}_quantized")
+
+    def _iter_collection_embeddings(self, batch_size: int = 1000):
+        """Page (ids, float32 embeddings, metadatas) batches out of the collection"""
+        for offset in range(0, self.collection.count(), batch_size):
+            page = self.collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page["ids"], np.asarray(page["embeddings"], dtype=np.float32), page["metadatas"]
+
+    def build_quantized_store(self, quantization: Optional[str] = None, path: Optional[str] = None):
+        """Rebuild the quantized store from the embeddings already in the collection"""
+        quantization = quantization or config.VECTOR_QUANTIZATION
+        path = path or self.quantized_store_path()
+        count = self.collection.count()
+        if not count:
+            return None
+
+        print(f"Building {quantization} vector store over {count} chunks...")
+        batches = self._iter_collection_embeddings()
+        first_batch = next(batches)
+        first = first_batch[1]
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        QuantizedVectorStore.build(tmp_path, _chain_first(first_batch, batches), count,
+                                   first.shape[1], quantization)
+
+        if path == self.quantized_store_path():
+            self.quantized = None  # drop the old memory maps before swapping directories
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        store = QuantizedVectorStore.load(path)
+        if path == self.quantized_store_path():
+            self.quantized = store
+        print(f"Quantized store built: {store.bytes_per_vector:.0f} bytes/vector "
+              f"({first.shape[1] * 4 / store.bytes_per_vector:.0f}x smaller than float32)")
+        return store
+
+    def load_quantized_store(self):
+        """Open the on-disk quantized store, or return None if it hasn't been built"""
+        path = self.quantized_store_path()
+        if not QuantizedVectorStore.exists(path):
+            return None
+        if not QuantizedVectorStore.has_facets(path):
+            # Built before filters were served from the store; initialize_database rebuilds it
+            print("Quantized store has no metadata facets; it will be rebuilt")
+            return None
+        return QuantizedVectorStore.load(path)
+
+    def quantization_report(self, quantization: Optional[str] = None, sample_size: int = 100,
+                            k: int = config.TOP_K_RESULTS) -> Dict[str, Any]:
+        """
+        Recall@k of quantized search against exact float32 search over this collection.
+
+        Queries are the first sentences of randomly sampled chunks, which behave like
+        real questions (their own chunk is a likely, but not guaranteed, top hit).
+        """
+        quantization = quantization or config.VECTOR_QUANTIZATION or "int8"
+        store = self.quantized
+        eval_path = None
+        if store is None or store.quantization != quantization:
+            eval_path = self.quantized_store_path() + f"_{quantization}_eval"
+        try:
+            if eval_path:
+                store = self.build_quantized_store(quantization, eval_path)
+            sample = random.Random(0).sample(store.ids, min(sample_size, len(store)))
+            documents = self.collection.get(ids=sample, include=["documents"])["documents"]
+            queries = [document.split(". ")[0] for document in documents if document]
+            embeddings = list(self.embedding_model.embed_documents(queries))
+            depths = sorted({k, 2 * k, 5 * k, 10 * k, 20 * k, config.QUANTIZED_RESCORE_CANDIDATES})
+            return recall_report(store, embeddings, k, depths)
+        finally:
+            if eval_path:
+                store = None  # release the memory maps before deleting the files
+                shutil.rmtree(eval_path, ignore_errors=True)
+                shutil.rmtree(eval_path + ".tmp", ignore_errors=True)
+
+    def _query_quantized(self, query_embedding, n_results: int, where: Optional[Dict[str, Any]]):
+        """Chroma-shaped single-query result served from the quantized store"""
+        hits = self.quantized.search(query_embedding, n_results, config.QUANTIZED_RESCORE_CANDIDATES, where)
+        found = self.get_documents([doc_id for doc_id, _ in hits])
+        hits = [(doc_id, distance) for doc_id, distance in hits if doc_id in found]
+        return {
+            "ids": [[doc_id for doc_id, _ in hits]],
+            "documents": [[found[doc_id][0] for doc_id, _ in hits]],
+            "metadatas": [[found[doc_id][1] for doc_id, _ in hits]],
+            "distances": [[distance for _, distance in hits]]
+        }
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """Fetch {id: (document, metadata)} for the given ids"""
+        if not ids:
+            return {}
+        found = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return {
+            doc_id: (document, metadata)
+            for doc_id, document, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+
+    def query_documents(self, query: str, n_results: int = config.TOP_K_RESULTS, query_embedding=None,
+                        filters: Optional[Dict[str, List[Any]]] = None):
+        """
+        Query the database for similar documents.
+
+        `filters` (normalized, see src.filters) become a Chroma-style `where` clause, so the
+        search only ever considers chunks of the requested categories/documents/years.
+        """
+        where = build_where(filters)
+        try:
+            if query_embedding is None:
+                query_embedding = self.embedding_model.embed_query(query)
+            if self.quantized is not None:
+                return self._query_quantized(query_embedding, n_results, where)
+            return self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where
             )
-            return results
         except Exception as e:
             print(f"Error querying database: {e}")
             return None
 
+    def query_documents_batch(self, query_embeddings, n_results: int = config.TOP_K_RESULTS,
+                              filters: Optional[Dict[str, List[Any]]] = None):
+        """Look up several pre-embedded queries (sharing one filter) with a single collection.query call"""
+        try:
+            if self.quantized is not None:
+                where = build_where(filters)
+                results = [self._query_quantized(embedding, n_results, where) for embedding in query_embeddings]
+                return {key: [result[key][0] for result in results] for key in ("ids", "documents", "metadatas", "distances")}
+            return self.collection.query(
+                query_embeddings=list(query_embeddings),
+                n_results=n_results,
+                where=build_where(filters)
+            )
+        except Exception as e:
+            print(f"Error querying database: {e}")
+            return None
+
+    def data_version(self):
+        """Token that changes whenever the collection contents change (used to invalidate caches)"""
+        manifest_mtime = None
+        for db in [self, *self.shards.values()]:
+            try:
+                manifest_mtime = max(manifest_mtime or 0.0, os.path.getmtime(db._manifest_path()))
+            except OSError:
+                pass
+        writes = self._writes + sum(shard._writes for shard in self.shards.values())
+        return (writes, self.collection.count(), manifest_mtime)
+
     def get_collection_stats(self):
         """Get statistics about the collection"""
         try:
             count = self.collection.count()
             return {
                 "total_documents": count,
-                "collection_name": config.COLLECTION_NAME
+                "collection_name": self.collection_name,
+                **self.collection.describe()
             }
         except:
             return {"error": "Collection not available"}
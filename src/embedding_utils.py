@@ -1,26 +1,269 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from src.config import config
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Weight dtype of each onnx-int8 target (as in optimum's AutoQuantizationConfig); the exporter
+# and the hub name quantized files after it, e.g. onnx/model_quint8_avx2.onnx
+_INT8_WEIGHT_DTYPES = {"arm64": "qint8", "avx2": "quint8", "avx512": "qint8", "avx512_vnni": "qint8"}
+
+
+def _int8_onnx_suffix(target):
+    if target not in _INT8_WEIGHT_DTYPES:
+        raise ValueError(f"Unknown onnx-int8 target '{target}' (expected one of {', '.join(_INT8_WEIGHT_DTYPES)})")
+    return f"{_INT8_WEIGHT_DTYPES[target]}_{target}"
+
+
+class EmbeddingCache:
+    """Persistent float32 embedding store keyed by (model name, text digest), backed by SQLite"""
+
+    # SQLite caps the number of bound parameters per statement
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path, max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES,
+                 touch_interval=config.EMBEDDING_CACHE_TOUCH_INTERVAL_S):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, digest)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        self._count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def digest(text):
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get_many(self, model, digests):
+        """Return {digest: vector} for every digest that is cached"""
+        found = {}
+        unique = list(dict.fromkeys(digests))
+        now = time.time()
+        stale = []
+        with self._lock:
+            for i in range(0, len(unique), self._QUERY_CHUNK):
+                chunk = unique[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT digest, vector, last_used FROM embeddings WHERE model = ? AND digest IN ({placeholders})",
+                    [model, *chunk]
+                ).fetchall()
+                for digest, vector, last_used in rows:
+                    found[digest] = np.frombuffer(vector, dtype=np.float32)
+                    if now - last_used >= self.touch_interval:
+                        stale.append((now, model, digest))
+            # Reads stay read-only unless an entry's recency is older than touch_interval
+            if stale:
+                self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND digest = ?", stale)
+                self.conn.commit()
+            self.hits += sum(1 for d in digests if d in found)
+            self.misses += sum(1 for d in digests if d not in found)
+        return found
+
+    def put_many(self, model, items):
+        """Store (digest, vector) pairs, evicting the least recently used entries past max_entries"""
+        now = time.time()
+        rows = [(model, digest, np.asarray(vector, dtype=np.float32).tobytes(), now) for digest, vector in items]
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, digest, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._count += self.conn.total_changes - before
+            if self.max_entries and self._count > self.max_entries:
+                # Evict down to 90% so we don't pay for an eviction on every insert
+                excess = self._count - int(self.max_entries * 0.9)
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE (model, digest) IN "
+                    "(SELECT model, digest FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self.conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
 
 class EmbeddingModel:
-    def __init__(self, model_name="multi-qa-MiniLM-L6-cos-v1"):
-        print(f"Loading embedding model: {model_name}")
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="multi-qa-MiniLM-L6-cos-v1",
+                 batch_size=config.EMBEDDING_BATCH_SIZE,
+                 normalize=config.NORMALIZE_EMBEDDINGS,
+                 cache_path=config.EMBEDDING_CACHE_PATH,
+                 model_path=None,
+                 backend=config.EMBEDDING_BACKEND,
+                 threads=config.EMBEDDING_THREADS):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}' (expected one of {', '.join(EMBEDDING_BACKENDS)})")
+
+        self.model_name = model_name
+        self.model_path = model_path
+        self.backend = backend
+        # Backends (and int8 kernel targets) produce slightly different vectors, so each gets its own cache entries
+        self.cache_key = model_name if backend == "torch" else f"{model_name}:{backend}"
+        if backend == "onnx-int8":
+            self.cache_key += f":{config.EMBEDDING_ONNX_INT8_TARGET}"
+
+        # A saved snapshot loads straight from disk, with no hub resolution
+        local = model_path if model_path and os.path.isdir(model_path) else None
+        print(f"Loading embedding model: {model_name} ({backend}" + (f", snapshot {local})" if local else ")"))
+        self.model = self._load(local or model_name, local is not None, backend, threads)
         self.dimension = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
         print(f"Embedding model loaded with dimension: {self.dimension}")
-    
+
+    @staticmethod
+    def _load(source, local, backend, threads):
+        # Deferred: importing sentence_transformers pulls in torch
+        from sentence_transformers import SentenceTransformer
+
+        kwargs = {"local_files_only": True} if local else {}
+        if backend == "torch":
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            return SentenceTransformer(source, **kwargs)
+
+        import onnxruntime
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+            session_options.inter_op_num_threads = 1
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+
+        if backend == "onnx":
+            exported = not local or os.path.exists(os.path.join(source, "onnx", "model.onnx"))
+            model = SentenceTransformer(source, backend="onnx", model_kwargs=model_kwargs, **kwargs)
+            if not exported:
+                # Keep the on-the-fly export so the next load skips it
+                model.save(source)
+            return model
+
+        suffix = _int8_onnx_suffix(config.EMBEDDING_ONNX_INT8_TARGET)
+        file_name = f"onnx/model_{suffix}.onnx"
+        if local and not os.path.exists(os.path.join(source, file_name)):
+            # Quantize the float ONNX model once, into the snapshot
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            print(f"Quantizing ONNX model for {config.EMBEDDING_ONNX_INT8_TARGET} into {source}")
+            float_model = EmbeddingModel._load(source, local, "onnx", threads)
+            export_dynamic_quantized_onnx_model(float_model, config.EMBEDDING_ONNX_INT8_TARGET, source,
+                                                file_suffix=suffix)
+        return SentenceTransformer(source, backend="onnx", model_kwargs=dict(model_kwargs, file_name=file_name), **kwargs)
+
+    def _encode(self, texts, batch_size):
+        embeddings = self.model.encode(
+            list(texts),
+            batch_size=batch_size or self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def encode(self, texts, batch_size=None, normalize=None):
+        """Embed a batch of texts in one call, returning a float32 (n, dim) matrix"""
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        if self.cache is None:
+            embeddings = self._encode(texts, batch_size)
+        else:
+            # Cache raw vectors; normalization is applied on the way out
+            digests = [EmbeddingCache.digest(t) for t in texts]
+            cached = self.cache.get_many(self.cache_key, digests)
+            missing = [i for i, d in enumerate(digests) if d not in cached]
+
+            embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+            if missing:
+                computed = self._encode([texts[i] for i in missing], batch_size)
+                for row, i in enumerate(missing):
+                    cached[digests[i]] = computed[row]
+                self.cache.put_many(self.cache_key, [(digests[i], computed[row]) for row, i in enumerate(missing)])
+            for i, d in enumerate(digests):
+                embeddings[i] = cached[d]
+
+        if self.normalize if normalize is None else normalize:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings
+
     def embed_text(self, text):
         """Convert text to embedding vector"""
         if isinstance(text, str):
-            return self.model.encode(text).tolist()
+            return self.encode(text)[0].tolist()
         elif isinstance(text, list):
-            return self.model.encode(text).tolist()
+            return self.encode(text).tolist()
         else:
             raise ValueError("Input must be string or list of strings")
     
     def embed_query(self, query):
         """Embed a single query"""
-        return self.embed_text(query)
+        return self.encode(query)[0]
     
     def embed_documents(self, documents):
         """Embed multiple documents"""
-        return self.embed_text(documents)
\ No newline at end of file
+        return self.encode(documents)
+
+    def save_snapshot(self, path):
+        """Serialize the model so later runs can load it with model_path"""
+        self.model.save(path)
+        print(f"Embedding model snapshot saved to {path}")
+
+    def parity_check(self, texts, reference=None, min_cosine=config.EMBEDDING_PARITY_MIN_COSINE):
+        """
+        Compare this backend's embeddings with the torch model's on the same texts.
+
+        Returns per-text cosine statistics and whether every text reached `min_cosine`;
+        both sides bypass the cache so the runtimes themselves are compared.
+        """
+        if reference is None:
+            reference = EmbeddingModel(self.model_name, cache_path=None, model_path=self.model_path, backend="torch")
+        texts = list(texts)
+        ours = self._encode(texts, None)
+        theirs = reference._encode(texts, None)
+        ours /= np.maximum(np.linalg.norm(ours, axis=1, keepdims=True), 1e-12)
+        theirs /= np.maximum(np.linalg.norm(theirs, axis=1, keepdims=True), 1e-12)
+        cosines = (ours * theirs).sum(axis=1)
+        return {
+            "backend": self.backend,
+            "texts": len(texts),
+            "min_cosine": float(cosines.min()) if len(texts) else 1.0,
+            "mean_cosine": float(cosines.mean()) if len(texts) else 1.0,
+            "passed": bool(len(texts) == 0 or cosines.min() >= min_cosine)
+        }
+
+    def cache_stats(self):
+        """Hit/miss counters of the persistent embedding cache"""
+        return self.cache.stats() if self.cache else {"enabled": False}
@@ -0,0 +1,49 @@
+import re
+from typing import Any, Dict, List, Optional
+
+# Chunk metadata fields that queries can be restricted to
+FILTER_FIELDS = ("category", "doc_id", "year")
+
+YEAR_PATTERN = re.compile(r"(?<!\d)(?:19|20)\d{2}(?!\d)")
+
+
+def extract_year(*names: str) -> Optional[int]:
+    """First plausible publication year in a document id or file name ("NBC_2016_Vol1" -> 2016)"""
+    for name in names:
+        match = YEAR_PATTERN.search(name or "")
+        if match:
+            return int(match.group())
+    return None
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Canonical form of a filter dict: {field: sorted list of accepted values}.
+
+    Each field accepts a single value or a list of values; empty fields are dropped
+    and years are coerced to int, so equal filters always compare (and cache) equal.
+    """
+    normalized = {}
+    for field, value in (filters or {}).items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown filter '{field}' (expected one of {', '.join(FILTER_FIELDS)})")
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        values = [v for v in values if v is not None and v != ""]
+        if field == "year":
+            values = [int(v) for v in values]
+        else:
+            values = [str(v) for v in values]
+        if values:
+            normalized[field] = sorted(set(values))
+    return normalized
+
+
+def build_where(filters: Optional[Dict[str, List[Any]]]) -> Optional[Dict[str, Any]]:
+    """Translate normalized filters into a Chroma `where` clause (None when unfiltered)"""
+    clauses = [
+        {field: values[0]} if len(values) == 1 else {field: {"$in": values}}
+        for field, values in (filters or {}).items()
+    ]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
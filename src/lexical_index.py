@@ -0,0 +1,178 @@
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.filters import FILTER_FIELDS
+
+# Keeps section numbers and code ids ("3-101-01", "4.2.1", "4-2") as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+# "is" is deliberately kept: it names Indian Standards ("IS 875"), and BM25's idf copes with it
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in it its of on or that the this to was were which with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into BM25 terms"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Compact on-disk BM25 inverted index over the same chunks as the vector collection.
+
+    Postings are stored CSR-style as flat NumPy arrays (per-term offsets into doc-index
+    and term-frequency arrays) and memory-mapped on load, so opening the index is cheap
+    and only the postings of query terms are ever touched.
+
+    The filterable metadata fields are kept as one code per document and field (with
+    the distinct values in terms.json), so searches can honour the same filters as the
+    vector store.
+    """
+
+    def __init__(self, ids: List[str], vocab: Dict[str, int], offsets: np.ndarray,
+                 postings_docs: np.ndarray, postings_tfs: np.ndarray, doc_lens: np.ndarray,
+                 facets: Optional[Dict[str, Tuple[np.ndarray, List[Any]]]] = None,
+                 k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_lens = doc_lens
+        self.facets = facets or {}
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_len = float(doc_lens.mean()) if len(doc_lens) else 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, records: Iterable[Tuple[str, str, Dict[str, Any]]]) -> "BM25Index":
+        """Build from (id, text, metadata) triples in one streaming pass"""
+        ids, vocab = [], {}
+        term_ids, doc_idx, tfs, doc_lens = array("i"), array("i"), array("H"), array("i")
+        facet_codes = {field: array("i") for field in FILTER_FIELDS}
+        facet_values = {field: {} for field in FILTER_FIELDS}
+
+        for doc_id, text, metadata in records:
+            terms = tokenize(text)
+            index = len(ids)
+            ids.append(doc_id)
+            doc_lens.append(len(terms))
+            for field in FILTER_FIELDS:
+                value = metadata.get(field)
+                codes = facet_values[field]
+                facet_codes[field].append(-1 if value is None else codes.setdefault(value, len(codes)))
+            for term, tf in Counter(terms).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_idx.append(index)
+                tfs.append(min(tf, 65535))
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        counts = np.bincount(term_ids, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        facets = {
+            field: (np.frombuffer(facet_codes[field], dtype=np.int32).copy(), list(facet_values[field]))
+            for field in FILTER_FIELDS
+        }
+        return cls(
+            ids, vocab, offsets,
+            np.frombuffer(doc_idx, dtype=np.int32)[order],
+            np.frombuffer(tfs, dtype=np.uint16)[order],
+            np.frombuffer(doc_lens, dtype=np.int32).copy(),
+            facets
+        )
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "postings_docs.npy"), self.postings_docs)
+        np.save(os.path.join(directory, "postings_tfs.npy"), self.postings_tfs)
+        np.save(os.path.join(directory, "doc_lens.npy"), self.doc_lens)
+        for field, (codes, _) in self.facets.items():
+            np.save(os.path.join(directory, f"facet_{field}.npy"), codes)
+        with open(os.path.join(directory, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": self.ids,
+                "vocab": self.vocab,
+                "facets": {field: values for field, (_, values) in self.facets.items()}
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        with open(os.path.join(directory, "terms.json"), "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode="r")
+        facets = {
+            field: (np.asarray(load(f"facet_{field}.npy")), values)
+            for field, values in terms.get("facets", {}).items()
+        }
+        return cls(terms["ids"], terms["vocab"], load("offsets.npy"), load("postings_docs.npy"),
+                   load("postings_tfs.npy"), np.asarray(load("doc_lens.npy")), facets)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "terms.json"))
+
+    def _filter_mask(self, filters: Dict[str, List[Any]]) -> np.ndarray:
+        """Boolean mask of the documents matching every filter"""
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, values in filters.items():
+            if field not in self.facets:
+                # Index predates this field: nothing can be shown to match
+                return np.zeros(len(self.ids), dtype=bool)
+            codes, known = self.facets[field]
+            wanted = [code for code, value in enumerate(known) if value in values]
+            mask &= np.isin(codes, wanted)
+        return mask
+
+    def search(self, query: str, k: int = 10,
+               filters: Optional[Dict[str, List[Any]]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (id, BM25 score) pairs for a query, restricted to `filters` if given"""
+        n_docs = len(self.ids)
+        if n_docs == 0:
+            return []
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens / max(self.avg_doc_len, 1e-9))
+        for term in set(tokenize(query)):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            start, end = self.offsets[tid], self.offsets[tid + 1]
+            docs = np.asarray(self.postings_docs[start:end])
+            tf = np.asarray(self.postings_tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        if filters:
+            scores[~self._filter_mask(filters)] = 0.0
+
+        hits = np.flatnonzero(scores)
+        if len(hits) == 0:
+            return []
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Merge ranked id lists by summing 1 / (k + rank) across lists"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
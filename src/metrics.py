@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from src.config import config
+
+timing_logger = logging.getLogger("rag.timings")
+_timing_log_lock = threading.Lock()
+
+# Ollama reports durations in nanoseconds
+OLLAMA_DURATIONS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+OLLAMA_COUNTS = ("prompt_eval_count", "eval_count")
+
+# Histogram buckets in seconds, from a cached lookup to a long generation
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+
+
+class Trace:
+    """
+    Per-query timing spans.
+
+    Stages are timed with `span(name)`; repeated spans of the same name add up.
+    Generation stats (time to first token, tokens/s and Ollama's eval counters) are
+    recorded by the pipeline as they become known.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.llm: Dict[str, Any] = {}
+        self.tokens = 0
+        self.outcome = "generated"
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def record_ollama(self, response):
+        """Keep the eval counters from Ollama's final (done) response"""
+        for key in OLLAMA_DURATIONS:
+            value = response.get(key)
+            if value:
+                self.llm[key.replace("_duration", "_duration_ms")] = value / 1e6
+        for key in OLLAMA_COUNTS:
+            value = response.get(key)
+            if value is not None:
+                self.llm[key] = value
+
+    def tokens_per_second(self) -> Optional[float]:
+        """Decode rate from Ollama's counters, falling back to wall clock after the first token"""
+        if self.llm.get("eval_count") and self.llm.get("eval_duration_ms"):
+            return self.llm["eval_count"] / (self.llm["eval_duration_ms"] / 1000.0)
+        decode = self.spans.get("generate", 0.0) - self.spans.get("ttft", 0.0)
+        if self.tokens > 1 and decode > 0:
+            return (self.tokens - 1) / decode
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        timings = {f"{name}_ms": seconds * 1000.0 for name, seconds in self.spans.items()}
+        timings["total_ms"] = (time.perf_counter() - self.started) * 1000.0
+        if self.llm:
+            timings["llm"] = dict(self.llm)
+        rate = self.tokens_per_second()
+        if rate is not None:
+            timings["tokens_per_s"] = rate
+        return timings
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def render(self, name: str, labels: str = "") -> list:
+        sep = "," if labels else ""
+        lines = [f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}'
+                 for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide query metrics, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, _Histogram] = {}
+        self.tokens_per_second = _Histogram(RATE_BUCKETS)
+        self.queries: Dict[str, int] = {}
+        self.generated_tokens = 0
+        self.prompt_tokens = 0
+
+    def observe(self, timings: Dict[str, Any], outcome: str):
+        with self._lock:
+            self.queries[outcome] = self.queries.get(outcome, 0) + 1
+            for key, value in timings.items():
+                if key.endswith("_ms"):
+                    stage = key[:-3]
+                    self.stages.setdefault(stage, _Histogram(DURATION_BUCKETS)).observe(value / 1000.0)
+            if "tokens_per_s" in timings:
+                self.tokens_per_second.observe(timings["tokens_per_s"])
+            llm = timings.get("llm", {})
+            self.generated_tokens += llm.get("eval_count", 0)
+            self.prompt_tokens += llm.get("prompt_eval_count", 0)
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text format; `gauges` adds caller-owned values (names ending in _total are counters)"""
+        with self._lock:
+            lines = [
+                "# HELP rag_queries_total Queries answered, by outcome.",
+                "# TYPE rag_queries_total counter"
+            ]
+            lines += [f'rag_queries_total{{outcome="{outcome}"}} {count}' for outcome, count in self.queries.items()]
+
+            lines += [
+                "# HELP rag_stage_duration_seconds Time spent per pipeline stage.",
+                "# TYPE rag_stage_duration_seconds histogram"
+            ]
+            for stage, histogram in self.stages.items():
+                lines += histogram.render("rag_stage_duration_seconds", f'stage="{stage}"')
+
+            lines += [
+                "# HELP rag_llm_tokens_per_second Ollama decode rate per generation.",
+                "# TYPE rag_llm_tokens_per_second histogram"
+            ]
+            lines += self.tokens_per_second.render("rag_llm_tokens_per_second")
+
+            lines += [
+                "# HELP rag_llm_generated_tokens_total Tokens generated by Ollama (eval_count).",
+                "# TYPE rag_llm_generated_tokens_total counter",
+                f"rag_llm_generated_tokens_total {self.generated_tokens}",
+                "# HELP rag_llm_prompt_tokens_total Prompt tokens evaluated by Ollama (prompt_eval_count).",
+                "# TYPE rag_llm_prompt_tokens_total counter",
+                f"rag_llm_prompt_tokens_total {self.prompt_tokens}"
+            ]
+
+        for name, value in (gauges or {}).items():
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines += [f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def _configure_timing_log():
+    with _timing_log_lock:
+        if not config.TIMING_LOG_FILE or timing_logger.handlers:
+            return
+        os.makedirs(os.path.dirname(config.TIMING_LOG_FILE) or ".", exist_ok=True)
+        handler = logging.FileHandler(config.TIMING_LOG_FILE, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        timing_logger.addHandler(handler)
+        timing_logger.setLevel(logging.INFO)
+        timing_logger.propagate = False
+
+
+def record_query(query: str, timings: Dict[str, Any], outcome: str):
+    """Export one query's timings: Prometheus metrics plus a JSON log line"""
+    metrics.observe(timings, outcome)
+    _configure_timing_log()
+    timing_logger.info(json.dumps({
+        "ts": time.time(),
+        "query": query,
+        "outcome": outcome,
+        "timings": timings
+    }, ensure_ascii=False))
@@ -0,0 +1,205 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.vector_store import FACET_FIELDS, load_facets, where_rows
+
+QUANTIZATIONS = ("int8", "binary")
+
+# Set bits per byte value, for Hamming distances on packed binary codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Rows scored per block in the first pass, bounding the temporary float/xor buffers
+_BLOCK_ROWS = 65536
+
+
+class QuantizedVectorStore:
+    """
+    Compact on-disk copy of the collection's embeddings for low-memory search.
+
+    Vectors are stored twice: as int8 (one scale per row, 4x smaller) or sign-bit
+    binary codes (32x smaller) that are scanned in full, and as unit-length float32
+    rows that are memory-mapped and only read for the candidates the first pass
+    keeps. Both arrays are memory-mapped on load, so resident memory is the codes
+    plus whatever float rows recent queries touched. Metadata facets (rows per
+    filter value) are kept alongside, so filtered searches never ask the collection
+    which ids match.
+    """
+
+    def __init__(self, directory: str, ids: List[str], quantization: str, codes: np.ndarray,
+                 scales: Optional[np.ndarray], vectors: np.ndarray,
+                 facets: Optional[Dict[str, Dict[str, np.ndarray]]] = None):
+        self.directory = directory
+        self.ids = ids
+        self.rows = {doc_id: i for i, doc_id in enumerate(ids)}
+        self.quantization = quantization
+        self.codes = codes
+        self.scales = scales
+        self.vectors = vectors
+        self.facets = facets
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def bytes_per_vector(self) -> float:
+        """Resident bytes per chunk for the first pass (codes plus int8 scales)"""
+        per_row = self.codes.shape[1] * self.codes.dtype.itemsize
+        return per_row + (self.scales.dtype.itemsize if self.scales is not None else 0)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "ids.json"))
+
+    @staticmethod
+    def has_facets(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "facets.json"))
+
+    @classmethod
+    def build(cls, directory: str, batches: Iterable[Tuple[List[str], np.ndarray, List[Dict[str, Any]]]],
+              count: int, dimension: int, quantization: str = "int8") -> "QuantizedVectorStore":
+        """Stream (ids, float32 embeddings, metadatas) batches into the on-disk arrays"""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}' (expected one of {', '.join(QUANTIZATIONS)})")
+        os.makedirs(directory, exist_ok=True)
+
+        open_memmap = np.lib.format.open_memmap
+        vectors = open_memmap(os.path.join(directory, "vectors.npy"), mode="w+", dtype=np.float32,
+                              shape=(count, dimension))
+        if quantization == "int8":
+            codes = open_memmap(os.path.join(directory, "codes.npy"), mode="w+", dtype=np.int8,
+                                shape=(count, dimension))
+            scales = open_memmap(os.path.join(directory, "scales.npy"), mode="w+", dtype=np.float32,
+                                 shape=(count,))
+        else:
+            codes = open_memmap(os.path.join(directory, "codes.npy"), mode="w+", dtype=np.uint8,
+                                shape=(count, (dimension + 7) // 8))
+            scales = None
+
+        ids, row = [], 0
+        facets: Dict[str, Dict[str, List[int]]] = {field: {} for field in FACET_FIELDS}
+        for batch_ids, embeddings, metadatas in batches:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            end = row + len(batch_ids)
+            vectors[row:end] = embeddings
+            if quantization == "int8":
+                batch_scales = np.maximum(np.abs(embeddings).max(axis=1), 1e-12) / 127.0
+                codes[row:end] = np.round(embeddings / batch_scales[:, None]).astype(np.int8)
+                scales[row:end] = batch_scales
+            else:
+                codes[row:end] = np.packbits(embeddings > 0, axis=1)
+            for offset, metadata in enumerate(metadatas):
+                for field in FACET_FIELDS:
+                    if (metadata or {}).get(field) is not None:
+                        facets[field].setdefault(json.dumps(metadata[field]), []).append(row + offset)
+            ids.extend(batch_ids)
+            row = end
+
+        if row != count:
+            raise ValueError(f"Expected {count} vectors, got {row}")
+        for array in (vectors, codes, scales):
+            if array is not None:
+                array.flush()
+        with open(os.path.join(directory, "facets.json"), "w", encoding="utf-8") as f:
+            json.dump(facets, f)
+        # Written last: a directory without ids.json is never opened
+        with open(os.path.join(directory, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump({"quantization": quantization, "dimension": dimension, "ids": ids}, f)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "QuantizedVectorStore":
+        with open(os.path.join(directory, "ids.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode="r")
+        scales = load("scales.npy") if meta["quantization"] == "int8" else None
+        facets = load_facets(os.path.join(directory, "facets.json")) if cls.has_facets(directory) else None
+        return cls(directory, meta["ids"], meta["quantization"], load("codes.npy"), scales, load("vectors.npy"),
+                   facets)
+
+    def _first_pass(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Approximate similarity (higher is better) of the query to every (allowed) row"""
+        n_rows = len(self.ids) if rows is None else len(rows)
+        scores = np.empty(n_rows, dtype=np.float32)
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > 0)
+        for start in range(0, n_rows, _BLOCK_ROWS):
+            block = slice(start, min(start + _BLOCK_ROWS, n_rows))
+            index = block if rows is None else rows[block]
+            codes = np.asarray(self.codes[index])
+            if self.quantization == "int8":
+                scores[block] = (codes.astype(np.float32) @ query) * self.scales[index]
+            else:
+                # Negated Hamming distance, so larger is still better
+                scores[block] = -_POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32)
+        return scores
+
+    def search(self, query_embedding, k: int, rescore_candidates: int,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Return the top-k (id, cosine distance) pairs among the rows matching `where`.
+
+        The first pass ranks rows by their codes and keeps `rescore_candidates` of
+        them; those are rescored exactly against their float32 vectors.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        if where and self.facets is None:
+            raise ValueError("This quantized store has no metadata facets; rebuild it to filter")
+        rows = where_rows(self.facets, where)
+        n_rows = len(self.ids) if rows is None else len(rows)
+        if n_rows == 0 or k <= 0:
+            return []
+
+        scores = self._first_pass(query, rows)
+        keep = min(max(rescore_candidates, k), n_rows)
+        candidates = np.argpartition(-scores, keep - 1)[:keep]
+        if rows is not None:
+            candidates = rows[candidates]
+
+        # Sorted reads keep the memory-mapped float rows sequential on disk
+        candidates = np.sort(candidates)
+        similarities = np.asarray(self.vectors[candidates]) @ query
+        order = np.argsort(-similarities)[:k]
+        return [(self.ids[candidates[i]], float(1.0 - similarities[i])) for i in order]
+
+    def exact_search(self, query_embedding, k: int) -> List[str]:
+        """Float32 brute-force top-k ids, the baseline recall is measured against"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        similarities = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, len(self.ids))
+            similarities[start:end] = np.asarray(self.vectors[start:end]) @ query
+        k = min(k, len(self.ids))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        return [self.ids[i] for i in top[np.argsort(-similarities[top])]]
+
+
+def recall_report(store: QuantizedVectorStore, query_embeddings: Sequence[np.ndarray], k: int,
+                  rescore_candidates: Sequence[int]) -> Dict[str, object]:
+    """Recall@k of quantized search against exact float32 search, per rescoring depth"""
+    baseline = [set(store.exact_search(q, k)) for q in query_embeddings]
+    float_bytes = store.vectors.shape[1] * 4
+    report = {
+        "quantization": store.quantization,
+        "vectors": len(store),
+        "k": k,
+        "queries": len(baseline),
+        "bytes_per_vector": store.bytes_per_vector,
+        "float32_bytes_per_vector": float_bytes,
+        "compression": float_bytes / store.bytes_per_vector,
+        "recall": {}
+    }
+    for depth in rescore_candidates:
+        hits = sum(
+            len(expected & {doc_id for doc_id, _ in store.search(q, k, depth)})
+            for q, expected in zip(query_embeddings, baseline)
+        )
+        total = sum(len(expected) for expected in baseline)
+        report["recall"][str(depth)] = hits / total if total else 1.0
+    return report
@@ -0,0 +1,162 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.config import config
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivial rewrites share a key"""
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.rstrip("?!. ")
+
+
+class QueryCache:
+    """
+    Two-tier answer cache for RAGPipeline.query.
+
+    The exact tier is an LRU keyed on (normalized query, n_results, filters) and is
+    checked before the query is embedded. The semantic tier reuses an answer with the
+    same n_results and filters when a new query embedding is within
+    `similarity_threshold` cosine similarity of a cached one. Both tiers expire
+    entries after `ttl` seconds and are cleared whenever the collection's data
+    version changes.
+    """
+
+    def __init__(self,
+                 max_entries: int = config.QUERY_CACHE_MAX_ENTRIES,
+                 semantic_entries: int = config.QUERY_CACHE_SEMANTIC_ENTRIES,
+                 ttl: float = config.QUERY_CACHE_TTL_SECONDS,
+                 similarity_threshold: float = config.QUERY_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.semantic_entries = semantic_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        self._exact: "OrderedDict[Tuple[str, int, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._semantic: "OrderedDict[Tuple[str, int, str], Tuple[float, np.ndarray, Dict[str, Any]]]" = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _sync_generation(self, generation):
+        if generation != self._generation:
+            self._exact.clear()
+            self._semantic.clear()
+            self._generation = generation
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._exact.clear()
+            self._semantic.clear()
+
+    @staticmethod
+    def _key(query: str, n_results: int, filters: Optional[Dict[str, Any]]) -> Tuple[str, int, str]:
+        return normalize_query(query), n_results, json.dumps(filters or {}, sort_keys=True)
+
+    def get(self, query: str, n_results: int, query_embedding: Optional[np.ndarray] = None,
+            generation: Any = None, filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Return a cached result for the query, or None on a miss"""
+        result = self.get_exact(query, n_results, generation, filters)
+        if result is not None:
+            return result
+        return self.get_similar(query, n_results, query_embedding, generation, filters)
+
+    def get_exact(self, query: str, n_results: int, generation: Any = None,
+                  filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Exact-tier lookup, cheap enough to try before embedding the query (a miss is not counted)"""
+        key = self._key(query, n_results, filters)
+        now = time.monotonic()
+
+        with self._lock:
+            self._sync_generation(generation)
+
+            entry = self._exact.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._exact.move_to_end(key)
+                    self.exact_hits += 1
+                    return dict(result)
+                del self._exact[key]
+            return None
+
+    def get_similar(self, query: str, n_results: int, query_embedding: Optional[np.ndarray],
+                    generation: Any = None, filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Semantic-tier lookup once get_exact has missed; counts the miss if this one misses too"""
+        key = self._key(query, n_results, filters)
+        now = time.monotonic()
+
+        with self._lock:
+            self._sync_generation(generation)
+
+            if query_embedding is not None and self._semantic:
+                result = self._semantic_lookup(np.asarray(query_embedding, dtype=np.float32), key[1:], now)
+                if result is not None:
+                    self.semantic_hits += 1
+                    return dict(result)
+
+            self.misses += 1
+            return None
+
+    def _semantic_lookup(self, embedding: np.ndarray, scope: Tuple[int, str], now: float):
+        expired = [k for k, (expires_at, _, _) in self._semantic.items() if expires_at <= now]
+        for k in expired:
+            del self._semantic[k]
+
+        candidates = [(k, v) for k, v in self._semantic.items() if k[1:] == scope]
+        if not candidates:
+            return None
+
+        matrix = np.stack([v[1] for _, v in candidates])
+        norm = np.linalg.norm(embedding) or 1.0
+        similarities = matrix @ (embedding / norm)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        key, (_, _, result) = candidates[best]
+        self._semantic.move_to_end(key)
+        return result
+
+    def put(self, query: str, n_results: int, result: Dict[str, Any],
+            query_embedding: Optional[np.ndarray] = None, generation: Any = None,
+            filters: Optional[Dict[str, Any]] = None):
+        """Cache a result under the query's exact key and, if given, its embedding"""
+        key = self._key(query, n_results, filters)
+        expires_at = time.monotonic() + self.ttl
+
+        with self._lock:
+            self._sync_generation(generation)
+
+            self._exact[key] = (expires_at, dict(result))
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+            if query_embedding is not None:
+                embedding = np.asarray(query_embedding, dtype=np.float32)
+                embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+                self._semantic[key] = (expires_at, embedding, dict(result))
+                self._semantic.move_to_end(key)
+                while len(self._semantic) > self.semantic_entries:
+                    self._semantic.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "exact_entries": len(self._exact),
+                "semantic_entries": len(self._semantic),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses
+            }
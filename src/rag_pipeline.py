@@ -1,19 +1,61 @@
 import ollama
-from typing import List, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional
 from src.config import config
 from src.database import ResearchPaperDatabase
+from src.query_cache import QueryCache
+from src.batching import QueryBatcher
+from src.lexical_index import reciprocal_rank_fusion
+from src.reranker import CrossEncoderReranker
+from src.context_packing import ContextPacker
+from src.metrics import Trace, record_query
+from src.filters import normalize_filters
+
+NO_RESULTS = {
+    "answer": "No relevant research papers found for your query.",
+    "sources": [],
+    "context": []
+}
+
+def _format_pages(metadata: Dict[str, Any]) -> Optional[str]:
+    start, end = metadata.get('page_start'), metadata.get('page_end')
+    if start is None:
+        return None
+    return str(start) if end in (None, start) else f"{start}-{end}"
 
 class RAGPipeline:
-    def __init__(self):
+    def __init__(self, batch_queries: bool = False):
         self.db = ResearchPaperDatabase()
         self.ollama_client = ollama.Client(host=config.OLLAMA_BASE_URL)
+        self.cache = QueryCache() if config.ENABLE_QUERY_CACHE else None
+        # Only worth it with concurrent callers (the HTTP service)
+        self.batcher = QueryBatcher(self.db) if batch_queries else None
+        self.lexical = self.db.load_lexical_index() if config.ENABLE_HYBRID_SEARCH else None
+        self.reranker = CrossEncoderReranker() if config.ENABLE_RERANK else None
+        self.packer = None
+        if config.ENABLE_CONTEXT_PACKING:
+            if config.CONTEXT_TOKENIZER:
+                self.packer = ContextPacker(config.CONTEXT_TOKENIZER)
+            else:
+                print("Context packing is enabled but CONTEXT_TOKENIZER is not set; packing disabled")
     
-    def generate_response(self, query: str, context: List[str]) -> str:
-        """Generate response using Ollama with retrieved context"""
+    def warm_up(self):
+        """Load the embedding model and context tokenizer side by side, ahead of the first query"""
+        loaders = [lambda: self.db.embedding_model]
+        if self.packer:
+            loaders.append(lambda: self.packer.tokenizer)
+        with ThreadPoolExecutor(max_workers=len(loaders)) as pool:
+            list(pool.map(lambda load: load(), loaders))
+    
+    def _build_messages(self, query: str, context: List[str],
+                        references: Optional[List[List[int]]] = None) -> List[Dict[str, str]]:
+        """Build the Ollama chat messages for a query and its retrieved context"""
         
-        # Prepare the context
+        # Prepare the context, labelled with the source_id(s) each passage came from
+        references = references or [[i+1] for i in range(len(context))]
         context_text = "\n\n".join([
-            f"Reference {i+1}:\n{doc}" for i, doc in enumerate(context)
+            f"Reference {', '.join(map(str, ids))}:\n{doc}" for ids, doc in zip(references, context)
         ])
         
         # System prompt for architecture research
@@ -53,43 +95,198 @@ class RAGPipeline:
 
         Please provide a comprehensive answer citing relevant sections from the research papers."""
 
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def generate_response(self, query: str, context: List[str], trace: Optional[Trace] = None,
+                          references: Optional[List[List[int]]] = None) -> str:
+        """Generate response using Ollama with retrieved context"""
+        trace = trace or Trace()
         try:
-            response = self.ollama_client.chat(
-                model=config.OLLAMA_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
-            )
+            with trace.span("generate"):
+                response = self.ollama_client.chat(
+                    model=config.OLLAMA_MODEL,
+                    messages=self._build_messages(query, context, references)
+                )
+            trace.record_ollama(response)
+            # Without streaming, prefill as reported by Ollama is the closest to time-to-first-token
+            if "prompt_eval_duration_ms" in trace.llm:
+                prefill_ms = trace.llm.get("load_duration_ms", 0.0) + trace.llm["prompt_eval_duration_ms"]
+                trace.add("ttft", prefill_ms / 1000.0)
             
             return response['message']['content']
         
         except Exception as e:
+            trace.outcome = "error"
             return f"Error generating response: {str(e)}"
-    
-    def query(self, user_query: str, n_results: int = config.TOP_K_RESULTS) -> Dict[str, Any]:
-        """Complete RAG pipeline: retrieve and generate"""
+
+    def stream_response(self, query: str, context: List[str], trace: Optional[Trace] = None,
+                        references: Optional[List[List[int]]] = None) -> Iterator[str]:
+        """Yield response tokens from Ollama as they are generated"""
+        trace = trace or Trace()
+        started = time.perf_counter()
+        first_token = True
+        try:
+            stream = self.ollama_client.chat(
+                model=config.OLLAMA_MODEL,
+                messages=self._build_messages(query, context, references),
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.get('done'):
+                    trace.record_ollama(chunk)
+                token = chunk['message']['content']
+                if token:
+                    if first_token:
+                        trace.add("ttft", time.perf_counter() - started)
+                        first_token = False
+                    trace.tokens += 1
+                    yield token
         
-        # Step 1: Query the database
+        except Exception as e:
+            trace.outcome = "error"
+            yield f"Error generating response: {str(e)}"
+        finally:
+            trace.add("generate", time.perf_counter() - started)
+    
+    def record_timings(self, retrieval: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach the query's stage timings to its result and export them"""
+        trace = retrieval["trace"]
+        if result.get("cached"):
+            trace.outcome = "cached"
+        elif not result.get("sources"):
+            trace.outcome = "no_results"
+        result["timings"] = trace.to_dict()
+        record_query(retrieval["query"], result["timings"], trace.outcome)
+        return result
+
+    def _embed_query(self, user_query: str):
+        if self.batcher:
+            return self.batcher.embed(user_query)
+        return self.db.embedding_model.embed_query(user_query)
+
+    def _fuse_lexical(self, user_query: str, results: Dict[str, Any], n_results: int, n_candidates: int,
+                      filters: Optional[Dict[str, List[Any]]] = None):
+        """Reciprocal-rank-fuse dense hits with BM25 hits, returning a Chroma-shaped result"""
+        dense = {
+            doc_id: (document, metadata, distance)
+            for doc_id, document, metadata, distance in zip(
+                results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]
+            )
+        }
+        lexical_ids = [doc_id for doc_id, _ in self.lexical.search(user_query, n_candidates, filters)]
+        fused = reciprocal_rank_fusion([results['ids'][0], lexical_ids], k=config.RRF_K)[:n_results]
+
+        # BM25-only hits still need their text and metadata; they have no dense distance
+        fetched = self.db.get_documents([doc_id for doc_id in fused if doc_id not in dense])
+
+        ids, documents, metadatas, distances = [], [], [], []
+        for doc_id in fused:
+            if doc_id in dense:
+                document, metadata, distance = dense[doc_id]
+            elif doc_id in fetched:
+                document, metadata = fetched[doc_id]
+                distance = None
+            else:
+                continue  # lexical index is ahead of/behind the collection
+            ids.append(doc_id)
+            documents.append(document)
+            metadatas.append(metadata)
+            distances.append(distance)
+
+        return {"ids": [ids], "documents": [documents], "metadatas": [metadatas], "distances": [distances]}
+
+    def _rerank(self, user_query: str, results: Dict[str, Any], n_results: int):
+        """Keep only the best cross-encoder-scored candidates, in score order"""
+        kept = self.reranker.rerank(user_query, results['documents'][0], n_results)
+        return {
+            key: [[results[key][0][index] for index, _ in kept]]
+            for key in ("ids", "documents", "metadatas", "distances")
+            if results.get(key)
+        }
+
+    def retrieve(self, user_query: str, n_results: int = config.TOP_K_RESULTS,
+                 filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Retrieval half of the pipeline.
+
+        `filters` ({"category": ..., "doc_id": ..., "year": ...}, each a value or a list)
+        restrict both the vector and the lexical search to matching chunks.
+
+        Returns a dict with the retrieved context and sources, plus the query embedding
+        and data version that finish() needs to cache the generated answer and the
+        timing trace that generation adds to. "result" is already set when no
+        generation is needed (cache hit or nothing retrieved).
+        """
+        filters = normalize_filters(filters)
+        trace = Trace()
+        retrieval = {
+            "query": user_query,
+            "n_results": n_results,
+            "result": None,
+            "context": [],
+            "references": [],
+            "sources": [],
+            "query_embedding": None,
+            "generation": self.db.data_version() if self.cache else None,
+            "filters": filters,
+            "trace": trace
+        }
+
+        # Step 0: Answer from cache: the exact query before paying for the embedding,
+        # then a near-duplicate embedding
+        if self.cache:
+            with trace.span("cache"):
+                cached = self.cache.get_exact(user_query, n_results, retrieval["generation"], filters)
+            if cached is not None:
+                cached.update(query=user_query, cached=True)
+                retrieval["result"] = cached
+                return retrieval
+
+        with trace.span("embed"):
+            retrieval["query_embedding"] = self._embed_query(user_query)
+
+        if self.cache:
+            with trace.span("cache"):
+                cached = self.cache.get_similar(user_query, n_results, retrieval["query_embedding"],
+                                                retrieval["generation"], filters)
+            if cached is not None:
+                cached.update(query=user_query, cached=True)
+                retrieval["result"] = cached
+                return retrieval
+
+        # Step 1: Query the database (over-fetching when the hits get fused with BM25)
         print("Searching for relevant research papers...")
-        results = self.db.query_documents(user_query, n_results)
+        n_candidates = max(n_results, config.HYBRID_CANDIDATES) if self.lexical else n_results
+        if self.reranker:
+            n_candidates = max(n_candidates, config.RERANK_CANDIDATES)
+        with trace.span("retrieve"):
+            if self.batcher:
+                results = self.batcher.search(retrieval["query_embedding"], n_candidates, filters)
+            else:
+                results = self.db.query_documents(user_query, n_candidates,
+                                                  query_embedding=retrieval["query_embedding"], filters=filters)
+
+        if results and self.lexical is not None:
+            fused_depth = n_candidates if self.reranker else n_results
+            with trace.span("fuse"):
+                results = self._fuse_lexical(user_query, results, fused_depth, n_candidates, filters)
+
+        if results and self.reranker and results['documents'] and results['documents'][0]:
+            with trace.span("rerank"):
+                results = self._rerank(user_query, results, n_results)
         
-        if not results or not results['documents']:
-            return {
-                "answer": "No relevant research papers found for your query.",
-                "sources": [],
-                "context": []
-            }
+        if not results or not results['documents'] or not results['documents'][0]:
+            retrieval["result"] = dict(NO_RESULTS, query=user_query)
+            return retrieval
         
         # Extract retrieved documents
         retrieved_docs = results['documents'][0]
         metadatas = results['metadatas'][0]
         distances = results['distances'][0] if 'distances' in results else [0] * len(metadatas)
         
-        # Step 2: Generate response
-        print("Generating comprehensive answer...")
-        answer = self.generate_response(user_query, retrieved_docs)
-        
         # Prepare source information
         sources = []
         for i, (metadata, distance) in enumerate(zip(metadatas, distances)):
@@ -98,20 +295,92 @@ class RAGPipeline:
                 "title": metadata.get('title', 'Unknown Title'),
                 "authors": metadata.get('authors', []),
                 "year": metadata.get('year', 'Unknown'),
+                "category": metadata.get('category'),
+                "pages": _format_pages(metadata),
                 "confidence": f"{1 - distance:.3f}" if distance is not None else "N/A"
             }
             sources.append(source_info)
-        
-        return {
+
+        # Step 2: Merge/dedupe the hits and fit them into the LLM's token budget
+        if self.packer:
+            with trace.span("pack"):
+                packed = self.packer.pack(retrieved_docs, metadatas)
+            retrieval["context"] = [text for text, _ in packed]
+            retrieval["references"] = [ids for _, ids in packed]
+            # Only list the hits that made it into the prompt, under the ids the references use
+            used = {source_id for ids in retrieval["references"] for source_id in ids}
+            sources = [source for source in sources if source["source_id"] in used]
+        else:
+            retrieval["context"] = retrieved_docs
+            retrieval["references"] = [[source["source_id"]] for source in sources]
+        retrieval["sources"] = sources
+        return retrieval
+
+    def finish(self, retrieval: Dict[str, Any], answer: str) -> Dict[str, Any]:
+        """Assemble the result dict for a generated answer and cache it"""
+        result = {
             "answer": answer,
-            "sources": sources,
-            "context": retrieved_docs,
-            "query": user_query
+            "sources": retrieval["sources"],
+            "context": retrieval["context"],
+            "query": retrieval["query"]
         }
+        if self.cache and not answer.startswith("Error generating response"):
+            self.cache.put(retrieval["query"], retrieval["n_results"], result,
+                           retrieval["query_embedding"], retrieval["generation"], retrieval["filters"])
+        return self.record_timings(retrieval, result)
+
+    def query(self, user_query: str, n_results: int = config.TOP_K_RESULTS,
+              filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Complete RAG pipeline: retrieve and generate"""
+        retrieval = self.retrieve(user_query, n_results, filters)
+        if retrieval["result"] is not None:
+            return self.record_timings(retrieval, retrieval["result"])
+        
+        # Step 3: Generate response
+        print("Generating comprehensive answer...")
+        answer = self.generate_response(user_query, retrieval["context"], retrieval["trace"],
+                                        retrieval["references"])
+        return self.finish(retrieval, answer)
+
+    def stream_query(self, user_query: str, n_results: int = config.TOP_K_RESULTS,
+                     filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of query().
+
+        Yields a {"type": "sources"} event as soon as retrieval finishes, then one
+        {"type": "token"} event per generated token, and finally a {"type": "done"}
+        event carrying the same result dict query() would have returned.
+        """
+        retrieval = self.retrieve(user_query, n_results, filters)
+        result = retrieval["result"]
+        if result is not None:
+            result = self.record_timings(retrieval, result)
+            yield {"type": "sources", "sources": result["sources"], "cached": result.get("cached", False)}
+            yield {"type": "token", "text": result["answer"]}
+            yield {"type": "done", "result": result}
+            return
+
+        yield {"type": "sources", "sources": retrieval["sources"], "cached": False}
+
+        print("Generating comprehensive answer...")
+        tokens = []
+        for token in self.stream_response(user_query, retrieval["context"], retrieval["trace"],
+                                          retrieval["references"]):
+            tokens.append(token)
+            yield {"type": "token", "text": token}
+
+        yield {"type": "done", "result": self.finish(retrieval, "".join(tokens))}
     
-    def initialize_database(self, jsonl_files: List[str]):
-        """Initialize the database with research papers"""
+    def initialize_database(self, jsonl_files: List[str], rebuild: bool = False,
+                            categories: Optional[List[str]] = None):
+        """Initialize the database with research papers (`categories` limits a sharded rebuild)"""
         print("Initializing database with research papers...")
-        self.db.add_documents_from_jsonl(jsonl_files)
+        if rebuild:
+            self.db.reset_collection(categories)
+        changed = self.db.sync_documents_from_jsonl(jsonl_files)
+        if config.ENABLE_HYBRID_SEARCH and (changed or self.lexical is None):
+            self.lexical = self.db.build_lexical_index(jsonl_files)
+        if config.VECTOR_QUANTIZATION and (changed or self.db.quantized is None):
+            self.db.build_quantized_store()
         self.db.persist()
         print("Database initialization complete!")
\ No newline at end of file
@@ -0,0 +1,63 @@
+import time
+from typing import List, Tuple
+
+from src.config import config
+
+
+class CrossEncoderReranker:
+    """
+    Rescore retrieval candidates with a small CPU cross-encoder.
+
+    Candidates are scored in retrieval order, batch by batch. Scoring stops early
+    when the time budget runs out or when a whole batch scores RERANK_STOP_MARGIN
+    below the current top-n, since deeper candidates rarely beat clearly separated
+    leaders. Only candidates above RERANK_SCORE_CUTOFF and within RERANK_KEEP_GAP
+    of the best score are kept.
+    """
+
+    def __init__(self, model_name: str = config.RERANK_MODEL,
+                 batch_size: int = config.RERANK_BATCH_SIZE,
+                 score_cutoff: float = config.RERANK_SCORE_CUTOFF,
+                 keep_gap: float = config.RERANK_KEEP_GAP,
+                 stop_margin: float = config.RERANK_STOP_MARGIN,
+                 time_budget: float = config.RERANK_TIME_BUDGET_S):
+        # Deferred: importing sentence_transformers pulls in torch
+        from sentence_transformers import CrossEncoder
+
+        print(f"Loading reranker: {model_name}")
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.score_cutoff = score_cutoff
+        self.keep_gap = keep_gap
+        self.stop_margin = stop_margin
+        self.time_budget = time_budget
+
+    def rerank(self, query: str, documents: List[str], top_n: int) -> List[Tuple[int, float]]:
+        """Return (candidate index, score) pairs for the documents worth keeping, best first"""
+        if not documents:
+            return []
+
+        started = time.perf_counter()
+        scored: List[Tuple[int, float]] = []
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            scores = self.model.predict([(query, doc) for doc in batch], batch_size=self.batch_size,
+                                        show_progress_bar=False)
+            batch_scored = [(start + i, float(score)) for i, score in enumerate(scores)]
+            scored.extend(batch_scored)
+            scored.sort(key=lambda item: item[1], reverse=True)
+
+            if time.perf_counter() - started > self.time_budget:
+                break
+            if len(scored) > top_n and start > 0:
+                floor = scored[top_n - 1][1]
+                if max(score for _, score in batch_scored) < floor - self.stop_margin:
+                    break
+
+        best = scored[0][1]
+        kept = [
+            (index, score) for index, score in scored[:top_n]
+            if score >= self.score_cutoff and score >= best - self.keep_gap
+        ]
+        # Never hand the LLM an empty context when retrieval found something
+        return kept or scored[:1]
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from src.config import config
+from src.metrics import metrics
+from src.filters import FILTER_FIELDS, normalize_filters
+from src.query_cache import normalize_query
+from src.rag_pipeline import RAGPipeline
+
+
+class ServiceBusy(Exception):
+    """Raised when the Ollama queue is full"""
+
+
+class BadRequest(Exception):
+    """Raised for malformed requests"""
+
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class RAGService:
+    """
+    Long-running asyncio HTTP front end for RAGPipeline.
+
+    The embedding model and collection are loaded once. Embedding and retrieval run
+    concurrently on a thread pool, identical in-flight queries share one result, and
+    generation goes through a semaphore of OLLAMA_MAX_CONCURRENCY slots with at most
+    SERVER_MAX_QUEUE requests waiting for a slot.
+
+    Endpoints:
+        POST /query          {"query": ..., "n_results": ..., "filters": {"category": ...}} -> result JSON
+        POST /query/stream   same body -> NDJSON events (sources, token..., done)
+        GET  /stats          collection, cache and server counters
+        GET  /metrics        Prometheus text metrics (per-stage latency histograms)
+    """
+
+    def __init__(self, rag: Optional[RAGPipeline] = None,
+                 max_workers: int = config.SERVER_WORKERS,
+                 llm_concurrency: int = config.OLLAMA_MAX_CONCURRENCY,
+                 max_queue: int = config.SERVER_MAX_QUEUE):
+        self.rag = rag or RAGPipeline(batch_queries=config.ENABLE_QUERY_BATCHING)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag")
+        self.llm_concurrency = llm_concurrency
+        self.max_queue = max_queue
+
+        self._llm_slots = None
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        self.counters = {
+            "requests": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "errors": 0,
+            "llm_waiting": 0,
+            "llm_active": 0
+        }
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def _acquire_llm_slot(self):
+        if self.counters["llm_waiting"] >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise ServiceBusy(f"Generation queue is full ({self.max_queue} waiting)")
+        self.counters["llm_waiting"] += 1
+        try:
+            await self._llm_slots.acquire()
+        finally:
+            self.counters["llm_waiting"] -= 1
+        self.counters["llm_active"] += 1
+
+    def _release_llm_slot(self):
+        self.counters["llm_active"] -= 1
+        self._llm_slots.release()
+
+    async def _answer(self, query: str, n_results: int, filters: Dict[str, Any]) -> Dict[str, Any]:
+        retrieval = await self._run(self.rag.retrieve, query, n_results, filters)
+        if retrieval["result"] is not None:
+            return self.rag.record_timings(retrieval, retrieval["result"])
+
+        with retrieval["trace"].span("llm_queue"):
+            await self._acquire_llm_slot()
+        try:
+            answer = await self._run(self.rag.generate_response, query, retrieval["context"], retrieval["trace"],
+                                     retrieval["references"])
+        finally:
+            self._release_llm_slot()
+        return await self._run(self.rag.finish, retrieval, answer)
+
+    async def answer(self, query: str, n_results: int, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Answer a query, sharing the result with identical queries already in flight"""
+        filters = normalize_filters(filters)
+        key = (normalize_query(query), n_results, json.dumps(filters, sort_keys=True))
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.counters["coalesced"] += 1
+            return dict(await asyncio.shield(pending), query=query)
+
+        task = asyncio.ensure_future(self._answer(query, n_results, filters))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def stream(self, query: str, n_results: int, filters: Optional[Dict[str, Any]] = None):
+        """Async iterator over stream_query-style events; generation holds an Ollama slot"""
+        retrieval = await self._run(self.rag.retrieve, query, n_results, filters)
+        result = retrieval["result"]
+        if result is not None:
+            result = self.rag.record_timings(retrieval, result)
+            yield {"type": "sources", "sources": result["sources"], "cached": result.get("cached", False)}
+            yield {"type": "token", "text": result["answer"]}
+            yield {"type": "done", "result": result}
+            return
+
+        yield {"type": "sources", "sources": retrieval["sources"], "cached": False}
+
+        with retrieval["trace"].span("llm_queue"):
+            await self._acquire_llm_slot()
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        tokens = []
+
+        def produce():
+            try:
+                for token in self.rag.stream_response(query, retrieval["context"], retrieval["trace"],
+                                                      retrieval["references"]):
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(events.put_nowait, token)
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        producer = loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                token = await events.get()
+                if token is None:
+                    break
+                tokens.append(token)
+                yield {"type": "token", "text": token}
+        finally:
+            cancelled.set()
+            await producer
+            self._release_llm_slot()
+
+        result = await self._run(self.rag.finish, retrieval, "".join(tokens))
+        yield {"type": "done", "result": result}
+
+    def _collect_stats(self) -> Dict[str, Any]:
+        return {
+            "collection": self.rag.db.get_collection_stats(),
+            "query_cache": self.rag.cache.stats() if self.rag.cache else {"enabled": False},
+            "embedding_cache": self.rag.db.embedding_model.cache_stats(),
+            "query_batching": self.rag.batcher.stats() if self.rag.batcher else {"enabled": False},
+            "server": dict(self.counters, inflight=len(self._inflight), llm_concurrency=self.llm_concurrency)
+        }
+
+    def _render_metrics(self) -> str:
+        gauges = {
+            "rag_server_requests_total": self.counters["requests"],
+            "rag_server_coalesced_total": self.counters["coalesced"],
+            "rag_server_rejected_total": self.counters["rejected"],
+            "rag_server_errors_total": self.counters["errors"],
+            "rag_server_llm_waiting": self.counters["llm_waiting"],
+            "rag_server_llm_active": self.counters["llm_active"],
+            "rag_server_inflight": len(self._inflight)
+        }
+        return metrics.render(gauges)
+
+    # ---- HTTP plumbing ----
+
+    @staticmethod
+    def _parse_query_request(method: str, params: Dict[str, Any], body: bytes):
+        if method == "POST":
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise BadRequest(f"Invalid JSON body: {e}")
+        else:
+            payload = {k: v[0] for k, v in params.items()}
+
+        query = str(payload.get("query", "")).strip()
+        if not query:
+            raise BadRequest("Missing 'query'")
+        try:
+            n_results = int(payload.get("n_results", config.TOP_K_RESULTS))
+        except (TypeError, ValueError):
+            raise BadRequest("'n_results' must be an integer")
+        if n_results < 1:
+            raise BadRequest("'n_results' must be positive")
+        n_results = min(n_results, config.SERVER_MAX_RESULTS)
+
+        # Filters come as a "filters" object, or as top-level fields / query parameters
+        filters = payload.get("filters")
+        if filters is None:
+            filters = {field: payload[field] for field in FILTER_FIELDS if field in payload}
+        if not isinstance(filters, dict):
+            raise BadRequest("'filters' must be an object")
+        try:
+            filters = normalize_filters(filters)
+        except (TypeError, ValueError) as e:
+            raise BadRequest(str(e))
+        return query, n_results, filters
+
+    @staticmethod
+    def _headers(status: int, content_type: str, extra: str = "") -> bytes:
+        return (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Connection: close\r\n{extra}\r\n").encode("latin-1")
+
+    async def _send_json(self, writer, status: int, payload: Any):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        writer.write(self._headers(status, "application/json", f"Content-Length: {len(body)}\r\n") + body)
+        await writer.drain()
+
+    async def _send_text(self, writer, status: int, text: str, content_type: str = "text/plain; version=0.0.4"):
+        body = text.encode("utf-8")
+        writer.write(self._headers(status, content_type, f"Content-Length: {len(body)}\r\n") + body)
+        await writer.drain()
+
+    async def _send_stream(self, writer, events):
+        async def send(event):
+            line = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+            await writer.drain()
+
+        writer.write(self._headers(200, "application/x-ndjson", "Transfer-Encoding: chunked\r\n"))
+        try:
+            async for event in events:
+                await send(event)
+        except ServiceBusy as e:
+            # Headers are already out, so report the failure in-band
+            await send({"type": "error", "error": str(e)})
+        finally:
+            # Release the LLM slot now if the client went away mid-stream, not at garbage collection
+            await events.aclose()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one HTTP/1.1 request per connection"""
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            try:
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            except ValueError:
+                raise BadRequest("Malformed request line")
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                content_length = int(headers.get("content-length") or 0)
+            except ValueError:
+                raise BadRequest("Invalid Content-Length")
+            if content_length < 0:
+                raise BadRequest("Invalid Content-Length")
+            body = await reader.readexactly(content_length)
+
+            url = urlsplit(target)
+            params = parse_qs(url.query)
+            self.counters["requests"] += 1
+
+            if url.path == "/stats" and method == "GET":
+                await self._send_json(writer, 200, await self._run(self._collect_stats))
+            elif url.path == "/metrics" and method == "GET":
+                await self._send_text(writer, 200, self._render_metrics())
+            elif url.path == "/query" and method in ("GET", "POST"):
+                query, n_results, filters = self._parse_query_request(method, params, body)
+                await self._send_json(writer, 200, await self.answer(query, n_results, filters))
+            elif url.path == "/query/stream" and method in ("GET", "POST"):
+                query, n_results, filters = self._parse_query_request(method, params, body)
+                await self._send_stream(writer, self.stream(query, n_results, filters))
+            elif url.path in ("/stats", "/metrics", "/query", "/query/stream"):
+                await self._send_json(writer, 405, {"error": f"{method} not allowed on {url.path}"})
+            else:
+                await self._send_json(writer, 404, {"error": f"Unknown path: {url.path}"})
+
+        except BadRequest as e:
+            await self._send_json(writer, 400, {"error": str(e)})
+        except ServiceBusy as e:
+            await self._send_json(writer, 503, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"Error handling request: {e}")
+            try:
+                await self._send_json(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = config.SERVER_HOST, port: int = config.SERVER_PORT):
+        self._llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"RAG service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(host: str = config.SERVER_HOST, port: int = config.SERVER_PORT):
+    """Load the pipeline once and serve it until interrupted"""
+    service = RAGService()
+    # Pay model loading before the first request rather than during it
+    service.rag.warm_up()
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        print("Shutting down RAG service")
+    finally:
+        service.executor.shutdown(wait=False)
@@ -0,0 +1,583 @@
+import abc
+import heapq
+import json
+import mmap
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.config import config
+from src.filters import FILTER_FIELDS
+
+VECTOR_BACKENDS = ("chroma", "memmap")
+VECTOR_INDEXES = ("flat", "ivf", "hnsw")
+
+# Metadata fields the memmap backend and the quantized store can resolve `where` clauses on
+FACET_FIELDS = FILTER_FIELDS + ("source",)
+
+# Rows scored per block in exhaustive scans, bounding the temporary similarity buffers
+_BLOCK_ROWS = 65536
+
+
+def where_rows(facets: Dict[str, Dict[str, np.ndarray]], where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """Sorted rows matching a `where` clause from src.filters.build_where (None = all rows)"""
+    if not where:
+        return None
+    if "$and" in where:
+        rows = None
+        for clause in where["$and"]:
+            matched = where_rows(facets, clause)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+    (field, condition), = where.items()
+    if field not in FACET_FIELDS:
+        raise ValueError(f"Cannot filter on '{field}' (no facet for it)")
+    values = condition["$in"] if isinstance(condition, dict) else [condition]
+    empty = np.empty(0, dtype=np.int64)
+    matched = [facets.get(field, {}).get(json.dumps(value), empty) for value in values]
+    return np.unique(np.concatenate(matched)) if matched else empty
+
+
+def load_facets(path: str) -> Dict[str, Dict[str, np.ndarray]]:
+    """Read a facets.json written at build time ({field: {json value: rows}})"""
+    with open(path, "r", encoding="utf-8") as f:
+        return {
+            field: {value: np.asarray(rows, dtype=np.int64) for value, rows in values.items()}
+            for field, values in json.load(f).items()
+        }
+
+
+class VectorStore(abc.ABC):
+    """
+    The collection surface ResearchPaperDatabase reads through.
+
+    Results follow Chroma's shapes (`get` returns flat lists, `query` one list per
+    query embedding), so the database code is the same for every backend.
+    """
+
+    name = None
+    # True only for stores that take upserts and deletes; bulk-built ones are rebuilt instead
+    supports_incremental = False
+
+    @abc.abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include=("documents", "metadatas"), limit: Optional[int] = None, offset: Optional[int] = None):
+        ...
+
+    @abc.abstractmethod
+    def query(self, query_embeddings, n_results: int, where: Optional[Dict[str, Any]] = None):
+        ...
+
+    @abc.abstractmethod
+    def reset(self):
+        ...
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class WritableVectorStore(VectorStore):
+    """A store a database writes to directly, at least by rebuilding it in bulk"""
+
+    @abc.abstractmethod
+    def bulk_writer(self):
+        """Writer with add(documents, metadatas, ids, embeddings) and commit(), replacing all contents"""
+
+
+class IncrementalVectorStore(WritableVectorStore):
+    """A writable store that also takes upserts and deletes, so syncs touch only changed chunks"""
+
+    supports_incremental = True
+
+    @abc.abstractmethod
+    def upsert(self, documents, metadatas, ids, embeddings):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, ids: List[str]):
+        ...
+
+
+class ChromaVectorStore(IncrementalVectorStore):
+    """Chroma persistent collection with an HNSW index maintained on every upsert"""
+
+    name = "chroma"
+
+    def __init__(self, path: str, collection_name: str, embedding_function):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.collection = self._get_or_create_collection()
+
+    def _get_or_create_collection(self):
+        """Get existing collection or create a new one"""
+        try:
+            collection = self.client.get_collection(
+                name=self.collection_name,
+                embedding_function=self.embedding_function
+            )
+            print(f"Loaded existing collection: {self.collection_name}")
+        except:
+            collection = self.client.create_collection(
+                name=self.collection_name,
+                embedding_function=self.embedding_function,
+                metadata={"hnsw:space": "cosine"}
+            )
+            print(f"Created new collection: {self.collection_name}")
+
+        return collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        return self.collection.get(ids=ids, where=where, include=list(include), limit=limit, offset=offset)
+
+    def query(self, query_embeddings, n_results: int, where=None):
+        return self.collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=n_results,
+            where=where
+        )
+
+    def upsert(self, documents, metadatas, ids, embeddings):
+        self.collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=list(embeddings))
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def bulk_writer(self):
+        self.reset()
+        return _ChromaWriter(self)
+
+    def reset(self):
+        try:
+            self.client.delete_collection(name=self.collection_name)
+        except Exception:
+            pass
+        self.collection = self._get_or_create_collection()
+
+
+class _ChromaWriter:
+    def __init__(self, store: ChromaVectorStore):
+        self.store = store
+
+    def add(self, documents, metadatas, ids, embeddings):
+        self.store.upsert(documents, metadatas, ids, embeddings)
+
+    def commit(self):
+        pass
+
+
+class MemmapVectorStore(WritableVectorStore):
+    """
+    In-process index built in one bulk pass and memory-mapped on load.
+
+    The directory holds the unit-length float32 matrix (vectors.f32), the documents
+    and metadata as JSON lines with their byte offsets, per-field facets for `where`
+    clauses and, for large corpora, an IVF or HNSW index over the matrix. Opening it
+    only reads the ids and facets; vectors and records are paged in as queries touch them.
+    """
+
+    name = "memmap"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._close()
+        old = directory + ".old"
+        if not os.path.exists(directory) and os.path.exists(os.path.join(old, "meta.json")):
+            # A rebuild crashed between moving the live store aside and swapping in the new one
+            os.replace(old, directory)
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            self._open()
+
+    def _close(self):
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.index = None
+        self.vectors = None
+        self.offsets = None
+        self.facets: Dict[str, Dict[str, np.ndarray]] = {}
+        self.ivf = None
+        self.hnsw = None
+        if getattr(self, "_records", None) is not None:
+            self._records.close()
+        self._records = None
+
+    def _open(self):
+        path = lambda name: os.path.join(self.directory, name)
+        with open(path("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(path("ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.facets = load_facets(path("facets.json"))
+        self.rows = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.index = meta["index"]
+        if not self.ids:
+            return
+
+        self.vectors = np.memmap(path("vectors.f32"), dtype=np.float32, mode="r",
+                                 shape=(len(self.ids), meta["dimension"]))
+        self.offsets = np.load(path("offsets.npy"), mmap_mode="r")
+        with open(path("records.jsonl"), "rb") as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.index == "ivf":
+            self.ivf = (np.load(path("ivf_centroids.npy")), np.load(path("ivf_offsets.npy")),
+                        np.load(path("ivf_rows.npy"), mmap_mode="r"))
+        elif self.index == "hnsw":
+            import hnswlib
+            self.hnsw = hnswlib.Index(space="ip", dim=meta["dimension"])
+            self.hnsw.load_index(path("hnsw.bin"), max_elements=len(self.ids))
+            self.hnsw.set_ef(max(config.HNSW_EF_SEARCH, config.TOP_K_RESULTS))
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _record(self, row: int):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._records[start:end])
+
+    def _where_rows(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        return where_rows(self.facets, where)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        if ids is not None:
+            rows = np.asarray([self.rows[i] for i in ids if i in self.rows], dtype=np.int64)
+            allowed = self._where_rows(where)
+            if allowed is not None:
+                rows = rows[np.isin(rows, allowed)]
+        else:
+            rows = self._where_rows(where)
+            if rows is None:
+                rows = np.arange(len(self.ids), dtype=np.int64)
+        rows = rows[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include or "metadatas" in include:
+            records = [self._record(row) for row in rows]
+            if "documents" in include:
+                result["documents"] = [record["document"] for record in records]
+            if "metadatas" in include:
+                result["metadatas"] = [record["metadata"] for record in records]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.vectors[rows]) if len(rows) else []
+        return result
+
+    def _exact(self, query: np.ndarray, rows: Optional[np.ndarray]):
+        """Similarities of the query to every (allowed) row, scanned in blocks"""
+        n_rows = len(self.ids) if rows is None else len(rows)
+        similarities = np.empty(n_rows, dtype=np.float32)
+        for start in range(0, n_rows, _BLOCK_ROWS):
+            block = slice(start, min(start + _BLOCK_ROWS, n_rows))
+            index = block if rows is None else rows[block]
+            similarities[block] = np.asarray(self.vectors[index]) @ query
+        return np.arange(len(self.ids)) if rows is None else rows, similarities
+
+    def _ivf_candidates(self, query: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+        """
+        Rows of the IVF_PROBES lists nearest the query, scored exactly.
+
+        With a filter, lists keep being probed (nearest first) until at least k allowed
+        rows are found, so a selective filter never comes back short.
+        """
+        centroids, list_offsets, list_rows = self.ivf
+        order = np.argsort(-(centroids @ query))
+        parts, found = [], 0
+        for probed, p in enumerate(order):
+            if probed >= config.IVF_PROBES and found >= k:
+                break
+            part = np.asarray(list_rows[list_offsets[p]:list_offsets[p + 1]])
+            if allowed is not None:
+                part = part[np.isin(part, allowed, assume_unique=True)]
+            parts.append(part)
+            found += len(part)
+        rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        return self._exact(query, rows)
+
+    def _search(self, query: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+        if self.index == "hnsw" and allowed is None:
+            labels, distances = self.hnsw.knn_query(query, k=min(k, len(self.ids)))
+            # Inner-product space: distance is 1 - similarity on unit vectors
+            return [(int(row), float(distance)) for row, distance in zip(labels[0], distances[0])]
+        if self.index == "ivf" and (allowed is None or len(allowed) > config.VECTOR_INDEX_FLAT_MAX):
+            rows, similarities = self._ivf_candidates(query, k, allowed)
+        else:
+            # Flat index, or a filter small enough to scan exactly
+            rows, similarities = self._exact(query, allowed)
+        if not len(rows):
+            return []
+        k = min(k, len(rows))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [(int(rows[i]), float(1.0 - similarities[i])) for i in top]
+
+    def query(self, query_embeddings, n_results: int, where=None):
+        allowed = self._where_rows(where)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            hits = self._search(query, n_results, allowed) if self.ids and n_results > 0 else []
+            records = [self._record(row) for row, _ in hits]
+            results["ids"].append([self.ids[row] for row, _ in hits])
+            results["documents"].append([record["document"] for record in records])
+            results["metadatas"].append([record["metadata"] for record in records])
+            results["distances"].append([distance for _, distance in hits])
+        return results
+
+    def bulk_writer(self):
+        return _MemmapWriter(self)
+
+    def reset(self):
+        self._close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def describe(self) -> Dict[str, Any]:
+        description = {"backend": self.name, "index": self.index}
+        if self.vectors is not None:
+            description["dimension"] = self.vectors.shape[1]
+        return description
+
+
+class _MemmapWriter:
+    """Streams batches into a scratch directory, then builds the index and swaps it in"""
+
+    def __init__(self, store: MemmapVectorStore):
+        self.store = store
+        self.tmp = store.directory + ".tmp"
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.vectors_f = open(os.path.join(self.tmp, "vectors.f32"), "wb")
+        self.records_f = open(os.path.join(self.tmp, "records.jsonl"), "wb")
+        self.ids: List[str] = []
+        self.seen = set()
+        self.offsets = [0]
+        self.facets: Dict[str, Dict[str, List[int]]] = {field: {} for field in FACET_FIELDS}
+        self.dimension = None
+
+    def add(self, documents, metadatas, ids, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        self.dimension = embeddings.shape[1]
+        keep = []
+        for i, (document, metadata, doc_id) in enumerate(zip(documents, metadatas, ids)):
+            if doc_id in self.seen:
+                continue
+            self.seen.add(doc_id)
+            keep.append(i)
+            row = len(self.ids)
+            self.ids.append(doc_id)
+            line = (json.dumps({"document": document, "metadata": metadata}, ensure_ascii=False) + "\n").encode("utf-8")
+            self.records_f.write(line)
+            self.offsets.append(self.offsets[-1] + len(line))
+            for field in FACET_FIELDS:
+                if metadata.get(field) is not None:
+                    self.facets[field].setdefault(json.dumps(metadata[field]), []).append(row)
+        self.vectors_f.write(np.ascontiguousarray(embeddings[keep]).tobytes())
+
+    def commit(self):
+        self.vectors_f.close()
+        self.records_f.close()
+        path = lambda name: os.path.join(self.tmp, name)
+        count, dimension = len(self.ids), self.dimension or 0
+
+        index = config.VECTOR_INDEX
+        if index == "auto":
+            index = "flat" if count <= config.VECTOR_INDEX_FLAT_MAX else "ivf"
+        if index not in VECTOR_INDEXES:
+            raise ValueError(f"Unknown vector index '{index}' (expected auto or one of {', '.join(VECTOR_INDEXES)})")
+
+        if count:
+            vectors = np.memmap(path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, dimension))
+            print(f"Building {index} index over {count} vectors...")
+            if index == "ivf":
+                _build_ivf(vectors, self.tmp)
+            elif index == "hnsw":
+                _build_hnsw(vectors, path("hnsw.bin"))
+            del vectors
+
+        np.save(path("offsets.npy"), np.asarray(self.offsets, dtype=np.int64))
+        with open(path("ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+        with open(path("facets.json"), "w", encoding="utf-8") as f:
+            json.dump(self.facets, f)
+        # Written last: a directory without meta.json is never opened
+        with open(path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"index": index, "count": count, "dimension": dimension}, f)
+
+        # Swap by renames: readers never find the directory missing for longer than one rename,
+        # and a crash in between leaves the old store at .old, which the next open restores
+        directory = self.store.directory
+        old = directory + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        self.store._close()
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        os.replace(self.tmp, directory)
+        self.store._open()
+        shutil.rmtree(old, ignore_errors=True)
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Read-side view over one store per category.
+
+    Queries fan out concurrently to the shards a `category` filter leaves in play
+    and the per-shard top-k lists (already sorted by distance) are heap-merged.
+    It has no write methods: writes go through the shards' own databases, so each
+    category is synced and rebuilt on its own.
+    """
+
+    def __init__(self, shards: Dict[str, VectorStore], workers: int = config.SHARD_WORKERS):
+        self.shards = shards
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="shard-query")
+
+    @property
+    def name(self):
+        backends = {shard.name for shard in self.shards.values()} or {config.VECTOR_BACKEND}
+        return "/".join(sorted(backends))
+
+    @property
+    def supports_incremental(self):
+        return all(shard.supports_incremental for shard in self.shards.values())
+
+    def _route(self, where: Optional[Dict[str, Any]]) -> List[str]:
+        """Shard names a `where` clause can match, in a stable order"""
+        categories = None
+        clauses = where.get("$and", [where]) if where else []
+        for clause in clauses:
+            if "category" in clause:
+                condition = clause["category"]
+                values = set(condition["$in"] if isinstance(condition, dict) else [condition])
+                categories = values if categories is None else categories & values
+        return sorted(name for name in self.shards if categories is None or name in categories)
+
+    def _map(self, fn, names: List[str]):
+        if len(names) <= 1:
+            return [fn(self.shards[name]) for name in names]
+        return list(self._executor.map(lambda name: fn(self.shards[name]), names))
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards.values())
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        keys = ["ids"] + [key for key in ("documents", "metadatas", "embeddings") if key in include]
+        result = {key: [] for key in keys}
+        skip, remaining = offset or 0, limit
+        for name in self._route(where):
+            if remaining is not None and remaining <= 0:
+                break
+            shard = self.shards[name]
+            if skip:
+                if ids is None and where is None:
+                    size = shard.count()
+                else:
+                    size = len(shard.get(ids=ids, where=where, include=[])["ids"])
+                if skip >= size:
+                    # Whole shard falls inside the offset
+                    skip -= size
+                    continue
+            # Page inside the shard, so only the requested rows are read
+            part = shard.get(ids=ids, where=where, include=include, limit=remaining, offset=skip)
+            skip = 0
+            for key in keys:
+                result[key].extend(list(part[key]))
+            if remaining is not None:
+                remaining = limit - len(result["ids"])
+        return result
+
+    def query(self, query_embeddings, n_results: int, where=None):
+        query_embeddings = list(query_embeddings)
+        names = self._route(where)
+        parts = self._map(lambda shard: shard.query(query_embeddings, n_results, where), names)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for i in range(len(query_embeddings)):
+            hits = [
+                zip(part["distances"][i], part["ids"][i], part["documents"][i], part["metadatas"][i])
+                for part in parts
+            ]
+            top = list(islice(heapq.merge(*hits, key=lambda hit: hit[0]), n_results))
+            results["distances"].append([hit[0] for hit in top])
+            results["ids"].append([hit[1] for hit in top])
+            results["documents"].append([hit[2] for hit in top])
+            results["metadatas"].append([hit[3] for hit in top])
+        return results
+
+    def reset(self):
+        for shard in self.shards.values():
+            shard.reset()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "shards": {name: shard.count() for name, shard in sorted(self.shards.items())}
+        }
+
+
+def _build_ivf(vectors: np.ndarray, directory: str, iterations: int = 10, seed: int = 0):
+    """Spherical k-means over a sample, then every row is filed under its nearest centroid"""
+    count = len(vectors)
+    n_lists = max(1, min(count, int(4 * np.sqrt(count))))
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(vectors[np.sort(rng.choice(count, min(count, n_lists * 64), replace=False))])
+
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=n_lists) == 0
+        # Re-seed empty lists from random sample rows
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+    assignment = np.empty(count, dtype=np.int64)
+    for start in range(0, count, _BLOCK_ROWS):
+        end = min(start + _BLOCK_ROWS, count)
+        assignment[start:end] = np.argmax(np.asarray(vectors[start:end]) @ centroids.T, axis=1)
+    rows = np.argsort(assignment, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+
+    np.save(os.path.join(directory, "ivf_centroids.npy"), centroids.astype(np.float32))
+    np.save(os.path.join(directory, "ivf_offsets.npy"), offsets.astype(np.int64))
+    np.save(os.path.join(directory, "ivf_rows.npy"), rows.astype(np.int64))
+
+
+def _build_hnsw(vectors: np.ndarray, path: str):
+    # hnswlib ships with Chroma (chroma-hnswlib)
+    import hnswlib
+
+    index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+    index.init_index(max_elements=len(vectors), ef_construction=config.HNSW_EF_CONSTRUCTION, M=config.HNSW_M)
+    for start in range(0, len(vectors), _BLOCK_ROWS):
+        end = min(start + _BLOCK_ROWS, len(vectors))
+        index.add_items(np.asarray(vectors[start:end]), np.arange(start, end), num_threads=-1)
+    index.save_index(path)
+
+
+def create_vector_store(embedding_function, backend: Optional[str] = None,
+                        name: Optional[str] = None) -> WritableVectorStore:
+    """The backend selected by config.VECTOR_BACKEND for collection `name`"""
+    backend = backend or config.VECTOR_BACKEND
+    name = name or config.COLLECTION_NAME
+    if backend == "chroma":
+        return ChromaVectorStore(config.PERSIST_DIRECTORY, name, embedding_function)
+    if backend == "memmap":
+        store = MemmapVectorStore(os.path.join(config.PERSIST_DIRECTORY, f"{name}_memmap"))
+        print(f"Opened memmap vector store: {name} ({store.count()} chunks)")
+        return store
+    raise ValueError(f"Unknown vector backend '{backend}' (expected one of {', '.join(VECTOR_BACKENDS)})")
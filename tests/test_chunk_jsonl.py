@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def chunker():
+    # The chunker loads its tokenizer at import time
+    try:
+        import chunk_jsonl
+    except Exception as e:
+        pytest.skip(f"chunker tokenizer unavailable: {e}")
+    return chunk_jsonl
+
+
+def _text(topic: str) -> str:
+    sentence = (f"The {topic} provisions require that every habitable room has natural light "
+                f"and ventilation through openings facing an open space. ")
+    return sentence * 12
+
+
+def _line(doc_id: str, topic: str) -> str:
+    return json.dumps({"doc_id": doc_id, "file": f"{doc_id}.pdf", "category": "codes",
+                       "page_number": 1, "text": _text(topic)})
+
+
+def test_chunk_shard_keeps_outcomes_aligned_with_lines(chunker):
+    lines = [_line("first", "stair"), "null", "[1, 2]", "{not json", _line("second", "facade"), "42"]
+    outcomes = chunker.chunk_shard(lines)
+
+    assert len(outcomes) == len(lines)
+    assert {chunk["doc_id"] for chunk in outcomes[0]} == {"first"}
+    assert "JSON object" in outcomes[1] and "NoneType" in outcomes[1]
+    assert "JSON object" in outcomes[2]
+    assert outcomes[3].startswith("JSON decode error")
+    assert {chunk["doc_id"] for chunk in outcomes[4]} == {"second"}
+    assert "JSON object" in outcomes[5]
+
+
+def test_chunk_shard_isolates_a_failing_record(chunker, monkeypatch):
+    real = chunker.chunk_records
+
+    def flaky(recs):
+        if any(rec.get("doc_id") == "bad" for rec in recs):
+            raise RuntimeError("boom")
+        return real(recs)
+
+    monkeypatch.setattr(chunker, "chunk_records", flaky)
+    outcomes = chunker.chunk_shard([_line("good", "stair"), _line("bad", "roof"), _line("also", "wall")])
+
+    assert outcomes[0] and outcomes[2]
+    assert outcomes[1] == "Unexpected error: boom"
+
+
+def test_chunks_keep_source_casing(chunker):
+    text = "Fire Exits in Mumbai High-Rise Buildings must stay unobstructed at all times. " * 10
+    chunks = chunker.chunk_texts_batch([text])[0]
+    assert chunks and "Mumbai" in chunks[0]
+
+
+def test_process_single_file_matches_sequential_when_sharded(chunker, tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setattr(chunker, "OUT_DIR", tmp_path / "out")
+    monkeypatch.setattr(chunker.config, "SHARD_RECORDS", 2)
+    (tmp_path / "out").mkdir()
+    source = tmp_path / "codes.jsonl"
+    topics = ["stair", "roof", "stair", "wall", "lift", "ramp", "roof"]
+    source.write_text("\n".join(_line(f"doc{i}", t) for i, t in enumerate(topics)) + "\nnull\n")
+    out_path = tmp_path / "out" / "codes_chunks.jsonl"
+
+    kept, skipped, ok = chunker.process_single_file(source)
+    sequential = out_path.read_bytes()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert chunker.process_single_file(source, executor=executor) == (kept, skipped, ok)
+    assert out_path.read_bytes() == sequential
+
+    assert ok and skipped == 1
+    # Duplicate texts are kept once
+    assert kept == len(set(topics)) * len(chunker.chunk_texts_batch([_text("stair")])[0])
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("pytesseract")
+import clean_pdfs
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    root, out = tmp_path / "Dataset_PDFs", tmp_path / "cleaned"
+    (root / "codes").mkdir(parents=True)
+    monkeypatch.setattr(clean_pdfs, "ROOT", root)
+    monkeypatch.setattr(clean_pdfs, "OUT", out)
+    monkeypatch.setattr(clean_pdfs, "PARTS_DIR", out / ".parts")
+    monkeypatch.setattr(clean_pdfs, "MANIFEST_PATH", out / "manifest.json")
+    return root
+
+
+def _pdf(path, content=b"%PDF-1.4 identical bytes"):
+    path.write_bytes(content)
+    return path
+
+
+def _records(pdf_path, text):
+    return [clean_pdfs.make_record(pdf_path, "codes", 1, text)]
+
+
+def _read_part(manifest, pdf_path):
+    with open(manifest.part_path(pdf_path), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_identical_pdfs_keep_separate_parts(dataset):
+    first, second = _pdf(dataset / "codes" / "a.pdf"), _pdf(dataset / "codes" / "b.pdf")
+    manifest = clean_pdfs.CleaningManifest(clean_pdfs.MANIFEST_PATH)
+    manifest.record(first, "codes", _records(first, "first text"))
+    manifest.record(second, "codes", _records(second, "second text"))
+
+    assert manifest.part_path(first) != manifest.part_path(second)
+    assert [r["doc_id"] for r in _read_part(manifest, first)] == ["a"]
+    assert [r["doc_id"] for r in _read_part(manifest, second)] == ["b"]
+    assert manifest.is_current(first) and manifest.is_current(second)
+
+
+def test_removed_pdfs_and_orphaned_parts_are_deleted(dataset):
+    kept, removed = _pdf(dataset / "codes" / "a.pdf"), _pdf(dataset / "codes" / "b.pdf", b"%PDF other")
+    manifest = clean_pdfs.CleaningManifest(clean_pdfs.MANIFEST_PATH)
+    manifest.record(kept, "codes", _records(kept, "kept"))
+    manifest.record(removed, "codes", _records(removed, "removed"))
+    removed_part = manifest.part_path(removed)
+    orphan = clean_pdfs.PARTS_DIR / "codes" / "0123456789abcdef0123.jsonl"
+    orphan.write_text("{}\n")
+
+    manifest.forget_missing("codes", [kept])
+    manifest.remove_orphaned_parts()
+
+    assert not removed_part.exists() and not orphan.exists()
+    assert manifest.part_path(kept).exists()
+    assert manifest.categories() == {"codes"}
+
+
+class _FakeExtractor:
+    """iter_pages for documents given as {path: [page texts]}; empty PDFs yield no pages"""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def iter_pages(self, pdfs):
+        for pdf_path in pdfs:
+            for page_num, text in enumerate(self.pages[pdf_path], start=1):
+                yield pdf_path, page_num, text, {"extract_s": 0.0, "ocr": False}
+
+
+def test_zero_page_pdfs_are_reported_as_empty_documents(dataset):
+    empty, full, trailing = (dataset / "codes" / f"{name}.pdf" for name in ("empty", "full", "trailing"))
+    extractor = _FakeExtractor({empty: [], full: ["Stair widths", "Stair widths", "Ramps"], trailing: []})
+
+    documents = list(clean_pdfs.iter_cleaned_documents(extractor, [empty, full, trailing], "codes"))
+
+    assert [(path.name, len(records)) for path, records in documents] == [
+        ("empty.pdf", 0), ("full.pdf", 2), ("trailing.pdf", 0)
+    ]
+
+
+def test_needs_ocr_skips_only_truly_blank_pages():
+    import fitz
+
+    doc = fitz.open()
+    doc.new_page()
+    page = doc.new_page()
+    # Stand-in for text converted to outlines: filled vector paths, no text layer
+    page.draw_rect(fitz.Rect(72, 72, 90, 90), color=(0, 0, 0), fill=(0, 0, 0))
+    page.draw_line(fitz.Point(100, 80), fitz.Point(140, 80))
+    blank, outlined = doc[0], doc[1]
+
+    assert not blank.get_text("text").strip() and not outlined.get_text("text").strip()
+    assert not clean_pdfs.needs_ocr(blank)
+    assert clean_pdfs.needs_ocr(outlined)
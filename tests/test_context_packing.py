@@ -0,0 +1,47 @@
+from src.context_packing import ContextPacker
+
+
+def _packer(budget=1000):
+    packer = ContextPacker(tokenizer_name=None, token_budget=budget, duplicate_threshold=0.8)
+    packer._tokenizer = False  # length-based token estimate
+    return packer
+
+
+WORDS = " ".join(f"word{i}" for i in range(60))
+
+
+def test_overlapping_chunks_of_one_document_merge_and_keep_both_ids():
+    first, second = WORDS[:300], WORDS[250:]
+    packed = _packer().pack(
+        ["an unrelated passage about timber joinery in traditional houses", first, second],
+        [{"source": "a"}, {"source": "b"}, {"source": "b"}]
+    )
+    assert [ids for _, ids in packed] == [[1], [2, 3]]
+    assert packed[1][0] == WORDS
+
+
+def test_chunks_of_different_documents_are_not_merged():
+    packed = _packer().pack([WORDS[:300], WORDS[250:]], [{"source": "a"}, {"source": "b"}])
+    assert [ids for _, ids in packed] == [[1], [2]]
+
+
+def test_adjacent_pages_merge_without_textual_overlap():
+    packed = _packer().pack(
+        ["stairs need handrails on both sides", "landings are required every twelve risers"],
+        [{"doc_id": "d", "page_start": 3, "page_end": 3}, {"doc_id": "d", "page_start": 4, "page_end": 4}]
+    )
+    assert packed == [("stairs need handrails on both sides\nlandings are required every twelve risers", [1, 2])]
+
+
+def test_near_duplicates_are_dropped():
+    text = "ventilation openings shall face an open space of at least three metres " * 3
+    packed = _packer().pack([text, text + " extra"], [{"source": "a"}, {"source": "b"}])
+    assert [ids for _, ids in packed] == [[1]]
+
+
+def test_budget_truncates_the_last_passage_and_stops():
+    passages = [f"{topic} " + "detail " * 400 for topic in ("alpha", "beta", "gamma")]
+    packer = _packer(budget=800)
+    packed = packer.pack(passages, [{"source": s} for s in "abc"])
+    assert [ids for _, ids in packed] == [[1], [2]]
+    assert sum(packer.count_tokens(text) for text, _ in packed) <= 800
@@ -0,0 +1,54 @@
+from dedup_index import DedupIndex
+
+
+def test_exact_duplicates_are_rejected(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.sqlite3", expected_items=100)
+
+    assert index.add_if_new("h1", owner="a.jsonl")
+    assert not index.add_if_new("h1", owner="b.jsonl")
+    assert index.exact_duplicates == 1
+    index.close()
+
+
+def test_near_duplicates_are_rejected(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.sqlite3", expected_items=100, near_duplicates=True,
+                       near_dup_threshold=0.8)
+    text = "Every habitable room shall have a clear height of not less than 2.75 metres. " * 4
+
+    assert index.add_if_new("h1", text)
+    assert not index.add_if_new("h2", text + "!")
+    assert index.add_if_new("h3", "Fire exits shall be signposted and kept clear at all times. " * 4)
+    assert index.near_duplicates == 1
+    index.close()
+
+
+def test_uncommitted_additions_are_discarded(tmp_path):
+    path = tmp_path / "dedup.sqlite3"
+    index = DedupIndex(path, expected_items=100)
+    index.add_if_new("kept")
+    index.commit("a.jsonl", {"records": 1})
+    index.add_if_new("lost")
+    index.rollback()
+    assert index.add_if_new("lost")
+    index.close()
+
+    reopened = DedupIndex(path, expected_items=100)
+    assert len(reopened) == 1
+    assert not reopened.add_if_new("kept")
+    assert reopened.load_checkpoint("a.jsonl") == {"records": 1}
+    reopened.close()
+
+
+def test_forget_drops_an_owners_hashes_and_checkpoint(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.sqlite3", expected_items=100)
+    index.add_if_new("a1", owner="a.jsonl")
+    index.add_if_new("b1", owner="b.jsonl")
+    index.commit("a.jsonl", {"records": 1})
+
+    index.forget("a.jsonl")
+
+    assert index.load_checkpoint("a.jsonl") is None
+    assert index.add_if_new("a1", owner="a.jsonl")
+    assert not index.add_if_new("b1")
+    assert not index.has_checkpoints()
+    index.close()
@@ -0,0 +1,67 @@
+import pytest
+
+from src.embedding_utils import _int8_onnx_suffix
+
+
+def test_int8_onnx_file_names_follow_the_weight_dtype():
+    # Same names the exporter writes by default and the hub ships
+    assert _int8_onnx_suffix("avx2") == "quint8_avx2"
+    assert _int8_onnx_suffix("arm64") == "qint8_arm64"
+    assert _int8_onnx_suffix("avx512_vnni") == "qint8_avx512_vnni"
+    with pytest.raises(ValueError):
+        _int8_onnx_suffix("sse4")
+
+
+def _cache(tmp_path, **kwargs):
+    from src.embedding_utils import EmbeddingCache
+    return EmbeddingCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def _vector(seed):
+    import numpy as np
+    return np.random.default_rng(seed).standard_normal(8).astype(np.float32)
+
+
+def test_cache_round_trips_vectors_per_model(tmp_path):
+    from src.embedding_utils import EmbeddingCache
+    cache = _cache(tmp_path)
+    a, b = EmbeddingCache.digest("a"), EmbeddingCache.digest("b")
+    cache.put_many("m", [(a, _vector(1))])
+
+    found = cache.get_many("m", [a, b, a])
+    assert list(found) == [a]
+    assert (found[a] == _vector(1)).all()
+    assert cache.get_many("other-model", [a]) == {}
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+
+def test_cache_hits_only_write_when_recency_is_stale(tmp_path):
+    from src.embedding_utils import EmbeddingCache
+    cache = _cache(tmp_path, touch_interval=3600)
+    digest = EmbeddingCache.digest("q")
+    cache.put_many("m", [(digest, _vector(2))])
+
+    before = cache.conn.total_changes
+    for _ in range(5):
+        cache.get_many("m", [digest])
+    assert cache.conn.total_changes == before
+
+    cache.conn.execute("UPDATE embeddings SET last_used = 0")
+    before = cache.conn.total_changes
+    cache.get_many("m", [digest])
+    assert cache.conn.total_changes == before + 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    from src.embedding_utils import EmbeddingCache
+    cache = _cache(tmp_path, max_entries=10, touch_interval=0)
+    digests = [EmbeddingCache.digest(str(i)) for i in range(10)]
+    cache.put_many("m", [(d, _vector(i)) for i, d in enumerate(digests)])
+    cache.conn.execute("UPDATE embeddings SET last_used = 0")
+    cache.get_many("m", digests[5:])  # keep the second half recent
+
+    cache.put_many("m", [(EmbeddingCache.digest("new"), _vector(99))])
+    # Evicted down to 90%: two of the stale first half go, the recent half stays
+    remaining = set(cache.get_many("m", digests))
+    assert set(digests[5:]) <= remaining and len(remaining) == 8
+    assert cache.stats()["entries"] == 9
@@ -0,0 +1,30 @@
+import pytest
+
+from src.filters import build_where, extract_year, normalize_filters
+
+
+def test_extract_year_takes_first_plausible_year():
+    assert extract_year("NBC_2016_Vol1") == 2016
+    assert extract_year("IS 875-1987") == 1987
+    assert extract_year("clause 120345", "guide_2005.pdf") == 2005
+    assert extract_year("no year here", None) is None
+
+
+def test_normalize_filters_is_canonical():
+    assert normalize_filters({"category": "codes", "year": ["2016", 2005, 2016]}) == \
+        normalize_filters({"year": [2005, 2016], "category": ["codes"]}) == \
+        {"category": ["codes"], "year": [2005, 2016]}
+    assert normalize_filters({"category": ["", None], "doc_id": []}) == {}
+    assert normalize_filters(None) == {}
+
+
+def test_normalize_filters_rejects_unknown_fields():
+    with pytest.raises(ValueError):
+        normalize_filters({"author": "x"})
+
+
+def test_build_where():
+    assert build_where({}) is None
+    assert build_where({"year": [2016]}) == {"year": 2016}
+    assert build_where({"category": ["a", "b"], "year": [2016]}) == \
+        {"$and": [{"category": {"$in": ["a", "b"]}}, {"year": 2016}]}
@@ -0,0 +1,41 @@
+from src.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+RECORDS = [
+    ("a", "Staircase width shall be at least 1.0 m as per IS 875", {"category": "codes", "year": 2016}),
+    ("b", "Fire exits and staircase enclosures in high rise buildings", {"category": "codes", "year": 2005}),
+    ("c", "Daylighting of reading rooms in libraries", {"category": "guides", "year": 2016}),
+]
+
+
+def test_tokenize_keeps_section_numbers_and_is():
+    assert tokenize("See 4.2.1 of IS 875 for the 3-101-01 rule") == ["see", "4.2.1", "is", "875", "3-101-01", "rule"]
+
+
+def test_search_ranks_matching_documents():
+    index = BM25Index.build(RECORDS)
+
+    hits = index.search("staircase width", k=5)
+    assert [doc_id for doc_id, _ in hits] == ["a", "b"]
+    assert hits[0][1] > hits[1][1]
+    assert index.search("nothing matches", k=5) == []
+
+
+def test_search_honours_filters():
+    index = BM25Index.build(RECORDS)
+
+    assert [doc_id for doc_id, _ in index.search("staircase", filters={"year": [2005]})] == ["b"]
+    assert index.search("staircase", filters={"category": ["guides"]}) == []
+    assert index.search("staircase", filters={"doc_id": ["a"]}) == []  # field was never indexed
+
+
+def test_save_and_load_round_trip(tmp_path):
+    BM25Index.build(RECORDS).save(str(tmp_path))
+
+    assert BM25Index.exists(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert len(loaded) == 3
+    assert loaded.search("reading rooms", filters={"year": [2016]})[0][0] == "c"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]])[0] == "b"
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from src.quantized_store import QuantizedVectorStore, recall_report
+
+
+def _build(directory, quantization, count=200, dimension=32):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((count, dimension)).astype(np.float32)
+    ids = [f"id{i}" for i in range(count)]
+    metadatas = [{"category": "codes" if i % 2 else "guides", "year": 2000 + i % 5} for i in range(count)]
+    batches = [(ids[s:s + 64], embeddings[s:s + 64].copy(), metadatas[s:s + 64]) for s in range(0, count, 64)]
+    store = QuantizedVectorStore.build(str(directory), batches, count, dimension, quantization)
+    return store, embeddings
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_full_rescoring_matches_exact_search(tmp_path, quantization):
+    store, embeddings = _build(tmp_path, quantization)
+
+    hits = store.search(embeddings[7], k=5, rescore_candidates=len(store))
+    assert [doc_id for doc_id, _ in hits] == store.exact_search(embeddings[7], 5)
+    assert hits[0] == ("id7", pytest.approx(0.0, abs=1e-5))
+    assert store.bytes_per_vector < 32 * 4
+
+
+def test_search_honours_where(tmp_path):
+    store, embeddings = _build(tmp_path, "int8")
+
+    hits = store.search(embeddings[7], k=10, rescore_candidates=20,
+                        where={"$and": [{"category": "guides"}, {"year": {"$in": [2000, 2002]}}]})
+    rows = [int(doc_id[2:]) for doc_id, _ in hits]
+    assert len(rows) == 10 and all(row % 2 == 0 and row % 5 in (0, 2) for row in rows)
+    assert store.search(embeddings[7], k=5, rescore_candidates=20, where={"year": 1990}) == []
+
+
+def test_load_and_recall_report(tmp_path):
+    _, embeddings = _build(tmp_path, "int8")
+    store = QuantizedVectorStore.load(str(tmp_path))
+
+    report = recall_report(store, embeddings[:10], k=5, rescore_candidates=[5, len(store)])
+    assert report["vectors"] == 200 and report["compression"] > 3
+    assert report["recall"][str(len(store))] == 1.0
+    assert 0.0 < report["recall"]["5"] <= 1.0
@@ -0,0 +1,54 @@
+import numpy as np
+
+from src.query_cache import QueryCache, normalize_query
+
+
+def _unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_normalize_query_ignores_case_spacing_and_trailing_punctuation():
+    assert normalize_query("  What is   FSI?  ") == normalize_query("what is fsi") == "what is fsi"
+
+
+def test_exact_tier_needs_no_embedding():
+    cache = QueryCache()
+    cache.put("What is FSI?", 5, {"answer": "a"}, _unit(1, 0), generation=1)
+
+    assert cache.get_exact("what is fsi", 5, generation=1) == {"answer": "a"}
+    assert cache.get_exact("what is fsi", 3, generation=1) is None
+    assert cache.get_exact("what is fsi", 5, generation=1, filters={"category": ["codes"]}) is None
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["misses"] == 0
+
+
+def test_semantic_tier_matches_near_duplicate_embeddings_in_scope():
+    cache = QueryCache(similarity_threshold=0.95)
+    cache.put("stair width", 5, {"answer": "a"}, _unit(1, 0.01), generation=1)
+
+    assert cache.get_similar("minimum stair width", 5, _unit(1, 0), generation=1) == {"answer": "a"}
+    assert cache.get_similar("roof slope", 5, _unit(0, 1), generation=1) is None
+    assert cache.get_similar("minimum stair width", 10, _unit(1, 0), generation=1) is None
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1 and stats["misses"] == 2
+
+
+def test_entries_expire_and_a_new_data_version_clears_everything():
+    cache = QueryCache(ttl=0)
+    cache.put("q", 5, {"answer": "a"}, _unit(1, 0), generation=1)
+    assert cache.get("q", 5, _unit(1, 0), generation=1) is None
+
+    cache = QueryCache()
+    cache.put("q", 5, {"answer": "a"}, _unit(1, 0), generation=1)
+    assert cache.get("q", 5, _unit(1, 0), generation=2) is None
+    assert cache.stats()["exact_entries"] == 0
+
+
+def test_exact_tier_is_an_lru():
+    cache = QueryCache(max_entries=2)
+    for query in ("a", "b"):
+        cache.put(query, 5, {"answer": query})
+    cache.get_exact("a", 5)
+    cache.put("c", 5, {"answer": "c"})
+    assert cache.get_exact("b", 5) is None
+    assert cache.get_exact("a", 5) == {"answer": "a"}
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("ollama")
+pytest.importorskip("chromadb")
+from src.config import config
+from src.server import BadRequest, RAGService
+
+
+class _Writer:
+    def __init__(self, fail_after=None):
+        self.data = b""
+        self.writes = 0
+        self.fail_after = fail_after
+
+    def write(self, data):
+        self.writes += 1
+        if self.fail_after is not None and self.writes > self.fail_after:
+            raise ConnectionResetError("client went away")
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _service():
+    return RAGService(rag=object(), max_workers=1)
+
+
+def _serve(raw: bytes) -> str:
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        writer = _Writer()
+        service = _service()
+        await service.handle(reader, writer)
+        return service, writer.data.decode("utf-8")
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("raw", [
+    b"GARBAGE\r\n\r\n",
+    b"POST /query HTTP/1.1\r\nContent-Length: ten\r\n\r\n",
+    b"POST /query HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+])
+def test_malformed_requests_are_400s(raw):
+    service, response = _serve(raw)
+    assert response.startswith("HTTP/1.1 400")
+    assert service.counters["errors"] == 0
+
+
+def test_n_results_is_clamped():
+    body = json.dumps({"query": "stair width", "n_results": 10_000}).encode()
+    _, n_results, _ = RAGService._parse_query_request("POST", {}, body)
+    assert n_results == config.SERVER_MAX_RESULTS
+    with pytest.raises(BadRequest):
+        RAGService._parse_query_request("POST", {}, json.dumps({"query": "q", "n_results": 0}).encode())
+
+
+def test_stream_generator_is_closed_when_the_client_disconnects():
+    closed = []
+
+    async def events():
+        try:
+            for i in range(10):
+                yield {"type": "token", "text": str(i)}
+        finally:
+            closed.append(True)
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await _service()._send_stream(_Writer(fail_after=2), events())
+        # Closed right away, not whenever the event loop finalizes the generator
+        assert closed == [True]
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.config import config
+from src.vector_store import MemmapVectorStore, ShardedVectorStore
+
+
+def _corpus(n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    ids = [f"c{i}" for i in range(n)]
+    metadatas = [{"category": "codes" if i % 2 else "studies", "year": 2000 + i % 5, "source": f"f{i % 3}"}
+                 for i in range(n)]
+    documents = [f"chunk {i}" for i in range(n)]
+    return ids, documents, metadatas, vectors
+
+
+def _build(directory, corpus, batch=64):
+    store = MemmapVectorStore(str(directory))
+    writer = store.bulk_writer()
+    ids, documents, metadatas, vectors = corpus
+    for start in range(0, len(ids), batch):
+        end = start + batch
+        writer.add(documents[start:end], metadatas[start:end], ids[start:end], vectors[start:end])
+    writer.commit()
+    return store
+
+
+def _exact_top(corpus, query, k, keep=lambda metadata: True):
+    ids, _, metadatas, vectors = corpus
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    order = np.argsort(-(unit @ (query / np.linalg.norm(query))))
+    return [ids[i] for i in order if keep(metadatas[i])][:k]
+
+
+@pytest.mark.parametrize("index", ["flat", "ivf"])
+def test_query_matches_exact_search_with_and_without_filters(tmp_path, monkeypatch, index):
+    monkeypatch.setattr(config, "VECTOR_INDEX", index)
+    monkeypatch.setattr(config, "IVF_PROBES", 1000)  # probe everything: IVF must then be exact
+    monkeypatch.setattr(config, "VECTOR_INDEX_FLAT_MAX", 10)
+    corpus = _corpus()
+    store = _build(tmp_path / "store", corpus)
+    query = corpus[3][7] + 0.1
+
+    hits = store.query([query], 5)
+    assert hits["ids"][0] == _exact_top(corpus, query, 5)
+    assert hits["documents"][0][0] == f"chunk {hits['ids'][0][0][1:]}"
+
+    where = {"$and": [{"category": {"$in": ["codes"]}}, {"year": 2003}]}
+    hits = store.query([query], 5, where=where)
+    assert hits["ids"][0] == _exact_top(corpus, query, 5, lambda m: m["category"] == "codes" and m["year"] == 2003)
+
+
+def test_selective_ivf_filter_still_returns_k_hits(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "VECTOR_INDEX", "ivf")
+    monkeypatch.setattr(config, "IVF_PROBES", 1)
+    monkeypatch.setattr(config, "VECTOR_INDEX_FLAT_MAX", 5)
+    ids, documents, metadatas, vectors = _corpus(n=400)
+    for i in range(0, 400, 40):
+        metadatas[i] = dict(metadatas[i], category="rare")
+    store = _build(tmp_path / "store", (ids, documents, metadatas, vectors))
+
+    hits = store.query([vectors[1]], 5, where={"category": "rare"})
+    assert len(hits["ids"][0]) == 5
+    assert {m["category"] for m in hits["metadatas"][0]} == {"rare"}
+
+
+def test_get_pages_filtered_rows(tmp_path):
+    corpus = _corpus()
+    store = _build(tmp_path / "store", corpus)
+    everything = store.get(where={"source": "f1"}, include=[])["ids"]
+    pages = [store.get(where={"source": "f1"}, include=[], limit=7, offset=o)["ids"] for o in range(0, 80, 7)]
+    assert [doc_id for page in pages for doc_id in page] == everything
+    assert everything == [f"c{i}" for i in range(200) if i % 3 == 1]
+
+
+def test_rebuild_swaps_the_directory_in_place(tmp_path):
+    directory = tmp_path / "store"
+    store = _build(directory, _corpus(n=50))
+    _build(directory, _corpus(n=80, seed=1))  # a second writer over the same directory
+
+    reopened = MemmapVectorStore(str(directory))
+    assert reopened.count() == 80
+    assert not os.path.exists(str(directory) + ".old")
+    assert not os.path.exists(str(directory) + ".tmp")
+    assert store.count() == 50  # the first handle still serves its own snapshot
+
+
+def test_a_crash_mid_swap_restores_the_old_store(tmp_path):
+    directory = tmp_path / "store"
+    _build(directory, _corpus(n=50))
+    os.replace(directory, str(directory) + ".old")
+
+    assert MemmapVectorStore(str(directory)).count() == 50
+
+
+def test_sharded_paging_and_routing(tmp_path):
+    ids, documents, metadatas, vectors = _corpus(n=120)
+    shards = {}
+    for category in ("codes", "studies"):
+        rows = [i for i, m in enumerate(metadatas) if m["category"] == category]
+        shards[category] = _build(tmp_path / category, ([ids[i] for i in rows], [documents[i] for i in rows],
+                                                        [metadatas[i] for i in rows], vectors[rows]))
+    sharded = ShardedVectorStore(shards, workers=2)
+
+    everything = sharded.get(include=[])["ids"]
+    assert len(everything) == 120
+    paged = [doc_id for o in range(0, 120, 25) for doc_id in sharded.get(include=[], limit=25, offset=o)["ids"]]
+    assert paged == everything
+
+    merged = sharded.query([vectors[0]], 6)
+    assert merged["ids"][0] == _exact_top((ids, documents, metadatas, vectors), vectors[0], 6)
+    assert merged["distances"][0] == sorted(merged["distances"][0])
+    routed = sharded.query([vectors[0]], 6, where={"category": "codes"})
+    assert {m["category"] for m in routed["metadatas"][0]} == {"codes"}
+
+
+def test_sharded_store_exposes_no_write_methods(tmp_path):
+    sharded = ShardedVectorStore({"codes": _build(tmp_path / "codes", _corpus(n=10))})
+    assert not hasattr(sharded, "upsert") and not hasattr(sharded, "bulk_writer")
+    assert not sharded.supports_incremental